@@ -0,0 +1,3 @@
+from jzb.benchmark.harness import main
+
+main()
@@ -0,0 +1,439 @@
+"""
+In-process stand-ins for JIRA and Zendesk, holding enough behaviour to drive `Bridge.sync` without
+network access. Redis is held in memory by `jzb.memredis.MemoryRedis`
+"""
+import collections
+import copy
+import itertools
+import re
+import threading
+import time
+
+import six
+
+from jzb.clients import TokenBucket
+
+# JIRA workflow of the sample config, as status to transition name to target status
+WORKFLOW = {
+    'New': {'Start Investigation': 'Support Investigating'},
+    'Support Investigating': {'Request Information': 'Waiting Reporter', 'Resolve': 'Resolved'},
+    'Waiting Reporter': {'Start Investigation': 'Support Investigating'},
+    'Waiting Support': {'Start Investigation': 'Support Investigating'},
+}
+
+KEY_IN_PATTERN = re.compile(r'key in \(([^)]*)\)')
+PROJECT_NOT_IN_PATTERN = re.compile(r'project not in \(([^)]*)\)')
+KEYSET_PATTERN = re.compile(r'project != "([^"]*)" OR key > "([^"]*)"')
+UPDATED_PATTERN = re.compile(r'updated >= -(\d+)m')
+EXTERNAL_ID_PATTERN = re.compile(r'external_id:(\S+)')
+
+class Resource(object):
+    """
+    Plain object with attributes, standing in for API client resources
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return 'Resource({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in sorted(self.__dict__.items())))
+
+class Upstream(object):
+    """
+    Simulated latency and rate limit of an upstream, counting the calls made to each endpoint
+    """
+    def __init__(self, name, latency=0.0, rate=None):
+        """
+        :param name: name of the upstream, such as `jira`
+        :param latency: seconds each call takes
+        :param rate: optional calls per second the upstream accepts, excess calls wait
+        """
+        self.name = name
+        self.latency = latency
+        self.bucket = TokenBucket(rate) if rate else None
+        self.calls = collections.Counter()
+        self.throttled = 0.0
+        self.lock = threading.Lock()
+
+    def call(self, endpoint):
+        """
+        :param endpoint: name of the endpoint being called
+        """
+        waited = self.bucket.acquire() if self.bucket else 0.0
+
+        with self.lock:
+            self.calls[endpoint] += 1
+            self.throttled += waited
+
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def total(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.throttled = 0.0
+
+def jira_time(seconds):
+    return '{}.{:03d}+0000'.format(time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)),
+                                   int(seconds * 1000) % 1000)
+
+def issue_number(key):
+    project, number = key.rsplit('-', 1)
+    return project, int(number)
+
+class FakeJira(object):
+    """
+    Implements the parts of `jira.JIRA` used by the bridge
+    """
+    def __init__(self, upstream=None, identity='bridge', workflow=WORKFLOW):
+        self.upstream = upstream or Upstream('jira')
+        self.identity = identity
+        self.workflow = workflow
+        self.issues = collections.OrderedDict()
+        self.ids = itertools.count(10000)
+        self.clock = 0.0
+        self.lock = threading.RLock()
+
+    def add_issue(self, key, comments=0, **fields):
+        """
+        :param key: issue key
+        :param comments: number of comments by the reporter to add
+        :param fields: fields overriding the defaults
+        """
+        now = time.time()
+
+        values = dict(
+            summary='Issue {}'.format(key),
+            description='Description of {}\n'.format(key) * 5,
+            status=Resource(name='New'),
+            assignee=None,
+            priority=Resource(name='Major'),
+            issuetype=Resource(name='Bug'),
+            project=Resource(key=key.rsplit('-', 1)[0]),
+            creator=Resource(name='customer', displayName='Customer'),
+            created=jira_time(now),
+            updated=jira_time(now),
+            comment=Resource(comments=[], total=0),
+        )
+        values.update(fields)
+
+        with self.lock:
+            self.issues[key] = Resource(key=key, fields=Resource(**values))
+
+        for _ in range(comments):
+            self.add_reporter_comment(key)
+
+    def add_reporter_comment(self, key, body='Comment from the reporter'):
+        """
+        Adds a comment as the reporter would, outside the bridge
+        """
+        with self.lock:
+            self.append_comment(key, Resource(name='customer', displayName='Customer'), body)
+
+    def append_comment(self, key, author, body):
+        with self.lock:
+            comment = Resource(id=str(next(self.ids)), author=author, body=body, created=jira_time(time.time()))
+            fields = self.issues[key].fields
+            fields.comment.comments.append(comment)
+            fields.comment.total = len(fields.comment.comments)
+            self.touch(key)
+            return comment
+
+    def touch(self, key):
+        # Every change moves the updated time forward, even within the same millisecond
+        self.clock = max(time.time(), self.clock + 0.001)
+        self.issues[key].fields.updated = jira_time(self.clock)
+
+    def view(self, key, fields=None):
+        """
+        :return: copy of an issue as returned by the API, without comments unless requested
+        """
+        with self.lock:
+            stored = self.issues[key]
+            view = Resource(key=key, fields=copy.copy(stored.fields))
+
+            if fields and 'comment' not in fields.split(','):
+                del view.fields.comment
+            else:
+                view.fields.comment = Resource(comments=list(stored.fields.comment.comments),
+                                               total=stored.fields.comment.total)
+
+        view.update = lambda fields: self.update_issue(key, fields)
+        return view
+
+    def current_user(self):
+        self.upstream.call('current_user')
+        return self.identity
+
+    def search_issues(self, jql, fields=None, startAt=0, maxResults=50, **kwargs):
+        self.upstream.call('search')
+
+        with self.lock:
+            issues = list(self.issues.values())
+
+        match = KEY_IN_PATTERN.search(jql)
+        if match:
+            keys = set(x.strip(' "') for x in match.group(1).split(','))
+            issues = [x for x in issues if x.key in keys]
+
+        match = PROJECT_NOT_IN_PATTERN.search(jql)
+        if match:
+            projects = set(x.strip(' "') for x in match.group(1).split(','))
+            issues = [x for x in issues if issue_number(x.key)[0] not in projects]
+
+        match = KEYSET_PATTERN.search(jql)
+        if match:
+            if kwargs.get('validate_query', True) and match.group(2) not in self.issues:
+                raise ValueError("An issue with key '{}' does not exist for field 'key'".format(match.group(2)))
+
+            project, last_key = match.group(1), issue_number(match.group(2))
+            issues = [x for x in issues if issue_number(x.key)[0] != project or issue_number(x.key) > last_key]
+
+        match = UPDATED_PATTERN.search(jql)
+        if match:
+            since = jira_time(time.time() - int(match.group(1)) * 60)
+            issues = [x for x in issues if x.fields.updated >= since]
+
+        if 'ORDER BY key' in jql:
+            issues.sort(key=lambda x: issue_number(x.key))
+
+        if maxResults:
+            issues = issues[startAt:startAt + maxResults]
+
+        return [self.view(x.key, fields) for x in issues]
+
+    def issue(self, key, fields=None):
+        self.upstream.call('issue')
+        return self.view(key, fields)
+
+    def comments(self, key, start_at=0, max_results=50, order_by=None):
+        self.upstream.call('comments')
+
+        with self.lock:
+            comments = list(self.issues[key].fields.comment.comments)
+
+        if order_by == '-created':
+            comments.reverse()
+
+        return comments[start_at:start_at + max_results]
+
+    def update_issue(self, key, fields):
+        self.upstream.call('update')
+
+        with self.lock:
+            for name, value in six.iteritems(fields):
+                setattr(self.issues[key].fields, name, value)
+            self.touch(key)
+
+    def add_comment(self, issue, body):
+        self.upstream.call('add_comment')
+        return self.append_comment(issue.key, Resource(name=self.identity, displayName='Bridge'), body)
+
+    def assign_issue(self, issue, assignee):
+        self.upstream.call('assign')
+
+        with self.lock:
+            self.issues[issue.key].fields.assignee = Resource(name=assignee)
+            self.touch(issue.key)
+
+    def transitions(self, issue):
+        self.upstream.call('transitions')
+
+        with self.lock:
+            status = self.issues[issue.key].fields.status.name
+
+        return [dict(id=str(i), name=name, to=dict(name=target))
+                for i, (name, target) in enumerate(sorted(six.iteritems(self.workflow.get(status, {}))))]
+
+    def transition_issue(self, issue, transition_id, fields=None):
+        self.upstream.call('transition')
+
+        with self.lock:
+            status = self.issues[issue.key].fields.status.name
+            for i, (name, target) in enumerate(sorted(six.iteritems(self.workflow.get(status, {})))):
+                if str(i) == transition_id:
+                    self.issues[issue.key].fields.status = Resource(name=target)
+                    self.touch(issue.key)
+                    return
+
+        raise ValueError('Transition {} not available from {}'.format(transition_id, status))
+
+class FakeZendesk(object):
+    """
+    Implements the parts of `zendesk.Client` and `jzb.zdapi.ZendeskApi` used by the bridge,
+    backed by the same tickets
+    """
+    def __init__(self, upstream=None, groups=('Support',), ticket_fields=(), ticket_forms=('Default Ticket Form',)):
+        """
+        :param upstream: optional `Upstream` object
+        :param groups: names of the assignable groups
+        :param ticket_fields: names of the active ticket fields
+        :param ticket_forms: names of the ticket forms
+        """
+        self.upstream = upstream or Upstream('zendesk')
+        self.identity = Resource(id=1, name='Bridge')
+
+        self.groups = [Resource(id=i + 1, name=name) for i, name in enumerate(groups)]
+        self.fields = [Resource(id=i + 100, name=name, active=True) for i, name in enumerate(ticket_fields)]
+        self.forms = [Resource(id=i + 200, name=name) for i, name in enumerate(ticket_forms)]
+
+        self.tickets = collections.OrderedDict()
+        self.ids = itertools.count(1000)
+        self.clock = 0.0
+        self.lock = threading.RLock()
+
+    @property
+    def current_user(self):
+        self.upstream.call('current_user')
+        return self.identity
+
+    @property
+    def assignable_groups(self):
+        self.upstream.call('groups')
+        return list(self.groups)
+
+    @property
+    def ticket_fields(self):
+        self.upstream.call('ticket_fields')
+        return list(self.fields)
+
+    @property
+    def ticket_forms(self):
+        self.upstream.call('ticket_forms')
+        return list(self.forms)
+
+    def add_agent_comment(self, ticket_id, body='Comment from an agent', public=True):
+        """
+        Adds a comment as an agent would, outside the bridge
+        """
+        with self.lock:
+            self.append_comment(ticket_id, 2, body, public)
+
+    def set_status(self, ticket_id, status):
+        """
+        Changes the status of a ticket as an agent would, outside the bridge
+        """
+        with self.lock:
+            self.tickets[ticket_id]['status'] = status
+            self.touch(ticket_id)
+
+    def append_comment(self, ticket_id, author_id, body, public=True):
+        with self.lock:
+            comment = Resource(id=next(self.ids), author_id=author_id, public=public, body=body,
+                               author=Resource(name='bridge' if author_id == self.identity.id else 'agent'),
+                               attachments=[], created_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+            self.tickets[ticket_id]['comments'].append(comment)
+            self.touch(ticket_id)
+            return comment
+
+    def touch(self, ticket_id):
+        self.clock = max(time.time(), self.clock + 0.000001)
+        self.tickets[ticket_id]['updated_at'] = '{:.6f}'.format(self.clock)
+
+    def view(self, ticket_id):
+        """
+        :return: copy of a ticket as returned by the API
+        """
+        with self.lock:
+            stored = self.tickets[ticket_id]
+            values = dict((k, v) for k, v in six.iteritems(stored) if k != 'comments')
+            values['tags'] = list(stored['tags'])
+
+        return FakeTicket(self, **values)
+
+    def ticket_comments(self, ticket_id, after_id=None):
+        self.upstream.call('comments')
+
+        with self.lock:
+            comments = list(self.tickets[int(ticket_id)]['comments'])
+
+        return [x for x in comments if after_id is None or x.id > after_id]
+
+    def ticket(self, ticket_id):
+        self.upstream.call('ticket')
+        return self.view(int(ticket_id))
+
+    def show_many_tickets(self, ids):
+        self.upstream.call('show_many')
+
+        with self.lock:
+            known = [int(x) for x in ids if int(x) in self.tickets]
+
+        return dict((x, self.view(x)) for x in known)
+
+    def find_first(self, query, **kwargs):
+        self.upstream.call('search')
+
+        match = EXTERNAL_ID_PATTERN.search(query)
+        with self.lock:
+            matches = [x for x in self.tickets if match and self.tickets[x]['external_id'] == match.group(1)]
+
+        return self.view(matches[-1]) if matches else None
+
+    def create_ticket(self, comment=None, **fields):
+        self.upstream.call('create')
+
+        with self.lock:
+            ticket_id = next(self.ids)
+            self.tickets[ticket_id] = dict(id=ticket_id, status='new', priority='normal', group_id=None,
+                                           tags=[], comments=[], updated_at=None, external_id=None)
+            self.tickets[ticket_id].update(fields)
+
+            if comment:
+                self.append_comment(ticket_id, self.identity.id, comment['body'], comment.get('public', True))
+            self.touch(ticket_id)
+
+        return self.view(ticket_id)
+
+    def update_ticket(self, ticket_id, comment=None, additional_tags=None, remove_tags=None, **fields):
+        self.upstream.call('update')
+
+        with self.lock:
+            stored = self.tickets[ticket_id]
+            stored.update(fields)
+
+            if additional_tags:
+                stored['tags'] = stored['tags'] + [x for x in additional_tags if x not in stored['tags']]
+            if remove_tags:
+                stored['tags'] = [x for x in stored['tags'] if x not in remove_tags]
+            if comment:
+                self.append_comment(ticket_id, self.identity.id, comment['body'], comment.get('public', True))
+
+            self.touch(ticket_id)
+
+        return self.view(ticket_id)
+
+    def incremental_tickets(self, start_time=None, cursor=None):
+        self.upstream.call('incremental')
+
+        with self.lock:
+            tickets = [dict(id=x['id'], external_id=x['external_id']) for x in six.itervalues(self.tickets)
+                       if float(x['updated_at']) > float(cursor or start_time or 0)]
+            newest = max([float(x['updated_at']) for x in six.itervalues(self.tickets)] or [0])
+
+        return dict(tickets=tickets, after_cursor='{:.6f}'.format(newest) if tickets else None, end_of_stream=True)
+
+class FakeTicket(object):
+    """
+    Ticket as returned by the Zendesk API, fetching its comments lazily
+    """
+    def __init__(self, client, **values):
+        self.client = client
+        self.__dict__.update(values)
+
+    @property
+    def comments(self):
+        return self.client.ticket_comments(self.id)
+
+    def update(self, **fields):
+        return self.client.update_ticket(self.id, **fields)
+
+    def add_tags(self, *tags):
+        return self.update(additional_tags=list(tags))
+
+    def remove_tags(self, *tags):
+        return self.update(remove_tags=list(tags))
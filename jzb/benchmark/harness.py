@@ -0,0 +1,232 @@
+from argparse import ArgumentParser
+import copy
+import gc
+import random
+import time
+
+import yaml
+
+from jzb.benchmark.fakes import FakeJira, FakeZendesk, Upstream
+from jzb.bridge import Bridge
+from jzb.memredis import MemoryRedis
+from jzb.util import objectize
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SCENARIOS = ('cold', 'steady', 'churn')
+
+class World(object):
+    """
+    Simulated JIRA, Zendesk and Redis holding a number of issues, and the bridge syncing them
+    """
+    def __init__(self, config, issues=100, comments=5, latency=0.0, rate=None, redis_latency=0.0, seed=0,
+                 project='XXX'):
+        """
+        :param config: dict of configuration, as loaded from YAML
+        :param issues: number of issues in JIRA
+        :param comments: number of comments on each issue
+        :param latency: seconds each API call takes
+        :param rate: optional API calls per second accepted by each upstream
+        :param redis_latency: seconds each Redis round trip takes
+        :param seed: seed of the changes made by `churn`
+        :param project: key of the JIRA project holding the issues, matched by `jira_issue_jql`
+        """
+        config = copy.deepcopy(config)
+        self.project = project
+
+        self.jira = FakeJira(Upstream('jira', latency, rate), identity=config.get('jira_username', 'bridge'))
+        self.zendesk = FakeZendesk(Upstream('zendesk', latency, rate),
+                                   groups=group_names(config),
+                                   ticket_fields=[x['name'] for x in config.get('zd_initial_fields') or []
+                                                  if 'name' in x],
+                                   ticket_forms=[config['zd_ticket_form']])
+        self.redis = MemoryRedis(redis_latency)
+        self.random = random.Random(seed)
+
+        for i in range(issues):
+            self.jira.add_issue('{}-{}'.format(self.project, i + 1), comments=comments,
+                                **{config['jira_reference_field']: None})
+
+        self.bridge = Bridge(self.jira, self.zendesk, self.redis, objectize(config), zd_api=self.zendesk)
+
+    def churn(self, share):
+        """
+        Changes a share of the pairs as their reporters and agents would
+        between passes
+
+        :param share: share of the pairs to change, between 0 and 1
+        :return: number of pairs changed
+        """
+        pairs = [(key, ticket_id) for ticket_id, key in
+                 ((x['id'], x['external_id']) for x in self.zendesk.tickets.values())]
+        changed = self.random.sample(pairs, int(round(len(pairs) * share)))
+
+        for key, ticket_id in changed:
+            choice = self.random.random()
+            if choice < 0.4:
+                self.jira.add_reporter_comment(key)
+            elif choice < 0.8:
+                self.zendesk.add_agent_comment(ticket_id)
+            else:
+                self.zendesk.set_status(ticket_id, 'pending')
+
+        return len(changed)
+
+    def reset_counters(self):
+        self.jira.upstream.reset()
+        self.zendesk.upstream.reset()
+        self.redis.reset_counters()
+
+class Result(object):
+    """
+    Measurements of a single benchmarked pass
+    """
+    def __init__(self, scenario, issues, changed, elapsed, jira_calls, zd_calls, redis_commands, redis_round_trips,
+                 peak_memory, stats):
+        self.scenario = scenario
+        self.issues = issues
+        self.changed = changed
+        self.elapsed = elapsed
+        self.jira_calls = jira_calls
+        self.zd_calls = zd_calls
+        self.redis_commands = redis_commands
+        self.redis_round_trips = redis_round_trips
+        self.peak_memory = peak_memory
+        self.stats = stats
+
+    @property
+    def issues_per_second(self):
+        return self.issues / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def api_calls_per_issue(self):
+        return float(self.jira_calls + self.zd_calls) / self.issues if self.issues else 0.0
+
+    @property
+    def redis_ops_per_issue(self):
+        return float(self.redis_commands) / self.issues if self.issues else 0.0
+
+def group_names(config):
+    """
+    :param config: dict of configuration
+    :return: names of the Zendesk groups referenced by the configuration
+    """
+    names = [config['zd_support_group']]
+    for strategy in config.get('escalation_strategies') or []:
+        if strategy.get('group') and strategy['group'] not in names:
+            names.append(strategy['group'])
+    return names
+
+def measure(world, scenario, changed=0, workers=None):
+    """
+    Runs and measures a single pass of the bridge
+
+    :param world: `World` object
+    :param scenario: name of the scenario
+    :param changed: number of pairs changed before the pass
+    :param workers: number of issues to sync concurrently, defaults to the configuration
+    :return: `Result` object
+    """
+    world.reset_counters()
+    gc.collect()
+
+    if tracemalloc:
+        tracemalloc.start()
+
+    started = time.time()
+    stats = world.bridge.sync(workers=workers)
+    elapsed = time.time() - started
+
+    if tracemalloc:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif resource:
+        # Peak of the whole process, in kilobytes on Linux
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    else:
+        peak_memory = None
+
+    return Result(scenario, stats.synced + stats.failed, changed, elapsed,
+                  world.jira.upstream.total, world.zendesk.upstream.total,
+                  world.redis.commands, world.redis.round_trips, peak_memory, stats)
+
+def run(config, scenarios=SCENARIOS, churn=0.5, workers=None, **kwargs):
+    """
+    Runs the scenarios in order against a single world, so steady state and churn follow the cold
+    pass that created every ticket
+
+    :param config: dict of configuration, as loaded from YAML
+    :param scenarios: names of the scenarios to run
+    :param churn: share of the pairs changed before the churn pass
+    :param workers: number of issues to sync concurrently, defaults to the configuration
+    :param kwargs: passed to `World`
+    :return: list of `Result` objects
+    """
+    world = World(config, **kwargs)
+    results = []
+
+    if scenarios[0] != 'cold':
+        # Later scenarios need the tickets created by a cold pass
+        world.bridge.sync(workers=workers)
+
+    for scenario in scenarios:
+        changed = world.churn(churn) if scenario == 'churn' else 0
+        results.append(measure(world, scenario, changed, workers))
+
+    return results
+
+def format_results(results):
+    """
+    :param results: list of `Result` objects
+    :return: list of lines of a table
+    """
+    lines = ['{:<8} {:>7} {:>8} {:>9} {:>11} {:>9} {:>9} {:>10} {:>9} {:>7}'.format(
+        'scenario', 'issues', 'changed', 'seconds', 'issues/s', 'api/iss', 'jira', 'zendesk', 'redis/iss', 'peak MB')]
+
+    for result in results:
+        lines.append('{:<8} {:>7} {:>8} {:>9.2f} {:>11.1f} {:>9.2f} {:>9} {:>10} {:>9.2f} {:>7}'.format(
+            result.scenario, result.issues, result.changed, result.elapsed, result.issues_per_second,
+            result.api_calls_per_issue, result.jira_calls, result.zd_calls, result.redis_ops_per_issue,
+            '-' if result.peak_memory is None else '{:.1f}'.format(result.peak_memory / 1048576.0)))
+
+    return lines
+
+def main():
+    parser = ArgumentParser(description='Measures the bridge against simulated JIRA, Zendesk and Redis')
+    parser.add_argument('-c', '--config-file', default='config.yml')
+    parser.add_argument('-n', '--issues', type=int, default=100)
+    parser.add_argument('-m', '--comments', type=int, default=5,
+                        help='Number of comments on each issue')
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS,
+                        help='Scenario to run, can be repeated, defaults to all of them')
+    parser.add_argument('--churn', type=float, default=0.5,
+                        help='Share of the pairs changed before the churn pass')
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Seconds each API call takes')
+    parser.add_argument('-r', '--rate', type=float,
+                        help='API calls per second accepted by each upstream')
+    parser.add_argument('--redis-latency', type=float, default=0.0,
+                        help='Seconds each Redis round trip takes')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of issues to sync concurrently')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    with open(args.config_file) as fp:
+        config = yaml.safe_load(fp)
+
+    results = run(config, scenarios=args.scenario or SCENARIOS, churn=args.churn, workers=args.workers,
+                  issues=args.issues, comments=args.comments, latency=args.latency, rate=args.rate,
+                  redis_latency=args.redis_latency, seed=args.seed)
+
+    for line in format_results(results):
+        print(line)
@@ -1,28 +1,81 @@
+import functools
+import hashlib
+import json
+import math
 import re
+import threading
+import time
 
-import jinja2
+import six
 
 from jzb import LOG
-from jzb.util import import_class
+from jzb.lease import LeaseManager, in_partition
+from jzb.metadata import MetadataRegistry
+from jzb.metrics import METRICS
+from jzb.pool import KeyLocks, Prefetcher, WorkerPool
+from jzb.state import StateStore
+from jzb.templates import build_environment, strip_signature
+from jzb.transitions import TransitionCache
+from jzb.util import chunked, import_class, objectize, parse_jira_time, split_order_by
+from jzb.zdapi import ZendeskApi
 
 ACTION_HANDLER_FORMAT = 'handle_{}'
 
+# JIRA fields read by the sync steps themselves
+ISSUE_FIELDS = ('assignee', 'status', 'priority', 'updated', 'issuetype', 'project')
+
+# Templates rendered with the JIRA issue, scanned for the fields they use
+ISSUE_TEMPLATE_KEYS = (
+    'zd_ticket_query_format',
+    'zd_subject_format',
+    'zd_initial_comment_format',
+    'zd_followup_comment_format',
+)
+
+TEMPLATE_FIELD_PATTERN = re.compile(r'issue\.fields\.(\w+)')
+
+# Config keys that affect how a pair is synced, a change to any of them invalidates pair fingerprints
+FINGERPRINT_CONFIG_KEYS = (
+    'jira_solved_statuses',
+    'jira_priority_map',
+    'jira_fallback_priority',
+    'jira_reference_field',
+    'escalation_strategies',
+    'zd_support_group',
+    'jira_status_actions',
+    'zd_status_actions',
+    'zd_comment_format',
+    'jira_comment_format',
+    'zd_signature_delimeter',
+)
+
 class Bridge(object):
-    def __init__(self, jira_client, zd_client, redis, config):
+    def __init__(self, jira_client, zd_client, redis, config, zd_api=None):
         """
         :param jira_client: `jira.JIRA` object
         :param zd_client: `zendesk.Client` object
         :param redis: `redis.StrictRedis` object
         :param config: object
+        :param zd_api: optional `jzb.zdapi.ZendeskApi` object, created from config when not given
         """
         self.jira_client = jira_client
         self.zd_client = zd_client
         self.redis = redis
 
+        if zd_api is None:
+            zd_api = ZendeskApi(config.zd_url, config.zd_username, config.zd_password)
+        self.zd_api = zd_api
+
         self.config = config
 
+        # Hashed before status action definitions are parsed, as parsing modifies them
+        self.config_hash = hash_config(config, FINGERPRINT_CONFIG_KEYS)
+
         self.jira_issue_jql = config.jira_issue_jql
-        self.zd_ticket_query_format = jinja2.Template(config.zd_ticket_query_format)
+
+        self.incremental_sync = getattr(config, 'incremental_sync', False)
+        self.incremental_skew = getattr(config, 'incremental_skew', 300)
+        self.full_sync_interval = getattr(config, 'full_sync_interval', 3600)
 
         self.jira_solved_statuses = config.jira_solved_statuses
 
@@ -31,23 +84,81 @@ class Bridge(object):
 
         self.jira_reference_field = config.jira_reference_field
 
-        self.zd_subject_format = jinja2.Template(config.zd_subject_format)
-        self.zd_initial_comment_format = jinja2.Template(config.zd_initial_comment_format)
-        self.zd_followup_comment_format = jinja2.Template(config.zd_followup_comment_format)
-        self.zd_comment_format = jinja2.Template(config.zd_comment_format)
-        self.jira_comment_format = jinja2.Template(config.jira_comment_format)
         self.zd_signature_delimeter = config.zd_signature_delimeter
         self.jira_url = config.jira_url
 
-        self.zd_identity = zd_client.current_user
-        self.jira_identity = jira_client.current_user()
+        # Every template shares one environment, which compiles each of them once
+        self.templates = build_environment(config, redis)
+        self.zd_ticket_query_format = self.templates.get_template('zd_ticket_query_format')
+        self.zd_subject_format = self.templates.get_template('zd_subject_format')
+        self.zd_initial_comment_format = self.templates.get_template('zd_initial_comment_format')
+        self.zd_followup_comment_format = self.templates.get_template('zd_followup_comment_format')
+        self.zd_comment_format = self.templates.get_template('zd_comment_format')
+        self.jira_comment_format = self.templates.get_template('jira_comment_format')
+
+        self.workers = getattr(config, 'workers', 1)
+
+        self.incremental_comments = getattr(config, 'incremental_comments', False)
+        self.comment_page_size = getattr(config, 'comment_page_size', 20)
+
+        self.issue_fields = self.build_issue_fields(config)
+        self.jira_page_size = getattr(config, 'jira_page_size', 50)
+        self.jira_prefetch_pages = getattr(config, 'jira_prefetch_pages', 1)
+
+        self.legacy_comment_sets = getattr(config, 'legacy_comment_sets', True)
+        self.comment_watermark_ttl = getattr(config, 'comment_watermark_ttl', 2592000)
+
+        self.state = StateStore(redis, legacy_comment_sets=self.legacy_comment_sets)
+        self.state_page_size = getattr(config, 'state_page_size', 50)
+        self.zd_prefetch_tickets = getattr(config, 'zd_prefetch_tickets', True)
+        self.refresh_after_writes = getattr(config, 'refresh_after_writes', True)
+
+        self.pair_fingerprints = getattr(config, 'pair_fingerprints', False)
+
+        # Set to sync every pair, even those whose fingerprint is unchanged
+        self.force_sync = False
+
+        # Set to a `jzb.profiling.SyncProfiler` object to profile each pair
+        self.profiler = None
+
+        self.transition_cache = TransitionCache(
+            redis if getattr(config, 'transition_cache_shared', False) else None,
+            ttl=getattr(config, 'transition_cache_ttl', 3600))
+
+        # Guards against the same issue being synced by a pass and a webhook worker at once
+        self.issue_locks = KeyLocks()
+
+        # Guards against the same issue being synced by several nodes at once
+        self.leases = None
+        if getattr(config, 'leases', False):
+            self.leases = LeaseManager(redis, ttl=getattr(config, 'lease_ttl', 60))
 
-        self.assignable_groups = list(zd_client.assignable_groups)
+        # Nodes running full passes can split the issues between them by key
+        self.partition_index = getattr(config, 'partition_index', 0)
+        self.partition_count = getattr(config, 'partition_count', 1)
 
-        self.zd_initial_fields = TicketFieldMapper(list(zd_client.ticket_fields)).map_fields(config.zd_initial_fields)
+        # Set to stop a pass between issues, such as on SIGTERM
+        self.stop_requested = threading.Event()
+
+        self.metadata = MetadataRegistry(
+            jira_client, zd_client, redis,
+            location=getattr(config, 'metadata_cache', 'redis'),
+            ttl=getattr(config, 'metadata_ttl', 3600),
+            miss_interval=getattr(config, 'metadata_miss_interval', 60),
+            scope='{}|{}|{}|{}'.format(config.jira_url, config.jira_username, config.zd_url, config.zd_username))
+        self.metadata.load()
+
+        self.zd_identity = self.metadata.zd_identity
+        self.jira_identity = self.metadata.jira_identity
+
+        self.zd_initial_fields = TicketFieldMapper(self.metadata.ticket_fields).map_fields(config.zd_initial_fields)
 
         self.zd_support_group = self.find_group_by_name(config.zd_support_group)
 
+        self.max_action_iterations = getattr(config, 'max_action_iterations', 10)
+        if self.max_action_iterations < 1:
+            raise ValueError('max_action_iterations must be at least 1, got: {}'.format(self.max_action_iterations))
+
         self.jira_status_actions = self.parse_status_action_defs(config.jira_status_actions)
         self.zd_status_actions = self.parse_status_action_defs(config.zd_status_actions)
 
@@ -55,6 +166,32 @@ class Bridge(object):
 
         self.ticket_form = self.find_ticket_form_by_name(config.zd_ticket_form)
 
+    def build_issue_fields(self, config):
+        """
+        Works out the JIRA fields to request for each issue: those used by the bridge, the reference
+        field, those used by issue templates and any listed by the `jira_fields` config key
+
+        :param config: object
+        :return: comma separated list of field names
+        """
+        fields = list(ISSUE_FIELDS)
+
+        if config.jira_reference_field:
+            fields.append(config.jira_reference_field)
+
+        for key in ISSUE_TEMPLATE_KEYS:
+            fields.extend(TEMPLATE_FIELD_PATTERN.findall(getattr(config, key)))
+
+        fields.extend(getattr(config, 'jira_fields', None) or [])
+
+        # Comments are fetched separately, and only when changed, with incremental comments
+        if self.incremental_comments:
+            fields = [x for x in fields if x != 'comment']
+        else:
+            fields.append('comment')
+
+        return ','.join(sorted(set(fields)))
+
     def parse_escalation_strategy_defs(self, strategy_defs):
         """
         Parses a list of escalation strategy definitions
@@ -81,7 +218,7 @@ class Bridge(object):
         Parses a list of status action definitions
 
         :param action_defs: list of dicts
-        :return: list of `ActionDefinition` objects
+        :return: `StatusActionTable` object
         """
         results = []
 
@@ -90,7 +227,8 @@ class Bridge(object):
 
             for action in action_def['actions']:
                 # pop is used so remaining dict entries can be passed directly to action
-                handler_name = ACTION_HANDLER_FORMAT.format(action.pop('type'))
+                action_type = action.pop('type')
+                handler_name = ACTION_HANDLER_FORMAT.format(action_type)
                 description = action.pop('description')
                 only_once = action.pop('only_once', False)
 
@@ -99,35 +237,483 @@ class Bridge(object):
                     description=description,
                     params=action,
                     only_once=only_once,
+                    action_type=action_type,
                 ))
 
             results.append(ActionDefinition(
-                jira_status=action_def['jira_status'],
-                zd_status=action_def['zd_status'],
+                jira_status=frozenset(action_def['jira_status']),
+                zd_status=frozenset(action_def['zd_status']),
                 actions=actions,
                 description=action_def['description'],
                 force=action_def.get('force', False),
             ))
 
-        return results
+        table = StatusActionTable(results)
+        table.check()
 
-    def sync(self):
+        return table
+
+    def sync(self, workers=None, full=False):
         """
         Attempts to sync issues matching the configures JQL query
+
+        :param workers: number of issues to sync concurrently, defaults to the `workers` config key
+        :param full: True to force a full pass when incremental sync is enabled
+        :return: `SyncStats` object
+        """
+        stats = self.begin_pass(full)
+
+        self.sync_issues(self.search_issues(since=stats.since), stats, workers)
+        self.finish_pass(stats)
+
+        return stats
+
+    def migrate_comment_watermarks(self):
+        """
+        Seeds the comment watermarks of every tracked pair from the legacy global seen comment
+        sets, then deletes the sets
+
+        Pairs are found from the ticket mappings in Redis rather than the configured JQL query, so
+        pairs that are out of scope now, such as resolved issues, keep their history if they return.
+
+        :return: number of pairs migrated
+        """
+        migrated = 0
+
+        for ctx in self.prepare_contexts(self.search_issues_by_key(self.tracked_issue_keys(), scoped=False)):
+            ticket_id = ctx.state.get('zd_ticket:{}'.format(ctx.issue.key))
+            if not ticket_id:
+                continue
+
+            self.seed_comment_watermark(ctx, 'jira_comment_watermark:{}'.format(ctx.issue.key),
+                                        'seen_jira_comments', self.load_jira_comments(ctx))
+
+            ticket = ctx.prefetched_ticket or self.zd_client.ticket(ticket_id)
+            self.seed_comment_watermark(ctx, 'zd_comment_watermark:{}'.format(ticket.id),
+                                        'seen_zd_comments', ticket.comments)
+
+            ctx.state.flush()
+            migrated += 1
+
+        self.redis.delete('seen_jira_comments', 'seen_zd_comments')
+
+        LOG.info('Migrated comment watermarks for %d pairs', migrated)
+        return migrated
+
+    def tracked_issue_keys(self):
+        """
+        :return: list of keys of every JIRA issue mapped to a Zendesk ticket
+        """
+        prefix = 'zd_ticket:'
+
+        keys = []
+        for name in self.redis.scan_iter(match=prefix + '*', count=1000):
+            if isinstance(name, six.binary_type):
+                name = name.decode('utf-8')
+            keys.append(name[len(prefix):])
+
+        return keys
+
+    def seed_comment_watermark(self, ctx, key, legacy_name, comments):
+        """
+        :param ctx: `SyncContext` object
+        :param key: key of the watermark
+        :param legacy_name: name of the legacy seen comment set
+        :param comments: comments on the issue or ticket
+        """
+        if ctx.state.get(key) is not None:
+            return
+
+        comment_ids = [comment.id for comment in comments]
+        ctx.state.prefetch_members(legacy_name, comment_ids)
+
+        seen_ids = [x for x in comment_ids if ctx.state.sismember(legacy_name, x)]
+        if seen_ids:
+            ctx.state.set(key, max(seen_ids, key=int))
+
+    def sync_keys(self, keys, workers=None):
+        """
+        Syncs only the given issues, provided they still match the configured JQL query
+
+        :param keys: iterable of JIRA issue keys
+        :param workers: number of issues to sync concurrently, defaults to the `workers` config key
+        :return: `SyncStats` object
         """
-        LOG.debug('Querying JIRA: %s', self.jira_issue_jql)
-        for issue in self.jira_client.search_issues(self.jira_issue_jql,
-                                                    fields='assignee,attachment,comment,*navigable'):
+        stats = SyncStats(self.state)
+
+        self.sync_issues(self.search_issues_by_key(keys), stats, workers)
+        stats.finish()
+
+        return stats
+
+    def sync_issues(self, issues, stats, workers=None):
+        """
+        Syncs each of the given issues, either serially or with a pool of workers
+
+        :param issues: iterable of `jira.resources.Issue` objects
+        :param stats: `SyncStats` object
+        :param workers: number of issues to sync concurrently, defaults to the `workers` config key
+        """
+        workers = workers or self.workers
+        contexts = self.prepare_contexts(issues)
+
+        if workers > 1:
+            self.sync_concurrently(contexts, workers, stats)
+        else:
             try:
-                LOG.debug('Syncing JIRA issue: %s', issue.key)
-                self.sync_issue(SyncContext(issue))
+                for ctx in contexts:
+                    if self.stop_requested.is_set():
+                        LOG.info('Stopping pass as requested')
+                        stats.interrupted = True
+                        break
+
+                    self.sync_one(ctx, stats)
             except KeyboardInterrupt:
                 LOG.error('Exiting due to CTRL+C')
+                stats.interrupted = True
+
+    def begin_pass(self, full=False):
+        """
+        Decides whether the next pass is full or incremental
+
+        :param full: True to force a full pass
+        :return: `SyncStats` object for the pass
+        """
+        self.metadata.refresh_if_stale()
+
+        stats = SyncStats(self.state)
+
+        if self.incremental_sync and not full:
+            stats.since = self.get_watermark()
+
+            last_full_sync = self.redis.get(self.sync_key('last_full_sync'))
+            if not last_full_sync or float(last_full_sync) + self.full_sync_interval <= stats.started:
+                LOG.info('Full reconciliation pass is due')
+                stats.since = None
+
+        if stats.since is None:
+            LOG.debug('Starting full sync pass')
+        else:
+            LOG.debug('Starting incremental sync pass')
+
+        return stats
+
+    def finish_pass(self, stats):
+        """
+        Records the outcome of a pass, advancing the incremental sync watermark when it completed
+
+        :param stats: `SyncStats` object
+        """
+        stats.finish()
+
+        if not self.incremental_sync or stats.interrupted:
+            return
+
+        # Failed issues must be picked up again by the next incremental pass
+        watermark = stats.oldest_failed_updated
+        if watermark is None:
+            watermark = stats.newest_updated
+
+        if watermark is not None:
+            LOG.debug('Advancing sync watermark to %s', watermark)
+            self.redis.set(self.sync_key('sync_watermark'), watermark)
+
+        if stats.since is None:
+            self.redis.set(self.sync_key('last_full_sync'), stats.started)
+
+    def get_watermark(self):
+        """
+        :return: newest `updated` time seen by a previous pass in seconds since the epoch, or None
+        """
+        watermark = self.redis.get(self.sync_key('sync_watermark'))
+        if watermark:
+            return float(watermark)
+
+    def sync_key(self, name):
+        """
+        Builds a Redis key scoped to the configured JQL query, so changing the query resets it
+
+        :param name: name of the key
+        :return: Redis key
+        """
+        digest = hashlib.sha1(self.jira_issue_jql.encode('utf-8')).hexdigest()[:12]
+        if self.partition_count > 1:
+            return '{}:{}:{}of{}'.format(name, digest, self.partition_index, self.partition_count)
+        return '{}:{}'.format(name, digest)
+
+    def in_partition(self, key):
+        """
+        :param key: JIRA issue key
+        :return: True if the issue belongs to the partition synced by this node
+        """
+        return in_partition(key, self.partition_index, self.partition_count)
+
+    def search_issues(self, since=None):
+        """
+        Queries JIRA for issues matching the configured JQL query
+
+        :param since: optional time in seconds since the epoch, only issues updated after it
+                      (less the configured skew) are returned
+        :return: generator of `jira.resources.Issue` objects, ordered by key
+        """
+        query, _ = split_order_by(self.jira_issue_jql)
+
+        if since is not None:
+            # Relative dates are evaluated by JIRA, which avoids time zone mismatches
+            minutes = int(math.ceil((time.time() - since + self.incremental_skew) / 60.0))
+            query = '({}) AND updated >= -{}m'.format(query, max(minutes, 1))
+
+        pages = self.search_pages(query)
+        if self.jira_prefetch_pages:
+            # The next pages are fetched while the current one is being synced
+            pages = Prefetcher(pages, self.jira_prefetch_pages)
+
+        for page in pages:
+            for issue in page:
+                if self.in_partition(issue.key):
+                    yield issue
+
+    def search_pages(self, query):
+        """
+        Pages through the issues matching a JQL query in key order, continuing each page after the
+        last key seen rather than at an offset. Issues entering or leaving the results while the
+        scan runs therefore never cause others to be skipped or returned twice.
+
+        If the issue a page continues after is deleted or moved during the scan, JIRA rejects the key
+        in the query. The page then continues after the closest earlier key of the previous page
+        instead, leaving out the issues already returned.
+
+        :param query: JQL query without an ORDER BY clause
+        :return: generator of lists of `jira.resources.Issue` objects
+        """
+        # Projects whose issues have all been returned
+        finished = []
+        last_key = None
+        # Earlier keys of the previous page to continue after, should the last one be rejected
+        fallback_keys = []
+
+        while True:
+            cursor = last_key
+
+            while True:
+                jql = '({})'.format(query)
+
+                if finished:
+                    jql += ' AND project not in ({})'.format(', '.join('"{}"'.format(x) for x in finished))
+                if cursor:
+                    jql += ' AND (project != "{}" OR key > "{}")'.format(project_key(cursor), cursor)
+
+                jql += ' ORDER BY key ASC'
+
+                LOG.debug('Querying JIRA: %s', jql)
+                try:
+                    page = list(self.jira_client.search_issues(jql, fields=self.issue_fields,
+                                                               maxResults=self.jira_page_size))
+                    break
+                except Exception:
+                    if not fallback_keys:
+                        raise
+
+                    LOG.warning('JIRA rejected the query continuing after %s, retrying after %s',
+                                cursor, fallback_keys[-1])
+                    cursor = fallback_keys.pop()
+
+            size = len(page)
+            if cursor != last_key:
+                page = [x for x in page if is_past_key(x.key, last_key)]
+
+            if page:
+                yield page
+
+            if size < self.jira_page_size:
                 return
-            except:
-                LOG.exception('Failed to sync issue: %s', issue.key)
 
-        LOG.debug('Sync finished')
+            # Every project seen so far is finished except the one the next page continues in
+            projects = [project_key(x.key) for x in page]
+            if last_key:
+                projects.append(project_key(last_key))
+
+            fallback_keys = [x.key for x in page[:-1]]
+            last_key = page[-1].key
+
+            for project in projects:
+                if project != project_key(last_key) and project not in finished:
+                    finished.append(project)
+
+    def search_issues_by_key(self, keys, scoped=True):
+        """
+        Queries JIRA for the given issues, limited to those matching the configured JQL query
+
+        :param keys: iterable of JIRA issue keys
+        :param scoped: False to return the issues even when they no longer match the JQL query
+        :return: generator of `jira.resources.Issue` objects
+        """
+        query, order_by = split_order_by(self.jira_issue_jql)
+
+        for chunk in chunked(sorted(set(keys)), self.state_page_size):
+            jql = 'key in ({})'.format(', '.join('"{}"'.format(x) for x in chunk))
+            if scoped:
+                jql = '({}) AND {}{}'.format(query, jql, order_by)
+
+            LOG.debug('Querying JIRA: %s', jql)
+            # Without validation, keys of deleted or moved issues are ignored instead of failing the query
+            for issue in self.jira_client.search_issues(jql, fields=self.issue_fields, maxResults=len(chunk),
+                                                        validate_query=False):
+                yield issue
+
+    def prepare_contexts(self, issues):
+        """
+        Groups issues into pages and prefetches the sync state and tracked tickets for each page
+        in a single batch
+
+        :param issues: iterable of `jira.resources.Issue` objects
+        :return: generator of `SyncContext` objects
+        """
+        for page in chunked(issues, self.state_page_size):
+            # Taken before prefetching, so a sync of the same issue that finishes afterwards is noticed
+            generations = [self.issue_locks.generation(issue.key) for issue in page]
+
+            page_state = self.state.prefetch(page)
+            tickets = self.prefetch_tickets(page, page_state)
+
+            for issue, generation in zip(page, generations):
+                yield SyncContext(issue,
+                                  state=self.state.view(page_state),
+                                  prefetched_ticket=tickets.get(page_state.ticket_id(issue.key)),
+                                  generation=generation)
+
+    def prefetch_tickets(self, issues, page_state):
+        """
+        Fetches the tickets already mapped to a page of issues using Zendesk's show_many endpoint
+
+        :param issues: list of `jira.resources.Issue` objects
+        :param page_state: `jzb.state.PageState` object
+        :return: dict of ticket id to ticket objects
+        """
+        if not self.zd_prefetch_tickets:
+            return {}
+
+        ticket_ids = [page_state.ticket_id(issue.key) for issue in issues]
+        ticket_ids = [x for x in ticket_ids if x]
+        if not ticket_ids:
+            return {}
+
+        LOG.debug('Prefetching %d Zendesk tickets', len(ticket_ids))
+        return self.zd_api.show_many_tickets(ticket_ids)
+
+    def sync_concurrently(self, contexts, workers, stats):
+        """
+        Syncs issues using a bounded pool of worker threads
+
+        An issue key is never synced by two workers at once.
+
+        :param contexts: iterable of `SyncContext` objects
+        :param workers: number of worker threads
+        :param stats: `SyncStats` object
+        """
+        LOG.debug('Syncing with %d workers', workers)
+
+        pool = WorkerPool(lambda ctx: self.sync_one(ctx, stats), workers)
+        pool.start()
+
+        try:
+            for ctx in contexts:
+                if self.stop_requested.is_set():
+                    LOG.info('Stopping pass as requested, waiting for in-flight issues')
+                    stats.interrupted = True
+                    return
+
+                pool.submit(ctx.issue.key, ctx)
+
+            pool.join()
+        except KeyboardInterrupt:
+            LOG.error('Exiting due to CTRL+C, waiting for in-flight issues')
+            stats.interrupted = True
+        finally:
+            # Also reached when fetching the next page fails, which would otherwise leak the workers
+            pool.stop()
+
+    def sync_one(self, ctx, stats):
+        """
+        Syncs a single issue, logging any failure instead of raising it
+
+        :param ctx: `SyncContext` object
+        :param stats: `SyncStats` object
+        """
+        try:
+            with self.issue_locks.hold(ctx.issue.key):
+                if not self.acquire_lease(ctx):
+                    return
+
+                if ctx.lease is not None or ctx.generation != self.issue_locks.generation(ctx.issue.key):
+                    # Another thread or node may have synced the pair since its page was prefetched
+                    self.reload_pair(ctx)
+
+                try:
+                    LOG.debug('Syncing JIRA issue: %s', ctx.issue.key)
+                    self.sync_issue(ctx)
+                finally:
+                    self.release_lease(ctx)
+        except KeyboardInterrupt:
+            raise
+        except:
+            LOG.exception('Failed to sync issue: %s', ctx.issue.key)
+            stats.record(False, ctx.issue, ctx.changed)
+        else:
+            stats.record(not ctx.failed, ctx.issue, ctx.changed)
+
+    def acquire_lease(self, ctx):
+        """
+        Leases the pair to this node, when several nodes share the same Redis
+
+        :param ctx: `SyncContext` object
+        :return: False if another node holds the lease on the pair
+        """
+        if self.leases is None:
+            return True
+
+        ctx.lease = self.leases.acquire(ctx.issue.key)
+        if ctx.lease is None:
+            LOG.debug('Skipping issue leased by another node: %s', ctx.issue.key)
+            return False
+
+        return True
+
+    def reload_pair(self, ctx):
+        """
+        Reads the state and ticket of a pair again, in place of those prefetched with its page
+
+        :param ctx: `SyncContext` object
+        """
+        ctx.state = self.state.view(self.state.prefetch([ctx.issue]))
+        ctx.prefetched_ticket = None
+
+    def check_lease(self, ctx):
+        """
+        Raises `LeaseLost` if this node may no longer hold the lease on the pair, renewing it when due
+
+        :param ctx: `SyncContext` object
+        """
+        if ctx.lease:
+            self.leases.check(ctx.lease)
+
+    def release_lease(self, ctx):
+        """
+        :param ctx: `SyncContext` object
+        """
+        if ctx.lease:
+            self.leases.release(ctx.lease)
+
+    def flush_state(self, ctx):
+        """
+        Sends the state writes buffered for a pair, fenced by its lease if it has one
+
+        :param ctx: `SyncContext` object
+        """
+        if ctx.lease:
+            ctx.state.flush(functools.partial(self.leases.execute_fenced, ctx.lease))
+        else:
+            ctx.state.flush()
 
     def sync_issue(self, ctx):
         """
@@ -135,15 +721,134 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        if not self.ensure_ticket_if_eligible(ctx):
+        if ctx.state is None:
+            ctx.state = self.state.view()
+
+        try:
+            if not self.run_phase(self.ensure_ticket_if_eligible, ctx):
+                return
+
+            if self.is_pair_unchanged(ctx):
+                LOG.debug('Skipping unchanged pair: %s', ctx.issue.key)
+                return
+
+            for step in self.sync_steps():
+                self.check_lease(ctx)
+                self.run_phase(step, ctx)
+
+            self.record_fingerprint(ctx)
+        finally:
+            # Changes and state for completed steps are kept even when a later step fails, and state
+            # is flushed even when committing the ticket changes fails
+            try:
+                self.run_phase(self.commit_ticket_changes, ctx)
+            finally:
+                self.run_phase(self.flush_state, ctx)
+
+    def run_phase(self, phase, ctx):
+        """
+        Runs a single phase of `sync_issue`, recording the time it took
+
+        :param phase: method that accepts a `SyncContext` object
+        :param ctx: `SyncContext` object
+        :return: result of the phase
+        """
+        with METRICS.timer('jzb_phase_seconds', phase=phase.__name__):
+            if self.profiler:
+                with self.profiler.track(ctx, phase.__name__):
+                    return phase(ctx)
+
+            return phase(ctx)
+
+    def is_pair_unchanged(self, ctx):
+        """
+        :param ctx: `SyncContext` object
+        :return: True if neither side nor the config has changed since the pair was last synced
+        """
+        if not self.pair_fingerprints or self.force_sync:
+            return False
+        return ctx.state.matches('pair_fingerprint:{}'.format(ctx.issue.key), ctx.fingerprint)
+
+    def record_fingerprint(self, ctx):
+        """
+        Records the fingerprint of a pair once every step has succeeded and every buffered ticket
+        change has been committed. Nothing is recorded for a pair on which an error was logged or a
+        ticket change was rejected, so the pair is synced again on the next pass.
+
+        :param ctx: `SyncContext` object
+        """
+        if not self.pair_fingerprints:
             return
 
-        self.sync_jira_reference(ctx)
-        self.sync_priority(ctx)
-        self.sync_assignee(ctx)
-        self.sync_zd_comments_to_jira(ctx)
-        self.sync_jira_comments_to_zd(ctx)
-        self.sync_status(ctx)
+        def record():
+            if not ctx.failed and not ctx.rejected and not any(not op.done for op in ctx.ticket_changes.ops):
+                ctx.state.set('pair_fingerprint:{}'.format(ctx.issue.key), ctx.fingerprint)
+
+        ctx.ticket_changes.after_commit(record)
+
+    def commit_ticket_changes(self, ctx):
+        """
+        Commits the ticket changes buffered during `sync_issue` in as few requests as possible
+
+        If a coalesced request is rejected, its changes are retried one at a time in their original
+        order, so a single invalid change (such as solving a ticket with missing required fields)
+        does not hold back the others. The ticket is then refreshed if needed, so state recorded
+        afterwards reflects what Zendesk actually holds.
+
+        :param ctx: `SyncContext` object
+        """
+        if ctx.ticket_changes.ops:
+            # Nothing is written once another node may have taken over the pair
+            self.check_lease(ctx)
+
+        changes = ctx.ticket_changes
+        failed = False
+        stale = False
+
+        for fields, ops in changes.coalesce() if ctx.ticket else []:
+            if not failed:
+                try:
+                    LOG.debug('Committing %d ticket changes in one update', len(ops))
+                    ctx.ticket = ctx.ticket.update(**fields)
+                    for op in ops:
+                        op.committed()
+                    continue
+                except:
+                    LOG.exception('Failed to commit coalesced ticket changes, retrying individually')
+                    failed = True
+
+            for op in ops:
+                try:
+                    ctx.ticket = ctx.ticket.update(**op.fields)
+                    op.committed()
+                    stale = False
+                except:
+                    # This is allowed to fail, such as solving a ticket with missing required fields
+                    LOG.exception('Failed to update ticket with: %s', op.description)
+                    ctx.rejected = True
+                    stale = True
+
+        # The ticket returned by the last successful update already reflects every committed change
+        if stale and (self.refresh_after_writes or not any(op.done for op in changes.ops)):
+            self.refresh_ticket(ctx)
+
+        changes.run_callbacks()
+        changes.clear()
+
+    def sync_steps(self):
+        """
+        Steps performed by `sync_issue` once a ticket has been ensured, in order
+
+        :return: list of methods that accept a `SyncContext` object
+        """
+        return [
+            self.sync_jira_reference,
+            self.sync_priority,
+            self.sync_assignee,
+            self.sync_zd_comments_to_jira,
+            self.sync_jira_comments_to_zd,
+            self.sync_status,
+        ]
 
     def ensure_ticket_if_eligible(self, ctx):
         """
@@ -160,9 +865,9 @@ class Bridge(object):
         """
         issue = ctx.issue
 
-        ticket_id = self.redis.get('zd_ticket:{}'.format(issue.key))
+        ticket_id = ctx.state.get('zd_ticket:{}'.format(issue.key))
         if ticket_id:
-            ticket = self.zd_client.ticket(ticket_id)
+            ticket = ctx.prefetched_ticket or self.zd_client.ticket(ticket_id)
         else:
             ticket = self.zd_client.find_first(self.zd_ticket_query_format.render(issue=issue),
                                                sort_by='created_at',
@@ -175,21 +880,64 @@ class Bridge(object):
 
             LOG.info('Creating Zendesk ticket for JIRA issue')
             ticket = self.create_ticket(issue)
+            ctx.changed = True
+
+            # Nothing on a new ticket needs bridging, this also skips any legacy lookups
+            ctx.state.set('zd_comment_watermark:{}'.format(ticket.id), 0)
         elif ticket.status == 'closed':
-            if not self.is_issue_eligible(issue):
+            eligible = self.is_issue_eligible(issue)
+            self.retire_comment_watermarks(ctx, ticket, expire_issue_watermark=not eligible)
+
+            if not eligible:
                 LOG.debug('Skipping previously closed, ineligible issue')
                 return False
 
             LOG.info('Creating followup Zendesk ticket for JIRA issue')
             ticket = self.create_followup_ticket(issue, ticket)
+            ctx.changed = True
+
+            ctx.state.set('zd_comment_watermark:{}'.format(ticket.id), 0)
+
+            # JIRA comments were bridged to the closed ticket, even if the watermark has since expired
+            if ctx.state.get('jira_comment_watermark:{}'.format(issue.key)) is None:
+                comments = self.load_jira_comments(ctx)
+                if comments:
+                    ctx.state.set('jira_comment_watermark:{}'.format(issue.key), comments[-1].id)
 
         ctx.ticket = ticket
 
+        # Captured before any writes, so changes made while syncing are looked at next pass
+        if self.incremental_comments:
+            ctx.comment_mark = '{}|{}'.format(issue.fields.updated, ticket.updated_at)
+        if self.pair_fingerprints:
+            ctx.fingerprint = hashlib.sha1('{}|{}|{}'.format(issue.fields.updated, ticket.updated_at,
+                                                             self.config_hash).encode('utf-8')).hexdigest()
+
         # Cache ticket mapping locally, Zendesk search is strictly rate limited
-        self.redis.set('zd_ticket:{}'.format(issue.key), ticket.id)
+        if ctx.state.set('zd_ticket:{}'.format(issue.key), ticket.id):
+            # Reverse mapping lets Zendesk-side changes be traced back to the issue
+            ctx.state.set('zd_ticket_issue:{}'.format(ticket.id), issue.key)
 
         return True
 
+    def retire_comment_watermarks(self, ctx, ticket, expire_issue_watermark):
+        """
+        Drops the comment watermark of a closed ticket, as closed tickets cannot change
+
+        :param ctx: `SyncContext` object
+        :param ticket: closed `zendesk.resources.Ticket` object
+        :param expire_issue_watermark: whether the watermark of the issue should expire, unless the
+                                       issue sees further activity
+        """
+        key = 'zd_comment_watermark:{}'.format(ticket.id)
+        if ctx.state.get(key) is None:
+            return
+
+        ctx.state.delete(key)
+
+        if expire_issue_watermark:
+            ctx.state.expire('jira_comment_watermark:{}'.format(ctx.issue.key), self.comment_watermark_ttl)
+
     def is_issue_eligible(self, issue):
         """
         Determines if an untracked or previously closed issue is eligible for creation in Zendesk
@@ -253,8 +1001,8 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        last_seen_jira_assignee = self.redis.get('last_seen_jira_assignee:{}'.format(ctx.issue.key))
-        last_seen_zd_group = self.redis.get('last_seen_zd_group:{}'.format(ctx.ticket.id))
+        last_seen_jira_assignee = ctx.state.get('last_seen_jira_assignee:{}'.format(ctx.issue.key))
+        last_seen_zd_group = ctx.state.get('last_seen_zd_group:{}'.format(ctx.ticket.id))
 
         if ctx.issue.fields.assignee:
             LOG.debug('JIRA issue assigned: %s', ctx.issue.fields.assignee.name)
@@ -262,12 +1010,14 @@ class Bridge(object):
         if not ctx.issue.fields.assignee:
             LOG.info('Assigning previously unassigned JIRA issue to bot')
             self.jira_client.assign_issue(ctx.issue, self.jira_identity)
-            self.refresh_issue(ctx)
+            ctx.changed = True
+            self.issue_written(ctx, assignee=self.jira_identity)
         elif ctx.issue.fields.assignee.name != last_seen_jira_assignee:
             if (ctx.issue.fields.assignee.name == self.jira_identity and
                     ctx.ticket.group_id != self.zd_support_group.id):
                 LOG.info('Assigning Zendesk ticket to group: %s', self.zd_support_group.name)
-                ctx.ticket = ctx.ticket.update(group_id=self.zd_support_group.id)
+                ctx.ticket_changes.update(ctx.ticket, 'assign group', group_id=self.zd_support_group.id)
+                ctx.changed = True
         elif str(ctx.ticket.group_id) != last_seen_zd_group:
             if ctx.ticket.group_id != self.zd_support_group.id:
                 if ctx.issue.fields.assignee.name == self.jira_identity:
@@ -277,8 +1027,11 @@ class Bridge(object):
         else:
             return
 
-        self.redis.set('last_seen_jira_assignee:{}'.format(ctx.issue.key), ctx.issue.fields.assignee.name)
-        self.redis.set('last_seen_zd_group:{}'.format(ctx.ticket.id), ctx.ticket.group_id)
+        ctx.state.set('last_seen_jira_assignee:{}'.format(ctx.issue.key), ctx.issue.fields.assignee.name)
+
+        # Recorded once buffered ticket changes have been committed
+        ctx.ticket_changes.after_commit(
+            lambda: ctx.state.set('last_seen_zd_group:{}'.format(ctx.ticket.id), ctx.ticket.group_id))
 
     def handle_escalation(self, ctx):
         """
@@ -297,7 +1050,8 @@ class Bridge(object):
 
                 LOG.info('Assigning JIRA issue to user: %s', assignee)
                 self.jira_client.assign_issue(ctx.issue, assignee)
-                self.refresh_issue(ctx)
+                ctx.changed = True
+                self.issue_written(ctx, assignee=assignee)
 
                 try:
                     strategy_def.strategy.post_escalation()
@@ -317,8 +1071,8 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        last_seen_jira_status = self.redis.get('last_seen_jira_status:{}'.format(ctx.issue.key))
-        last_seen_zd_status = self.redis.get('last_seen_zd_status:{}'.format(ctx.ticket.id))
+        last_seen_jira_status = ctx.state.get('last_seen_jira_status:{}'.format(ctx.issue.key))
+        last_seen_zd_status = ctx.state.get('last_seen_zd_status:{}'.format(ctx.ticket.id))
 
         LOG.debug('JIRA status: %s; Zendesk status: %s', ctx.issue.fields.status.name, ctx.ticket.status)
 
@@ -337,49 +1091,66 @@ class Bridge(object):
         self.process_status_actions(ctx, self.jira_status_actions, jira_status_changed, owned)
         self.process_status_actions(ctx, self.zd_status_actions, zd_status_changed, owned)
 
-        self.redis.set('last_seen_jira_status:{}'.format(ctx.issue.key), ctx.issue.fields.status.name)
-        self.redis.set('last_seen_zd_status:{}'.format(ctx.ticket.id), ctx.ticket.status)
+        ctx.state.set('last_seen_jira_status:{}'.format(ctx.issue.key), ctx.issue.fields.status.name)
+
+        # Recorded once buffered ticket changes have been committed
+        ctx.ticket_changes.after_commit(
+            lambda: ctx.state.set('last_seen_zd_status:{}'.format(ctx.ticket.id), ctx.ticket.status))
 
     def process_status_actions(self, ctx, action_defs, changed, owned):
         """
         Runs matching status action definitions against an issue/ticket pair
 
         :param ctx: `SyncContext` object
-        :param action_defs: list of `ActionDefinition` objects
+        :param action_defs: `StatusActionTable` object
         :param changed: True if status has changed
         :param owned: True if issue is owned by bot
         """
-        while True:
-            match = False
+        for _ in range(self.max_action_iterations):
+            if not self.commit_status_changes(ctx):
+                LOG.warning('Skipping status actions on %s as Zendesk rejected a status change', ctx.issue.key)
+                return
 
-            for action_def in action_defs:
-                if not owned and not action_def.force:
-                    continue
+            action_def = action_defs.match(ctx.issue.fields.status.name, ctx.ticket.status, owned)
+            if not action_def:
+                LOG.debug('No action defs matched')
+                return
+
+            LOG.debug('Matched action def: %s', action_def.description)
+            ctx.action_iterations += 1
 
-                if not (ctx.issue.fields.status.name in action_def.jira_status and
-                            ctx.ticket.status in action_def.zd_status):
+            for action in action_def.actions:
+                if action.only_once and not changed:
+                    LOG.debug('Skipping action marked only_once: %s', action.description)
                     continue
 
-                LOG.debug('Matched action def: %s', action_def.description)
-                match = True
+                try:
+                    LOG.info('Performing action: %s', action.description)
+                    with METRICS.timer('jzb_action_seconds', action=action.action_type):
+                        action.handle(ctx)
+                    ctx.changed = True
+                except:
+                    LOG.exception('Failed to perform action')
+                    ctx.failed = True
+                    return
 
-                for action in action_def.actions:
-                    if action.only_once and not changed:
-                        LOG.debug('Skipping action marked only_once: %s', action.description)
-                        continue
+        LOG.warning('Stopped status actions on %s after %d iterations, last matched: %s',
+                    ctx.issue.key, self.max_action_iterations, action_def.description)
 
-                    try:
-                        LOG.info('Performing action: %s', action.description)
-                        action.handle(ctx)
-                    except:
-                        LOG.exception('Failed to perform action')
-                        return
+    def commit_status_changes(self, ctx):
+        """
+        Commits buffered ticket changes when any of them changes the ticket status, so status actions
+        are only matched against a status Zendesk has accepted
 
-                break
+        :param ctx: `SyncContext` object
+        :return: False if Zendesk rejected any of the changes
+        """
+        ops = ctx.ticket_changes.pending
+        if not any('status' in op.fields for op in ops):
+            return True
 
-            if not match:
-                LOG.debug('No action defs matched')
-                break
+        self.commit_ticket_changes(ctx)
+        return all(op.done for op in ops)
 
     def sync_jira_reference(self, ctx):
         """
@@ -394,6 +1165,7 @@ class Bridge(object):
         if getattr(ctx.issue.fields, self.jira_reference_field) != ticket_id:
             LOG.info('Updating JIRA reference for ticket: %s', ticket_id)
             ctx.issue.update(fields={self.jira_reference_field: ticket_id})
+            ctx.changed = True
 
     def sync_priority(self, ctx):
         """
@@ -408,8 +1180,8 @@ class Bridge(object):
 
         if ctx.ticket.priority != zd_priority:
             LOG.info('Updating Zendesk ticket priority')
-            ctx.ticket.update(priority=zd_priority)
-            self.refresh_ticket(ctx)
+            ctx.ticket_changes.update(ctx.ticket, 'update priority', priority=zd_priority)
+            ctx.changed = True
 
     def sync_zd_comments_to_jira(self, ctx):
         """
@@ -417,35 +1189,53 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        changed = False
+        if self.comments_unchanged(ctx):
+            LOG.debug('Skipping unchanged Zendesk comments')
+            return
 
-        for comment in ctx.ticket.comments:
-            if not comment.public:
-                LOG.debug('Skipping private Zendesk comment %s', comment.id)
-                continue
+        added_comments = []
 
-            if comment.author_id == self.zd_identity.id:
-                LOG.debug('Skipping my own Zendesk comment: %s', comment.id)
-                continue
+        watermark_key = 'zd_comment_watermark:{}'.format(ctx.ticket.id)
+        watermark = ctx.state.get(watermark_key)
+        legacy = watermark is None and self.legacy_comment_sets
 
-            if self.redis.sismember('seen_zd_comments', comment.id):
-                LOG.debug('Skipping seen Zendesk comment: %s', comment.id)
-                continue
+        if self.incremental_comments and watermark is not None:
+            # Only the newest pages are fetched
+            comments = self.zd_api.ticket_comments(ctx.ticket.id, after_id=int(watermark))
+        else:
+            comments = [x for x in ctx.ticket.comments if is_past_watermark(x.id, watermark)]
+        if legacy:
+            ctx.state.prefetch_members('seen_zd_comments', [comment.id for comment in comments])
+
+        ctx.comments += len(comments)
+
+        try:
+            for comment in comments:
+                if not comment.public:
+                    LOG.debug('Skipping private Zendesk comment %s', comment.id)
+                elif comment.author_id == self.zd_identity.id:
+                    LOG.debug('Skipping my own Zendesk comment: %s', comment.id)
+                elif legacy and ctx.state.sismember('seen_zd_comments', comment.id):
+                    LOG.debug('Skipping seen Zendesk comment: %s', comment.id)
+                else:
+                    LOG.info('Copying Zendesk comment to JIRA issue: %s', comment.id)
 
-            LOG.info('Copying Zendesk comment to JIRA issue: %s', comment.id)
+                    stripped_body = strip_signature(comment.body, self.zd_signature_delimeter)
 
-            stripped_body = comment.body.rsplit(self.zd_signature_delimeter, 1)[0]
+                    comment_body = self.jira_comment_format.render(comment=comment,
+                                                                   stripped_body=stripped_body)
 
-            comment_body = self.jira_comment_format.render(comment=comment,
-                                                           stripped_body=stripped_body)
+                    added_comments.append(self.jira_client.add_comment(ctx.issue, comment_body))
+                    ctx.changed = True
 
-            self.jira_client.add_comment(ctx.issue, comment_body)
-            self.redis.sadd('seen_zd_comments', comment.id)
+                watermark = comment.id
+        finally:
+            # Comments up to the watermark have been bridged or skipped, even if a later one failed
+            if watermark is not None:
+                ctx.state.set(watermark_key, watermark)
 
-            changed = True
-
-        if changed:
-            self.refresh_issue(ctx)
+        if added_comments:
+            self.issue_written(ctx, comments=added_comments)
 
     def sync_jira_comments_to_zd(self, ctx):
         """
@@ -453,60 +1243,133 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        for comment in ctx.issue.fields.comment.comments:
+        if self.comments_unchanged(ctx):
+            LOG.debug('Skipping unchanged JIRA comments')
+            return
+
+        watermark_key = 'jira_comment_watermark:{}'.format(ctx.issue.key)
+        watermark = ctx.state.get(watermark_key)
+        legacy = watermark is None and self.legacy_comment_sets
+
+        # Tuples of comment ID and the buffered ticket update copying it, if any
+        processed = []
+
+        for comment in self.load_jira_comments(ctx, watermark):
+            if not is_past_watermark(comment.id, watermark):
+                continue
+
             if comment.author.name == self.jira_identity:
                 LOG.debug('Skipping my own JIRA comment: %s', comment.id)
+                processed.append((comment.id, None))
                 continue
 
-            if self.redis.sismember('seen_jira_comments', comment.id):
+            if legacy and ctx.state.sismember('seen_jira_comments', comment.id):
                 LOG.debug('Skipping seen JIRA comment: %s', comment.id)
+                processed.append((comment.id, None))
                 continue
 
             LOG.info('Copying JIRA comment to Zendesk ticket: %s', comment.id)
 
             comment_body = self.zd_comment_format.render(comment=comment)
 
-            ctx.ticket.update(comment=dict(body=comment_body))
-            self.redis.sadd('seen_jira_comments', comment.id)
+            op = ctx.ticket_changes.update(ctx.ticket, 'copy JIRA comment {}'.format(comment.id),
+                                           comment=dict(body=comment_body))
+            ctx.changed = True
+
+            processed.append((comment.id, op))
+
+        ctx.comments += len(processed)
+
+        # The watermark only advances past comments that were actually posted
+        ctx.ticket_changes.after_commit(
+            functools.partial(self.jira_comments_committed, ctx, watermark_key, processed))
+
+    def jira_comments_committed(self, ctx, key, processed):
+        """
+        Advances the JIRA comment watermark once buffered ticket changes have been committed
+
+        :param ctx: `SyncContext` object
+        :param key: key of the watermark
+        :param processed: list of tuples of comment ID and the `TicketOp` object copying it, if any
+        """
+        watermark = None
+        complete = True
+
+        for comment_id, op in processed:
+            if op and not op.done:
+                complete = False
+                break
+            watermark = comment_id
+
+        if watermark is not None:
+            ctx.state.set(key, watermark)
+
+        if complete and self.incremental_comments:
+            # Comments on both sides are in sync as of the start of this sync
+            ctx.state.set('comment_mark:{}'.format(ctx.issue.key), ctx.comment_mark)
+
+    def comments_unchanged(self, ctx):
+        """
+        :param ctx: `SyncContext` object
+        :return: True if neither side has changed since comments were last synced
+        """
+        return self.incremental_comments and ctx.state.matches('comment_mark:{}'.format(ctx.issue.key),
+                                                               ctx.comment_mark)
+
+    def load_jira_comments(self, ctx, watermark=None):
+        """
+        Ensures the local issue holds at least the comments past the given watermark
+
+        With incremental comments, comments are not returned by the search. They are fetched newest
+        first, a page at a time, until the watermark is reached.
+
+        :param ctx: `SyncContext` object
+        :param watermark: ID of the last comment bridged or skipped, or None for every comment
+        :return: list of `jira.resources.Comment` objects, oldest first
+        """
+        if getattr(ctx.issue.fields, 'comment', None) is not None:
+            return ctx.issue.fields.comment.comments
+
+        comments = []
+        while True:
+            page = self.jira_client.comments(ctx.issue.key, start_at=len(comments),
+                                             max_results=self.comment_page_size, order_by='-created')
+            comments.extend(page)
+
+            if len(page) < self.comment_page_size or not is_past_watermark(page[-1].id, watermark):
+                break
+
+        comments.reverse()
+        ctx.issue.fields.comment = objectize(dict(comments=comments))
+
+        return comments
 
     def find_group_by_name(self, name):
         """
         Find group object by its name
 
         :param name: Name of the group to find
-        :return: `zendesk.resources.Group` object
+        :return: group object
         """
-        for group in self.assignable_groups:
-            if group.name == name:
-                return group
-
-        raise ValueError('Could not find group by name: {}'.format(name))
+        return self.metadata.find_group_by_name(name)
 
     def find_group_by_id(self, id):
         """
         Find group object by its id
 
         :param id: Integer id
-        :return: `zendesk.resources.Group` object
+        :return: group object
         """
-        for group in self.assignable_groups:
-            if group.id == id:
-                return group
-
-        raise ValueError('Could not find group by id: {}'.format(id))
+        return self.metadata.find_group_by_id(id)
 
     def find_ticket_form_by_name(self, name):
         """
         Find ticket form by its name
 
         :param name: Name of the ticket form to find
-        :return: `zendesk.resources.TicketForm` object
+        :return: ticket form object
         """
-        for form in self.zd_client.ticket_forms:
-            if form.name == name:
-                return form
-
-        raise ValueError('Could not find ticket form by name: {}'.format(name))
+        return self.metadata.find_ticket_form_by_name(name)
 
     def refresh_ticket(self, ctx):
         """
@@ -523,7 +1386,51 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        ctx.issue = self.jira_client.issue(ctx.issue.key, fields='assignee,attachment,comment,*navigable')
+        comment = getattr(ctx.issue.fields, 'comment', None)
+
+        ctx.issue = self.jira_client.issue(ctx.issue.key, fields=self.issue_fields)
+
+        if self.incremental_comments:
+            # Comments already loaded are kept, newer ones are loaded when needed
+            ctx.issue.fields.comment = comment
+
+    def issue_written(self, ctx, assignee=None, status=None, comments=None):
+        """
+        Brings the local issue up to date after the bridge has written to it
+
+        Unless `refresh_after_writes` is enabled, the issue is not re-read in full. Instead, its
+        `updated` time, status and assignee are fetched and compared with what the write should
+        have left behind. The issue is only re-read in full when they differ, meaning someone
+        else changed it too.
+
+        :param ctx: `SyncContext` object
+        :param assignee: name of the user the issue was assigned to, if any
+        :param status: name of the status the issue was transitioned to, if any
+        :param comments: list of comments added to the issue, if any
+        """
+        if self.refresh_after_writes:
+            self.refresh_issue(ctx)
+            return
+
+        fields = ctx.issue.fields
+        latest = self.jira_client.issue(ctx.issue.key, fields='updated,status,assignee').fields
+
+        expected_assignee = assignee or (fields.assignee.name if fields.assignee else None)
+        expected_status = status or fields.status.name
+
+        if ((latest.assignee.name if latest.assignee else None) != expected_assignee or
+                latest.status.name != expected_status):
+            LOG.debug('JIRA issue changed concurrently, refreshing: %s', ctx.issue.key)
+            self.refresh_issue(ctx)
+            return
+
+        fields.assignee = latest.assignee
+        fields.status = latest.status
+        fields.updated = latest.updated
+
+        if comments and getattr(fields, 'comment', None) is not None:
+            fields.comment.comments.extend(comments)
+            fields.comment.total = len(fields.comment.comments)
 
     def handle_update_ticket(self, ctx, **kwargs):
         """
@@ -531,7 +1438,7 @@ class Bridge(object):
 
         :param ctx: `SyncContext` object
         """
-        ctx.ticket = ctx.ticket.update(**kwargs)
+        ctx.ticket_changes.update(ctx.ticket, 'update ticket', **kwargs)
 
     def handle_transition_issue(self, ctx, name, **kwargs):
         """
@@ -542,18 +1449,31 @@ class Bridge(object):
         """
         params = kwargs.copy()
 
-        transitions = self.jira_client.transitions(ctx.issue)
-        transition_id = None
-        for transition in transitions:
-            if transition['name'] == name:
-                transition_id = transition['id']
-                break
-
-        if not transition_id:
+        transition, cached = self.transition_cache.find(ctx.issue, name, self.jira_client.transitions)
+        if not transition:
             raise ValueError('Could not find transition: %s', name)
 
-        self.jira_client.transition_issue(ctx.issue, transition_id, fields=params)
-        self.refresh_issue(ctx)
+        try:
+            self.jira_client.transition_issue(ctx.issue, transition['id'], fields=params)
+        except Exception:
+            if not cached:
+                raise
+
+            # The workflow may have changed since the transitions were cached
+            LOG.warning('Cached transition rejected, retrying with fresh transitions: %s', name)
+            self.transition_cache.invalidate(ctx.issue)
+
+            transition, _ = self.transition_cache.find(ctx.issue, name, self.jira_client.transitions)
+            if not transition:
+                raise ValueError('Could not find transition: %s', name)
+
+            self.jira_client.transition_issue(ctx.issue, transition['id'], fields=params)
+
+        if params or not transition['to']:
+            # Effect of the transition on other fields is unknown
+            self.refresh_issue(ctx)
+        else:
+            self.issue_written(ctx, status=transition['to'])
 
     def handle_add_ticket_tags(self, ctx, tags, **kwargs):
         """
@@ -568,8 +1488,7 @@ class Bridge(object):
                 absent_tags.append(tag)
 
         if absent_tags:
-            ctx.ticket.add_tags(*absent_tags)
-            self.refresh_ticket(ctx)
+            ctx.ticket_changes.add_tags(ctx.ticket, absent_tags)
 
     def handle_remove_ticket_tags(self, ctx, tags, **kwargs):
         """
@@ -584,19 +1503,304 @@ class Bridge(object):
                 present_tags.append(tag)
 
         if present_tags:
-            ctx.ticket.remove_tags(*present_tags)
-            self.refresh_ticket(ctx)
+            ctx.ticket_changes.remove_tags(ctx.ticket, present_tags)
 
 class SyncContext(object):
     """
     Container for an issue/ticket pair
     """
-    def __init__(self, issue):
+    def __init__(self, issue, state=None, prefetched_ticket=None, generation=None):
         """
         :param issue: `jira.resources.Issue` object
+        :param state: optional `jzb.state.StateView` object, created by the bridge when not given
+        :param prefetched_ticket: optional ticket already fetched for the tracked ticket id
+        :param generation: generation of the issue lock when state and ticket were prefetched
         """
         self.issue = issue
         self.ticket = None
+        self.state = state
+        self.prefetched_ticket = prefetched_ticket
+        self.generation = generation
+
+        # Set when the bridge writes to either side
+        self.changed = False
+
+        # Updated times of both sides before syncing, used to skip unchanged comments
+        self.comment_mark = None
+
+        # Updated times of both sides and the config hash, used to skip unchanged pairs
+        self.fingerprint = None
+
+        # `jzb.lease.Lease` held on the pair, when nodes coordinate through leases
+        self.lease = None
+
+        # Number of status action definitions matched while syncing the pair
+        self.action_iterations = 0
+
+        # Number of new comments considered for copying to the other side
+        self.comments = 0
+
+        # Set when an error was logged instead of raised, so the pair is counted as failed
+        self.failed = False
+
+        # Set when Zendesk rejected a ticket change, so the pair is synced again without counting as failed
+        self.rejected = False
+
+        self.ticket_changes = TicketChanges()
+
+class TicketChanges(object):
+    """
+    Buffers writes to a Zendesk ticket so they can be committed in as few requests as possible
+
+    Each change is applied to the local ticket view straight away, so later steps see it. Field and
+    tag changes are coalesced into a single update, while each comment keeps its own update so
+    comments are posted separately and in order.
+    """
+    def __init__(self):
+        self.ops = []
+        self.callbacks = []
+
+    @property
+    def pending(self):
+        return [op for op in self.ops if not op.done]
+
+    def update(self, ticket, description, on_commit=None, **fields):
+        """
+        :param ticket: local ticket view to apply the change to
+        :param description: description of the change, used for logging
+        :param on_commit: optional callable invoked once the change has been committed
+        :param fields: ticket fields, as accepted by the Zendesk API
+        :return: `TicketOp` object
+        """
+        for name, value in six.iteritems(fields):
+            if name != 'comment':
+                apply_ticket_field(ticket, name, value)
+
+        op = TicketOp(description, fields, on_commit)
+        self.ops.append(op)
+        return op
+
+    def add_tags(self, ticket, tags):
+        """
+        :param ticket: local ticket view to apply the change to
+        :param tags: list of tag names to add
+        """
+        apply_ticket_field(ticket, 'tags', list(ticket.tags) + [x for x in tags if x not in ticket.tags])
+        self.ops.append(TicketOp('add tags', dict(additional_tags=list(tags))))
+
+    def remove_tags(self, ticket, tags):
+        """
+        :param ticket: local ticket view to apply the change to
+        :param tags: list of tag names to remove
+        """
+        apply_ticket_field(ticket, 'tags', [x for x in ticket.tags if x not in tags])
+        self.ops.append(TicketOp('remove tags', dict(remove_tags=list(tags))))
+
+    def after_commit(self, callback):
+        """
+        :param callback: callable invoked once buffered changes have been committed, or have failed
+        """
+        self.callbacks.append(callback)
+
+    def coalesce(self):
+        """
+        Groups pending changes into as few ticket updates as possible
+
+        :return: list of tuples of update fields and the `TicketOp` objects they cover
+        """
+        requests = [({}, [])]
+        added_tags = []
+        removed_tags = []
+
+        for op in self.pending:
+            for name, value in six.iteritems(op.fields):
+                if name == 'additional_tags':
+                    added_tags.extend(x for x in value if x not in added_tags)
+                    removed_tags = [x for x in removed_tags if x not in value]
+                elif name == 'remove_tags':
+                    removed_tags.extend(x for x in value if x not in removed_tags)
+                    added_tags = [x for x in added_tags if x not in value]
+                elif name != 'comment':
+                    requests[0][0][name] = value
+
+            if 'comment' in op.fields:
+                # Zendesk accepts a single comment per update
+                if 'comment' in requests[-1][0]:
+                    requests.append(({}, []))
+                requests[-1][0]['comment'] = op.fields['comment']
+                requests[-1][1].append(op)
+            else:
+                requests[0][1].append(op)
+
+        if added_tags:
+            requests[0][0]['additional_tags'] = added_tags
+        if removed_tags:
+            requests[0][0]['remove_tags'] = removed_tags
+
+        return [x for x in requests if x[1]]
+
+    def run_callbacks(self):
+        for callback in self.callbacks:
+            callback()
+        self.callbacks = []
+
+    def clear(self):
+        self.ops = []
+        self.callbacks = []
+
+class TicketOp(object):
+    """
+    Single buffered change to a Zendesk ticket
+    """
+    def __init__(self, description, fields, on_commit=None):
+        self.description = description
+        self.fields = fields
+        self.on_commit = on_commit
+        self.done = False
+
+    def committed(self):
+        self.done = True
+        if self.on_commit:
+            self.on_commit()
+
+def apply_ticket_field(ticket, name, value):
+    """
+    Applies a field change to a local ticket view, where the ticket object allows it
+
+    :param ticket: ticket object
+    :param name: name of the field
+    :param value: new value
+    """
+    try:
+        setattr(ticket, name, value)
+    except AttributeError:
+        LOG.debug('Could not apply %s to local ticket view', name)
+
+def hash_config(config, keys):
+    """
+    :param config: object
+    :param keys: names of the config keys to hash
+    :return: hex digest of the given config values
+    """
+    values = dict((key, getattr(config, key, None)) for key in keys)
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def project_key(issue_key):
+    """
+    :param issue_key: JIRA issue key, such as `ABC-123`
+    :return: key of the project, such as `ABC`
+    """
+    return issue_key.rsplit('-', 1)[0]
+
+def is_past_key(issue_key, last_key):
+    """
+    :param issue_key: JIRA issue key, such as `ABC-123`
+    :param last_key: JIRA issue key a key ordered scan continues after
+    :return: True if the issue comes after the last key in a key ordered scan
+    """
+    if project_key(issue_key) != project_key(last_key):
+        return True
+    return int(issue_key.rsplit('-', 1)[1]) > int(last_key.rsplit('-', 1)[1])
+
+def is_past_watermark(comment_id, watermark):
+    """
+    :param comment_id: ID of a JIRA or Zendesk comment, both are increasing integers
+    :param watermark: ID of the last comment bridged or skipped, or None
+    :return: True if the comment has not been considered yet
+    """
+    return watermark is None or int(comment_id) > int(watermark)
+
+class SyncStats(object):
+    """
+    Counters for a single sync pass, safe to update from multiple threads
+    """
+    def __init__(self, state=None):
+        """
+        :param state: optional `jzb.state.StateStore` object to count Redis round trips from
+        """
+        self.started = time.time()
+        self.finished = None
+        self.synced = 0
+        self.failed = 0
+        self.changed = 0
+        self.lock = threading.Lock()
+
+        # Incremental sync bookkeeping, in seconds since the epoch
+        self.since = None
+        self.newest_updated = None
+        self.oldest_failed_updated = None
+        self.interrupted = False
+
+        # Keys of the issues that failed to sync
+        self.failed_keys = []
+
+        self.state = state
+        self.initial_round_trips = state.round_trips if state else 0
+
+    def record(self, success, issue=None, changed=False):
+        """
+        :param success: True if the issue synced without error
+        :param issue: optional `jira.resources.Issue` object, used to track `updated` times
+        :param changed: True if the bridge wrote to either side of the pair
+        """
+        updated = None
+        if issue is not None and getattr(issue.fields, 'updated', None):
+            updated = parse_jira_time(issue.fields.updated)
+
+        METRICS.inc('jzb_issues_total', result='synced' if success else 'failed')
+        if changed:
+            METRICS.inc('jzb_issues_changed_total')
+
+        with self.lock:
+            if success:
+                self.synced += 1
+            else:
+                self.failed += 1
+                if issue is not None:
+                    self.failed_keys.append(issue.key)
+
+            if changed:
+                self.changed += 1
+
+            if updated is None:
+                return
+
+            if self.newest_updated is None or updated > self.newest_updated:
+                self.newest_updated = updated
+
+            if not success and (self.oldest_failed_updated is None or updated < self.oldest_failed_updated):
+                self.oldest_failed_updated = updated
+
+    def finish(self):
+        self.finished = time.time()
+
+        LOG.info('Sync finished: %d issues (%d changed, %d failed) in %.2fs, %.2f issues/sec',
+                 self.total, self.changed, self.failed, self.elapsed, self.rate)
+
+        if self.state and self.total:
+            LOG.info('Redis round trips: %d (%.1f per issue)',
+                     self.redis_round_trips, float(self.redis_round_trips) / self.total)
+
+    @property
+    def redis_round_trips(self):
+        if not self.state:
+            return 0
+        return self.state.round_trips - self.initial_round_trips
+
+    @property
+    def total(self):
+        return self.synced + self.failed
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0.0
+        return self.total / elapsed
 
 class TicketFieldMapper(object):
     """
@@ -621,10 +1825,16 @@ class TicketFieldMapper(object):
     """
     def __init__(self, ticket_fields):
         """
-        :param issue: `jira.resources.Issue` object
+        :param ticket_fields: list of ticket field objects
         """
         self.ticket_fields = ticket_fields
 
+        # First active field wins, as with a linear scan
+        self.active_fields_by_name = {}
+        for field in ticket_fields:
+            if field.active:
+                self.active_fields_by_name.setdefault(field.name, field)
+
     def map_fields(self, mappings):
         """
         :param mappings: list of dictionary mappings
@@ -665,12 +1875,78 @@ class TicketFieldMapper(object):
         :param name: Name of field to find
         :return: `zendesk.resources.TicketField` object
         """
-        for field in self.ticket_fields:
-            if field.name == name and field.active:
-                return field
+        field = self.active_fields_by_name.get(name)
+        if field is not None:
+            return field
 
         raise ValueError('Could not find active ticket field by name: {}'.format(name))
 
+class StatusActionTable(object):
+    """
+    Status action definitions indexed by the pair of statuses they match
+    """
+    def __init__(self, action_defs):
+        """
+        :param action_defs: list of `ActionDefinition` objects, in order of precedence
+        """
+        self.action_defs = action_defs
+
+        # Definitions matching each pair of statuses, in order of precedence
+        self.index = {}
+        for action_def in action_defs:
+            for jira_status in action_def.jira_status:
+                for zd_status in action_def.zd_status:
+                    self.index.setdefault((jira_status, zd_status), []).append(action_def)
+
+    def match(self, jira_status, zd_status, owned):
+        """
+        :param jira_status: name of the JIRA issue status
+        :param zd_status: Zendesk ticket status
+        :param owned: True if issue is owned by bot
+        :return: first matching `ActionDefinition` object, or None
+        """
+        for action_def in self.index.get((jira_status, zd_status), ()):
+            if owned or action_def.force:
+                return action_def
+
+        return None
+
+    def check(self):
+        """
+        Rejects definitions whose actions would keep matching each other forever, and warns about
+        definitions that are shadowed by earlier ones and can never match
+
+        Only status changes known without calling JIRA are followed, so the result of a JIRA
+        transition is assumed to leave the loop.
+        """
+        matched = set()
+
+        for state in self.index:
+            for owned in (True, False):
+                for changed in (True, False):
+                    path = []
+                    current = state
+
+                    while current not in path:
+                        action_def = self.match(current[0], current[1], owned)
+                        if not action_def:
+                            break
+
+                        matched.add(action_def)
+                        path.append(current)
+
+                        current = action_def.next_state(current, changed)
+                        if current is None:
+                            break
+                    else:
+                        cycle = path[path.index(current):] + [current]
+                        raise ValueError('Status action definitions loop forever: {}'.format(
+                            ' -> '.join('{}/{}'.format(*x) for x in cycle)))
+
+        for action_def in self.action_defs:
+            if action_def not in matched:
+                LOG.warning('Status action definition can never match: %s', action_def.description)
+
 class ActionDefinition(object):
     def __init__(self, jira_status, zd_status, actions, description, force):
         self.jira_status = jira_status
@@ -679,12 +1955,34 @@ class ActionDefinition(object):
         self.description = description
         self.force = force
 
+    def next_state(self, state, changed):
+        """
+        :param state: tuple of JIRA and Zendesk statuses matched by the definition
+        :param changed: True if status has changed, so actions marked only_once are performed
+        :return: tuple of statuses once the actions have been performed, or None if the JIRA status
+                 may have changed
+        """
+        jira_status, zd_status = state
+
+        for action in self.actions:
+            if action.only_once and not changed:
+                continue
+
+            if action.action_type == 'transition_issue':
+                return None
+
+            if action.action_type == 'update_ticket' and action.params.get('status'):
+                zd_status = action.params['status']
+
+        return jira_status, zd_status
+
 class Action(object):
-    def __init__(self, handler, params, description, only_once):
+    def __init__(self, handler, params, description, only_once, action_type=None):
         self.handler = handler
         self.params = params
         self.description = description
         self.only_once = only_once
+        self.action_type = action_type
 
     def handle(self, ctx):
         if self.params:
@@ -0,0 +1,496 @@
+import base64
+import collections
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import six
+from six.moves.urllib.parse import urlparse
+
+from jzb import LOG
+from jzb.clients import REMAINING_HEADERS, RESET_HEADERS, ThrottledAdapter
+from jzb.memredis import MemoryRedis, encode
+from jzb.metrics import endpoint_name
+
+VERSION = 1
+
+# Response headers kept in cassettes, anything else such as cookies is dropped
+RECORDED_HEADERS = ('Content-Type', 'Retry-After') + REMAINING_HEADERS + RESET_HEADERS
+
+# Redis commands recorded by `RedisRecorder`, the only ones used by a sync pass
+READ_COMMANDS = ('get', 'mget', 'exists', 'sismember')
+WRITE_COMMANDS = ('set', 'delete', 'incr', 'expire', 'pexpire', 'sadd')
+
+# Keys left out of cassettes entirely, as they only hold caches
+IGNORED_KEY_PREFIXES = ('jinja2_bytecode:',)
+
+# Keys holding times or random values, which are expected to differ between passes
+VOLATILE_KEY_PREFIXES = ('last_full_sync', 'sync_watermark', 'lease:', 'lease_token:', 'jzb_metadata:')
+
+# Email addresses are always redacted, other patterns are taken from the `cassette_redact` config key
+EMAIL_PATTERN = r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}'
+
+class CassetteError(Exception):
+    pass
+
+class Cassette(object):
+    """
+    Every JIRA, Zendesk and Redis interaction of a sync pass
+
+    HTTP requests are kept in order with their responses. Redis is kept as the values read before
+    the pass wrote to them, which seed a simulated Redis on replay, and the values written by the
+    pass, which are compared after it.
+    """
+    def __init__(self, http=None, initial=None, members=None, written=None, elapsed=None):
+        """
+        :param http: list of dicts describing requests and their responses
+        :param initial: dict of Redis key to the value read before it was written
+        :param members: dict of Redis set to the members found in it before it was written
+        :param written: dict of Redis key to the last value written, or None if deleted
+        :param elapsed: seconds the pass took
+        """
+        self.http = http or []
+        self.initial = initial or {}
+        self.members = dict((k, set(v)) for k, v in six.iteritems(members or {}))
+        self.written = written or {}
+        self.elapsed = elapsed
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: path of a cassette, compressed when it ends with `.gz`
+        :return: `Cassette` object
+        """
+        with open_file(path, 'rb') as fp:
+            data = json.loads(fp.read().decode('utf-8'))
+
+        if data.get('version') != VERSION:
+            raise CassetteError('Unsupported cassette version: {}'.format(data.get('version')))
+
+        return cls(http=data['http'], initial=data['initial'], members=data['members'], written=data['written'],
+                   elapsed=data['elapsed'])
+
+    def save(self, path):
+        """
+        :param path: path to write to, compressed when it ends with `.gz`
+        """
+        data = dict(version=VERSION, elapsed=self.elapsed, http=self.http, initial=self.initial,
+                    members=dict((k, sorted(v)) for k, v in six.iteritems(self.members)),
+                    written=self.written)
+
+        with open_file(path, 'wb') as fp:
+            fp.write(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+        LOG.info('Wrote %d requests to %s', len(self.http), path)
+
+    def sanitize(self, patterns=()):
+        """
+        Replaces email addresses and text matching the given patterns with a digest, so equal
+        values still match each other on replay
+
+        :param patterns: list of regular expressions
+        """
+        pattern = re.compile('|'.join('(?:{})'.format(x) for x in (EMAIL_PATTERN,) + tuple(patterns)))
+
+        def redact(value):
+            if not isinstance(value, six.string_types):
+                return value
+            return pattern.sub(lambda m: 'redacted-' + hashlib.sha1(m.group(0).encode('utf-8')).hexdigest()[:10],
+                               value)
+
+        for interaction in self.http:
+            for field in ('url', 'body', 'response'):
+                interaction[field] = redact(interaction[field])
+
+        # Key names are redacted as well, as they hold values such as issue keys that requests refer to
+        self.initial = dict((redact(k), redact(v)) for k, v in six.iteritems(self.initial))
+        self.members = dict((redact(k), set(redact(x) for x in v)) for k, v in six.iteritems(self.members))
+        self.written = dict((redact(k), sorted(redact(x) for x in v) if isinstance(v, list) else redact(v))
+                            for k, v in six.iteritems(self.written))
+
+    def record_http(self, upstream, request, response, elapsed):
+        """
+        :param upstream: name of the upstream, such as `jira`
+        :param request: `requests.PreparedRequest` object
+        :param response: `requests.Response` object
+        :param elapsed: seconds the request took
+        """
+        interaction = dict(
+            upstream=upstream,
+            method=request.method,
+            url=request.url,
+            body=normalize_body(request.body),
+            status=response.status_code,
+            headers=dict((k, response.headers[k]) for k in RECORDED_HEADERS if k in response.headers),
+            response=to_text(response.content),
+            elapsed=round(elapsed, 4),
+        )
+
+        with self.lock:
+            self.http.append(interaction)
+
+    def record_redis(self, name, args, kwargs, result):
+        """
+        :param name: name of the command
+        :param args: positional arguments of the command
+        :param kwargs: keyword arguments of the command
+        :param result: result of the command
+        """
+        with self.lock:
+            if name == 'get':
+                self.read(args[0], result)
+            elif name == 'mget':
+                keys = list(args[0]) if isinstance(args[0], (list, tuple)) else list(args)
+                for key, value in zip(keys, result):
+                    self.read(key, value)
+            elif name == 'sismember':
+                key = to_text(args[0])
+                if result and key not in self.written and not ignored(key):
+                    self.members.setdefault(key, set()).add(to_text(args[1]))
+            elif name == 'set' and result:
+                self.write(args[0], args[1])
+            elif name == 'incr':
+                self.write(args[0], result)
+            elif name == 'delete':
+                for key in args:
+                    self.write(key, None)
+            elif name == 'sadd':
+                key = to_text(args[0])
+                if not ignored(key):
+                    members = self.written.get(key)
+                    self.written[key] = sorted(set(members if isinstance(members, list) else []) |
+                                               set(to_text(x) for x in args[1:]))
+
+    def read(self, key, value):
+        key = to_text(key)
+        if key not in self.written and key not in self.initial and not ignored(key):
+            self.initial[key] = to_text(value)
+
+    def write(self, key, value):
+        key = to_text(key)
+        if not ignored(key):
+            self.written[key] = to_text(value)
+
+    def build_redis(self):
+        """
+        :return: `MemoryRedis` object holding the values read during the pass
+        """
+        redis = MemoryRedis()
+
+        for key, value in six.iteritems(self.initial):
+            if value is not None:
+                redis.store(key, encode(from_text(value)))
+        for key, members in six.iteritems(self.members):
+            redis.store(key, set(encode(x) for x in members))
+
+        return redis
+
+    def mutations(self):
+        """
+        :return: `collections.Counter` of the requests writing to an upstream
+        """
+        return collections.Counter((x['method'], x['url'], x['body']) for x in self.http
+                                   if is_mutation(x['method'], x['url']))
+
+class CassettePlayer(object):
+    """
+    Answers requests from a cassette
+
+    Requests are matched by method, URL and body, in the order they were recorded. Requests made more
+    often than recorded get the last response again. Requests whose query differs, such as JQL with
+    dates relative to the time of the pass, get the next unused response recorded for the same path.
+    """
+    def __init__(self, cassette):
+        """
+        :param cassette: `Cassette` object
+        """
+        self.cassette = cassette
+        self.lock = threading.Lock()
+
+        self.queues = collections.defaultdict(collections.deque)
+        self.last = {}
+        self.by_path = collections.defaultdict(list)
+        self.used = set()
+
+        for i, interaction in enumerate(cassette.http):
+            key = (interaction['method'], interaction['url'], interaction['body'])
+            self.queues[key].append(i)
+            self.by_path[path_key(interaction['method'], interaction['url'])].append(i)
+
+    def respond(self, request):
+        """
+        :param request: `requests.PreparedRequest` object
+        :return: recorded interaction dict
+        """
+        key = (request.method, request.url, normalize_body(request.body))
+
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                index = queue.popleft()
+            elif key in self.last:
+                index = self.last[key]
+            else:
+                unused = [x for x in self.by_path.get(path_key(request.method, request.url), [])
+                          if x not in self.used]
+                if not unused:
+                    raise CassetteError('No recorded response for {} {}'.format(request.method, request.url))
+
+                LOG.debug('No exact match for %s %s, using the next response for the same path',
+                          request.method, request.url)
+                index = unused[0]
+
+            self.last[key] = index
+            self.used.add(index)
+
+        return self.cassette.http[index]
+
+class RecordingAdapter(ThrottledAdapter):
+    """
+    Transport adapter recording every request and response into a cassette
+    """
+    def __init__(self, cassette, **kwargs):
+        """
+        :param cassette: `Cassette` object
+        :param kwargs: passed to `ThrottledAdapter`
+        """
+        super(RecordingAdapter, self).__init__(**kwargs)
+        self.cassette = cassette
+
+    def send_once(self, request, **kwargs):
+        started = time.time()
+        response = super(RecordingAdapter, self).send_once(request, **kwargs)
+        self.cassette.record_http(self.upstream, request, response, time.time() - started)
+        return response
+
+class ReplayAdapter(ThrottledAdapter):
+    """
+    Transport adapter answering requests from a cassette without network access, recording them
+    into another cassette so they can be compared
+    """
+    def __init__(self, player, cassette, latency=False, **kwargs):
+        """
+        :param player: `CassettePlayer` object
+        :param cassette: `Cassette` object to record the replayed requests into
+        :param latency: True to take as long as each request did when recorded
+        :param kwargs: passed to `ThrottledAdapter`
+        """
+        super(ReplayAdapter, self).__init__(**kwargs)
+        self.player = player
+        self.cassette = cassette
+        self.latency = latency
+
+    def send_once(self, request, **kwargs):
+        started = time.time()
+        interaction = self.player.respond(request)
+
+        if self.latency:
+            time.sleep(interaction['elapsed'])
+
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = from_text(interaction['response'])
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+
+        self.cassette.record_http(self.upstream, request, response, time.time() - started)
+        return response
+
+class RedisRecorder(object):
+    """
+    Proxy of a Redis client recording the commands of a sync pass into a cassette
+    """
+    def __init__(self, redis, cassette):
+        """
+        :param redis: `redis.StrictRedis` object
+        :param cassette: `Cassette` object
+        """
+        self.redis = redis
+        self.cassette = cassette
+
+    def __getattr__(self, name):
+        attr = getattr(self.redis, name)
+        if name not in READ_COMMANDS + WRITE_COMMANDS:
+            return attr
+
+        def command(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            self.cassette.record_redis(name, args, kwargs, result)
+            return result
+
+        return command
+
+    def pipeline(self, transaction=True):
+        return PipelineRecorder(self.redis.pipeline(transaction=transaction), self.cassette)
+
+class PipelineRecorder(object):
+    """
+    Proxy of a Redis pipeline, recording queued commands once their results are known
+    """
+    def __init__(self, pipe, cassette):
+        self.pipe = pipe
+        self.cassette = cassette
+        self.queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.queued = []
+        return self.pipe.__exit__(*args)
+
+    def __getattr__(self, name):
+        attr = getattr(self.pipe, name)
+        if name not in READ_COMMANDS + WRITE_COMMANDS:
+            return attr
+
+        def command(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if result is self.pipe:
+                self.queued.append((name, args, kwargs))
+                return self
+
+            # Commands sent straight away while watching keys
+            self.cassette.record_redis(name, args, kwargs, result)
+            return result
+
+        return command
+
+    def execute(self, *args, **kwargs):
+        queued, self.queued = self.queued, []
+        results = self.pipe.execute(*args, **kwargs)
+
+        for (name, command_args, command_kwargs), result in zip(queued, results):
+            self.cassette.record_redis(name, command_args, command_kwargs, result)
+
+        return results
+
+def compare(recorded, replayed):
+    """
+    :param recorded: `Cassette` object
+    :param replayed: `Cassette` object recorded while replaying it
+    :return: list of lines describing differences in the writes made to JIRA, Zendesk and Redis
+    """
+    lines = []
+
+    expected = recorded.mutations()
+    actual = replayed.mutations()
+    for (method, url, body), count in sorted(six.iteritems(expected - actual)):
+        lines.append('Missing request ({}x): {} {} {}'.format(count, method, url, body or ''))
+    for (method, url, body), count in sorted(six.iteritems(actual - expected)):
+        lines.append('Unexpected request ({}x): {} {} {}'.format(count, method, url, body or ''))
+
+    for key in sorted(set(recorded.written) | set(replayed.written)):
+        if key.startswith(VOLATILE_KEY_PREFIXES):
+            continue
+
+        if key not in replayed.written:
+            lines.append('Redis key not written: {} (recorded {!r})'.format(key, recorded.written[key]))
+        elif key not in recorded.written:
+            lines.append('Redis key unexpectedly written: {} = {!r}'.format(key, replayed.written[key]))
+        elif recorded.written[key] != replayed.written[key]:
+            lines.append('Redis key {} written as {!r}, recorded {!r}'.format(
+                key, replayed.written[key], recorded.written[key]))
+
+    return lines
+
+def report(recorded, replayed):
+    """
+    :param recorded: `Cassette` object
+    :param replayed: `Cassette` object recorded while replaying it
+    :return: list of lines comparing the calls and time taken per endpoint
+    """
+    endpoints = collections.defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    for column, cassette in enumerate((recorded, replayed)):
+        for interaction in cassette.http:
+            values = endpoints[(interaction['upstream'], endpoint_name(interaction['method'], interaction['url']))]
+            values[column] += 1
+            values[column + 2] += interaction['elapsed']
+
+    lines = ['{:<8} {:<56} {:>8} {:>8} {:>10} {:>10}'.format(
+        'upstream', 'endpoint', 'recorded', 'replayed', 'rec ms', 'replay ms')]
+
+    for (upstream, endpoint), values in sorted(six.iteritems(endpoints), key=lambda x: -x[1][0]):
+        lines.append('{:<8} {:<56} {:>8} {:>8} {:>10.1f} {:>10.1f}'.format(
+            upstream or '-', endpoint, values[0], values[1], values[2] * 1000, values[3] * 1000))
+
+    lines.append('{:<8} {:<56} {:>8} {:>8} {:>10.1f} {:>10.1f}'.format(
+        '', 'total', len(recorded.http), len(replayed.http),
+        1000 * sum(x[2] for x in endpoints.values()), 1000 * sum(x[3] for x in endpoints.values())))
+    lines.append('Pass took {:.2f}s when recorded, {:.2f}s replayed'.format(recorded.elapsed or 0,
+                                                                             replayed.elapsed or 0))
+
+    return lines
+
+def is_mutation(method, url):
+    """
+    :return: True if a request writes to an upstream, searches sent as POST are reads
+    """
+    return method not in ('GET', 'HEAD') and '/search' not in urlparse(url).path
+
+def path_key(method, url):
+    return method, urlparse(url).path
+
+def normalize_body(body):
+    """
+    :param body: request body as bytes, text or None
+    :return: text with JSON bodies in a canonical form, so equal payloads match
+    """
+    if body is None:
+        return None
+
+    text = to_text(body)
+    if not isinstance(text, six.string_types):
+        return text
+
+    try:
+        return json.dumps(json.loads(text), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        return text
+
+def to_text(value):
+    """
+    :param value: bytes, text, number or None
+    :return: JSON serializable value, binary data is base64 encoded
+    """
+    if value is None or isinstance(value, six.text_type):
+        return value
+
+    if not isinstance(value, six.binary_type):
+        value = encode(value)
+
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return dict(base64=base64.b64encode(value).decode('ascii'))
+
+def from_text(value):
+    """
+    :param value: value returned by `to_text`
+    :return: bytes, or None
+    """
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return base64.b64decode(value['base64'])
+    return value.encode('utf-8')
+
+def ignored(key):
+    return key.startswith(IGNORED_KEY_PREFIXES)
+
+def open_file(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
@@ -0,0 +1,275 @@
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+import six
+from six.moves.urllib.parse import urlparse
+
+from jzb import LOG
+from jzb.metrics import METRICS, endpoint_name
+from jzb.profiling import count_api_call
+
+# Attributes API clients commonly use to hold their `requests.Session`
+SESSION_ATTRS = ('_session', 'session')
+
+# Headers used by Zendesk and JIRA to report the remaining request budget
+REMAINING_HEADERS = ('X-Rate-Limit-Remaining', 'X-RateLimit-Remaining')
+RESET_HEADERS = ('ratelimit-reset', 'X-RateLimit-Reset')
+
+# Endpoint classes that can be given separate budgets
+ENDPOINT_CLASSES = ('search', 'read', 'write')
+
+def find_session(client):
+    """
+    Finds the `requests.Session` used by an API client, if it exposes one
+
+    :param client: API client object, such as `jira.JIRA`
+    :return: `requests.Session` object or None
+    """
+    for attr in SESSION_ATTRS:
+        session = getattr(client, attr, None)
+        if session is not None and hasattr(session, 'mount'):
+            return session
+
+    return None
+
+def configure_client(client, url, max_connections=None, limiter=None, upstream=None, adapter_factory=None):
+    """
+    Mounts a `ThrottledAdapter` on the session of an API client
+
+    :param client: API client object
+    :param url: base URL of the host
+    :param max_connections: optional maximum number of concurrent connections to the host
+    :param limiter: optional `RateLimiter` object
+    :param upstream: optional name of the upstream, such as `jira`, to record request metrics under
+    :param adapter_factory: optional callable taking the same arguments as `ThrottledAdapter`, used to
+                            mount a subclass such as those recording or replaying cassettes
+    :return: True if the adapter could be mounted
+    """
+    if not max_connections and not limiter and not upstream and not adapter_factory:
+        return False
+
+    session = find_session(client)
+    if session is None:
+        LOG.warning('Could not find HTTP session for %s, limits not applied', url)
+        return False
+
+    adapter_factory = adapter_factory or ThrottledAdapter
+    session.mount(url, adapter_factory(max_connections=max_connections, limiter=limiter, upstream=upstream))
+
+    LOG.debug('Applied limits to %s', url)
+    return True
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket, shared by every worker calling the same class of endpoint
+    """
+    def __init__(self, rate=None, capacity=None):
+        """
+        :param rate: tokens added per second, or None for no limit
+        :param capacity: maximum number of tokens, defaults to one second worth of tokens
+        """
+        self.rate = float(rate) if rate else None
+        self.capacity = capacity or max(1.0, self.rate or 1.0)
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available
+
+        :return: seconds spent waiting
+        """
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                now = time.time()
+                self.refill(now)
+
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.rate is None:
+                    return waited
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+    def block(self, seconds):
+        """
+        Prevents any tokens being handed out for the given number of seconds
+
+        :param seconds: duration of the block
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+            self.tokens = 0
+
+    def refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateLimiter(object):
+    """
+    Token buckets for a single upstream, one per endpoint class
+    """
+    def __init__(self, upstream, rates=None, low_water=5, max_retries=3):
+        """
+        :param upstream: name of the upstream, such as `jira` or `zendesk`
+        :param rates: dict of endpoint class to requests per second, missing classes are unlimited
+        :param low_water: remaining budget reported by the upstream at which requests are paused
+        :param max_retries: number of times a rate limited request is retried
+        """
+        self.upstream = upstream
+        self.low_water = low_water
+        self.max_retries = max_retries
+
+        rates = rates or {}
+        self.buckets = {}
+        for endpoint_class in ENDPOINT_CLASSES:
+            self.buckets[endpoint_class] = TokenBucket(rates.get(endpoint_class))
+
+    def classify(self, method, url):
+        """
+        :param method: HTTP method
+        :param url: request URL
+        :return: endpoint class
+        """
+        path = urlparse(url).path
+        if '/search' in path:
+            return 'search'
+        if method in ('GET', 'HEAD'):
+            return 'read'
+        return 'write'
+
+    def observe(self, endpoint_class, response):
+        """
+        Slows down when the upstream reports its budget is nearly exhausted
+
+        :param endpoint_class: class of the endpoint that was called
+        :param response: `requests.Response` object
+        """
+        remaining = header_number(response, REMAINING_HEADERS)
+        if remaining is None or remaining > self.low_water:
+            return
+
+        delay = header_number(response, RESET_HEADERS) or 1.0
+        LOG.debug('%s reports %d requests remaining, pausing %s requests for %.1fs',
+                  self.upstream, remaining, endpoint_class, delay)
+        self.buckets[endpoint_class].block(delay)
+
+class ThrottledAdapter(HTTPAdapter):
+    """
+    Transport adapter that bounds concurrent connections and applies a `RateLimiter`
+
+    Rate limited responses are retried after the delay given by `Retry-After`, during which every
+    other request to the same class of endpoint is held back too. When an upstream name is given,
+    the count, latency and errors of requests are recorded per endpoint.
+    """
+    def __init__(self, max_connections=None, limiter=None, upstream=None):
+        """
+        :param max_connections: optional maximum number of concurrent connections
+        :param limiter: optional `RateLimiter` object
+        :param upstream: optional name of the upstream to record request metrics under
+        """
+        if max_connections:
+            super(ThrottledAdapter, self).__init__(pool_connections=1, pool_maxsize=max_connections,
+                                                   pool_block=True)
+        else:
+            super(ThrottledAdapter, self).__init__()
+
+        self.limiter = limiter
+        self.upstream = upstream
+
+    def send(self, request, **kwargs):
+        if not self.limiter:
+            return self.send_measured(request, **kwargs)
+
+        endpoint_class = self.limiter.classify(request.method, request.url)
+        bucket = self.limiter.buckets[endpoint_class]
+
+        attempt = 0
+        while True:
+            bucket.acquire()
+
+            response = self.send_measured(request, **kwargs)
+            self.limiter.observe(endpoint_class, response)
+
+            if response.status_code != 429 or attempt >= self.limiter.max_retries:
+                return response
+
+            attempt += 1
+            delay = header_number(response, ('Retry-After',)) or 2 ** attempt
+
+            LOG.warning('Rate limited by %s, retrying %s request in %.1fs',
+                        self.limiter.upstream, endpoint_class, delay)
+            bucket.block(delay)
+            response.close()
+
+    def send_measured(self, request, **kwargs):
+        if not self.upstream:
+            return self.send_once(request, **kwargs)
+
+        count_api_call(self.upstream)
+
+        endpoint = endpoint_name(request.method, request.url)
+        started = time.time()
+
+        try:
+            response = self.send_once(request, **kwargs)
+        except Exception:
+            METRICS.inc('jzb_api_errors_total', upstream=self.upstream, endpoint=endpoint)
+            raise
+        finally:
+            METRICS.observe('jzb_api_request_seconds', time.time() - started,
+                            upstream=self.upstream, endpoint=endpoint)
+
+        METRICS.inc('jzb_api_requests_total', upstream=self.upstream, endpoint=endpoint,
+                    status=response.status_code)
+        if response.status_code >= 400:
+            METRICS.inc('jzb_api_errors_total', upstream=self.upstream, endpoint=endpoint)
+
+        return response
+
+    def send_once(self, request, **kwargs):
+        return super(ThrottledAdapter, self).send(request, **kwargs)
+
+def header_number(response, names):
+    """
+    :param response: `requests.Response` object
+    :param names: header names to try, in order
+    :return: numeric value of the first header present, or None
+    """
+    for name in names:
+        value = response.headers.get(name)
+        if value is None:
+            continue
+
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            LOG.debug('Ignoring non-numeric %s header: %s', name, value)
+
+    return None
+
+def build_rate_limiters(config):
+    """
+    :param config: object
+    :return: dict of upstream name to `RateLimiter` objects, from the `rate_limits` config key
+    """
+    results = {}
+
+    for upstream, rates in six.iteritems(getattr(config, 'rate_limits', None) or {}):
+        results[upstream] = RateLimiter(upstream, rates,
+                                        low_water=getattr(config, 'rate_limit_low_water', 5),
+                                        max_retries=getattr(config, 'rate_limit_max_retries', 3))
+
+    return results
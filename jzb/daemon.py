@@ -0,0 +1,128 @@
+import signal
+import threading
+import time
+
+from jzb import LOG
+from jzb.metrics import METRICS
+
+class Daemon(object):
+    """
+    Runs sync passes in a loop, keeping the bridge and its HTTP sessions alive between passes
+
+    The interval between passes halves after a pass that changed something, down to the minimum,
+    and doubles after a quiet pass, up to the maximum.
+    """
+    def __init__(self, bridge, sync_pass, min_interval=30, max_interval=600, feed=None):
+        """
+        :param bridge: `Bridge` object
+        :param sync_pass: callable that runs a single pass and returns a `SyncStats` object
+        :param min_interval: minimum number of seconds between passes
+        :param max_interval: maximum number of seconds between passes
+        :param feed: optional `jzb.feed.ZendeskChangeFeed` object consumed before each pass
+        """
+        self.bridge = bridge
+        self.sync_pass = sync_pass
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.feed = feed
+
+        self.interval = min_interval
+        self.stopping = threading.Event()
+
+        self.passes = 0
+        self.last_pass_started = None
+        self.last_pass_duration = None
+        self.last_completed_pass_started = None
+
+    @property
+    def lag(self):
+        """
+        Seconds since the start of the last completed pass, changes older than this are synced
+        """
+        if self.last_completed_pass_started is None:
+            return None
+        return time.time() - self.last_completed_pass_started
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+        LOG.info('Starting daemon, interval between %.1fs and %.1fs', self.min_interval, self.max_interval)
+
+        while not self.stopping.is_set():
+            changed = self.run_pass()
+
+            if self.stopping.is_set():
+                break
+
+            self.adapt_interval(changed)
+            LOG.info('Next pass in %.1fs', self.interval)
+
+            self.stopping.wait(self.interval)
+
+        LOG.info('Daemon stopped')
+
+    def run_pass(self):
+        """
+        Runs the change feed, if any, followed by a sync pass
+
+        :return: number of issue/ticket pairs changed by the pass
+        """
+        started = time.time()
+        self.last_pass_started = started
+        changed = 0
+        interrupted = False
+
+        try:
+            if self.feed:
+                keys = self.feed.poll()
+                if keys:
+                    stats = self.bridge.sync_keys(keys)
+                    changed += stats.changed
+                    interrupted = stats.interrupted
+
+                if not interrupted:
+                    self.feed.commit()
+
+            if not interrupted:
+                stats = self.sync_pass()
+                changed += stats.changed
+                interrupted = stats.interrupted
+        except Exception:
+            LOG.exception('Sync pass failed')
+            interrupted = True
+
+        self.passes += 1
+        self.last_pass_duration = time.time() - started
+
+        if not interrupted:
+            self.last_completed_pass_started = started
+
+        METRICS.inc('jzb_passes_total')
+        METRICS.set('jzb_pass_seconds', self.last_pass_duration)
+        METRICS.set('jzb_lag_seconds', self.lag or 0)
+
+        LOG.info('Pass %d took %.2fs, %d pairs changed, lag %.2fs',
+                 self.passes, self.last_pass_duration, changed, self.lag or 0)
+
+        return changed
+
+    def adapt_interval(self, changed):
+        """
+        :param changed: number of pairs changed by the last pass
+        """
+        if changed:
+            self.interval = max(self.min_interval, self.interval / 2.0)
+        else:
+            self.interval = min(self.max_interval, self.interval * 2.0)
+
+    def stop(self):
+        """
+        Stops the daemon after the issues currently being synced have finished
+        """
+        self.stopping.set()
+        self.bridge.stop_requested.set()
+
+    def handle_signal(self, signum, frame):
+        LOG.info('Received signal %d, shutting down gracefully', signum)
+        self.stop()
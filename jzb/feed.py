@@ -0,0 +1,105 @@
+import re
+import time
+
+import six
+
+from jzb import LOG
+
+CURSOR_KEY = 'zd_export_cursor'
+
+ISSUE_KEY_PATTERN = re.compile(r'^[A-Z][A-Z0-9_]*-\d+$')
+
+class ZendeskChangeFeed(object):
+    """
+    Consumes Zendesk's incremental ticket export to find issue/ticket pairs changed on the Zendesk side
+
+    The export cursor is persisted in Redis and only advanced by `commit`, so changes are not lost
+    if syncing the affected pairs is interrupted.
+    """
+    def __init__(self, zd_api, redis, lookback=3600, max_pages=10, cursor_key=CURSOR_KEY, key_filter=None):
+        """
+        :param zd_api: `jzb.zdapi.ZendeskApi` object
+        :param redis: `redis.StrictRedis` object
+        :param lookback: seconds of history to export when no cursor has been persisted yet
+        :param max_pages: maximum number of export pages to consume per poll
+        :param cursor_key: Redis key the cursor is persisted under, so each partition keeps its own
+        :param key_filter: optional callable returning True for the issue keys this node syncs
+        """
+        self.zd_api = zd_api
+        self.redis = redis
+        self.lookback = lookback
+        self.max_pages = max_pages
+        self.cursor_key = cursor_key
+        self.key_filter = key_filter
+        self.pending_cursor = None
+
+    def poll(self):
+        """
+        Reads the changes exported since the persisted cursor
+
+        :return: set of JIRA issue keys whose tickets changed
+        """
+        cursor = self.redis.get(self.cursor_key)
+        if cursor:
+            cursor = cursor.decode('utf-8') if isinstance(cursor, six.binary_type) else cursor
+
+        tickets = []
+        for _ in range(self.max_pages):
+            if cursor:
+                data = self.zd_api.incremental_tickets(cursor=cursor)
+            else:
+                data = self.zd_api.incremental_tickets(start_time=time.time() - self.lookback)
+
+            tickets.extend(data['tickets'])
+
+            # Zendesk returns a null cursor when nothing has changed since the last page
+            cursor = data.get('after_cursor') or cursor
+            if data.get('end_of_stream'):
+                break
+
+        self.pending_cursor = cursor
+
+        keys = self.map_issue_keys(tickets)
+        if self.key_filter:
+            keys = set(key for key in keys if self.key_filter(key))
+        LOG.debug('Zendesk change feed returned %d tickets for %d issues', len(tickets), len(keys))
+
+        return keys
+
+    def commit(self):
+        """
+        Persists the cursor reached by the last poll, once its changes have been synced
+        """
+        if self.pending_cursor:
+            self.redis.set(self.cursor_key, self.pending_cursor)
+            self.pending_cursor = None
+
+    def map_issue_keys(self, tickets):
+        """
+        :param tickets: list of decoded ticket JSON
+        :return: set of JIRA issue keys
+        """
+        return map_ticket_issue_keys(self.redis, tickets)
+
+def map_ticket_issue_keys(redis, tickets):
+    """
+    Maps Zendesk tickets back to JIRA issue keys, using the reverse index of ticket mappings and
+    falling back to the ticket's external_id
+
+    :param redis: `redis.StrictRedis` object
+    :param tickets: list of dicts with `id` and optionally `external_id` keys
+    :return: set of JIRA issue keys
+    """
+    if not tickets:
+        return set()
+
+    index_keys = ['zd_ticket_issue:{}'.format(ticket['id']) for ticket in tickets]
+
+    keys = set()
+    for ticket, issue_key in zip(tickets, redis.mget(index_keys)):
+        if issue_key:
+            keys.add(issue_key.decode('utf-8') if isinstance(issue_key, six.binary_type) else issue_key)
+        elif ticket.get('external_id') and ISSUE_KEY_PATTERN.match(ticket['external_id']):
+            keys.add(ticket['external_id'])
+
+    return keys
@@ -0,0 +1,166 @@
+import os
+import socket
+import time
+import uuid
+import zlib
+
+from redis.exceptions import WatchError
+import six
+
+from jzb import LOG
+
+LEASE_KEY_FORMAT = 'lease:{}'
+TOKEN_KEY_FORMAT = 'lease_token:{}'
+
+class LeaseLost(Exception):
+    """
+    Raised when a node no longer holds the lease on a pair it is syncing
+    """
+
+class Lease(object):
+    """
+    Lease on a single issue/ticket pair, identified by a fencing token that increases each time the
+    pair is leased
+    """
+    def __init__(self, key, token, value, deadline):
+        self.key = key
+        self.token = token
+        self.value = value
+        self.deadline = deadline
+
+    @property
+    def lease_key(self):
+        return LEASE_KEY_FORMAT.format(self.key)
+
+    @property
+    def token_key(self):
+        return TOKEN_KEY_FORMAT.format(self.key)
+
+class LeaseManager(object):
+    """
+    Coordinates nodes sharing the same Redis, so only one node syncs a pair at a time
+
+    Leases expire unless renewed, so pairs held by a node that died are picked up by others. Each
+    lease carries a fencing token, and state writes are only applied while the token is still the
+    latest one issued for the pair, so a node that stalled past its lease cannot overwrite the work
+    of the node that took over.
+    """
+    def __init__(self, redis, ttl=60, node_id=None):
+        """
+        :param redis: `redis.StrictRedis` object
+        :param ttl: seconds a lease is held for without being renewed
+        :param node_id: name of this node, defaults to the host name and process ID
+        """
+        self.redis = redis
+        self.ttl = ttl
+        self.node_id = node_id or '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    def acquire(self, key):
+        """
+        :param key: JIRA issue key
+        :return: `Lease` object, or None if another node holds the lease
+        """
+        lease_key = LEASE_KEY_FORMAT.format(key)
+        value = '{}:{}'.format(self.node_id, uuid.uuid4().hex)
+
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lease_key)
+                if pipe.exists(lease_key):
+                    return None
+
+                deadline = time.time() + self.ttl
+
+                pipe.multi()
+                pipe.incr(TOKEN_KEY_FORMAT.format(key))
+                pipe.set(lease_key, value, px=int(self.ttl * 1000))
+                token = pipe.execute()[0]
+            except WatchError:
+                return None
+
+        return Lease(key, token, value, deadline)
+
+    def check(self, lease):
+        """
+        Raises `LeaseLost` if the lease may have expired, renewing it once half its time has passed
+
+        :param lease: `Lease` object
+        """
+        remaining = lease.deadline - time.time()
+        if remaining <= 0:
+            raise LeaseLost('Lease expired on {}'.format(lease.key))
+
+        if remaining < self.ttl / 2.0:
+            self.renew(lease)
+
+    def renew(self, lease):
+        """
+        :param lease: `Lease` object
+        """
+        deadline = time.time() + self.ttl
+
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lease.lease_key)
+                if _text(pipe.get(lease.lease_key)) != lease.value:
+                    raise LeaseLost('Lease taken over on {}'.format(lease.key))
+
+                pipe.multi()
+                pipe.pexpire(lease.lease_key, int(self.ttl * 1000))
+                pipe.execute()
+            except WatchError:
+                raise LeaseLost('Lease taken over on {}'.format(lease.key))
+
+        lease.deadline = deadline
+
+    def release(self, lease):
+        """
+        :param lease: `Lease` object
+        """
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lease.lease_key)
+                if _text(pipe.get(lease.lease_key)) != lease.value:
+                    return
+
+                pipe.multi()
+                pipe.delete(lease.lease_key)
+                pipe.execute()
+            except WatchError:
+                LOG.debug('Lease on %s changed while releasing it', lease.key)
+
+    def execute_fenced(self, lease, writes):
+        """
+        Applies writes atomically, only if the lease's fencing token is still the latest one
+
+        :param lease: `Lease` object
+        :param writes: list of tuples of Redis command name and arguments
+        """
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(lease.token_key)
+                if _text(pipe.get(lease.token_key)) != _text(lease.token):
+                    raise LeaseLost('Fencing token superseded on {}'.format(lease.key))
+
+                pipe.multi()
+                for write in writes:
+                    getattr(pipe, write[0])(*write[1:])
+                pipe.execute()
+            except WatchError:
+                raise LeaseLost('Fencing token superseded on {}'.format(lease.key))
+
+def in_partition(key, index, count):
+    """
+    :param key: JIRA issue key
+    :param index: index of the partition, from 0 to count - 1
+    :param count: number of partitions
+    :return: True if the key belongs to the given partition
+    """
+    return count <= 1 or zlib.crc32(key.encode('utf-8')) % count == index
+
+def _text(value):
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8')
+    if value is None:
+        return None
+    return six.text_type(value)
@@ -0,0 +1,215 @@
+import collections
+import fnmatch
+import threading
+import time
+
+from redis.exceptions import WatchError
+import six
+
+class MemoryRedis(object):
+    """
+    Implements the Redis commands used by the bridge in memory, counting commands and round trips
+    """
+    def __init__(self, latency=0.0):
+        """
+        :param latency: seconds each round trip takes
+        """
+        self.latency = latency
+        self.values = {}
+        self.expiry = {}
+        self.versions = collections.Counter()
+        self.commands = 0
+        self.round_trips = 0
+        self.lock = threading.RLock()
+
+    def round_trip(self, commands=1):
+        with self.lock:
+            self.commands += commands
+            self.round_trips += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_counters(self):
+        with self.lock:
+            self.commands = 0
+            self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+    def lookup(self, key):
+        key = encode(key)
+        if key in self.expiry and self.expiry[key] <= time.time():
+            # Keys already expired when watched do not abort transactions
+            self.values.pop(key, None)
+            self.expiry.pop(key, None)
+        return self.values.get(key)
+
+    def store(self, key, value):
+        key = encode(key)
+        self.values[key] = value
+        self.expiry.pop(key, None)
+        self.versions[key] += 1
+
+    def run(self, name, *args, **kwargs):
+        with self.lock:
+            return getattr(self, 'do_' + name)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if not hasattr(type(self), 'do_' + name):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.round_trip()
+            return self.run(name, *args, **kwargs)
+
+        return command
+
+    def do_get(self, key):
+        return self.lookup(key)
+
+    def do_mget(self, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        return [self.lookup(x) for x in keys + list(args)]
+
+    def do_set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        exists = self.lookup(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+
+        self.store(key, encode(value))
+        if ex:
+            self.expiry[encode(key)] = time.time() + ex
+        elif px:
+            self.expiry[encode(key)] = time.time() + px / 1000.0
+        return True
+
+    def do_delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self.lookup(key) is not None:
+                deleted += 1
+            self.values.pop(encode(key), None)
+            self.expiry.pop(encode(key), None)
+            self.versions[encode(key)] += 1
+        return deleted
+
+    def do_exists(self, key):
+        return int(self.lookup(key) is not None)
+
+    def do_incr(self, key):
+        value = int(self.lookup(key) or 0) + 1
+        expiry = self.expiry.get(encode(key))
+        self.store(key, encode(value))
+        if expiry:
+            self.expiry[encode(key)] = expiry
+        return value
+
+    def do_expire(self, key, seconds):
+        return self.do_pexpire(key, seconds * 1000)
+
+    def do_pexpire(self, key, milliseconds):
+        if self.lookup(key) is None:
+            return False
+        self.expiry[encode(key)] = time.time() + milliseconds / 1000.0
+        self.versions[encode(key)] += 1
+        return True
+
+    def do_ttl(self, key):
+        if self.lookup(key) is None:
+            return -2
+        if encode(key) not in self.expiry:
+            return -1
+        return int(self.expiry[encode(key)] - time.time())
+
+    def do_scan_iter(self, match=None, count=None):
+        keys = [x for x in list(self.values) if self.lookup(x) is not None]
+        if match is not None:
+            keys = [x for x in keys if fnmatch.fnmatchcase(x.decode('utf-8'), match)]
+        return iter(sorted(keys))
+
+    def do_sadd(self, key, *members):
+        members = set(encode(x) for x in members)
+        current = self.lookup(key) or set()
+        added = len(members - current)
+        self.store(key, current | members)
+        return added
+
+    def do_sismember(self, key, member):
+        return encode(member) in (self.lookup(key) or set())
+
+    def do_spop(self, key, count=None):
+        current = set(self.lookup(key) or set())
+        popped = [current.pop() for _ in range(min(count or 1, len(current)))]
+        if current:
+            self.store(key, current)
+        else:
+            self.do_delete(key)
+        return popped if count is not None else (popped[0] if popped else None)
+
+class MemoryPipeline(object):
+    """
+    Pipeline of `MemoryRedis`, supporting optimistic transactions with WATCH and MULTI
+    """
+    def __init__(self, redis):
+        self.redis = redis
+        self.watched = {}
+        self.queued = []
+        self.buffering = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.reset()
+
+    def reset(self):
+        self.watched = {}
+        self.queued = []
+        self.buffering = True
+
+    def watch(self, *keys):
+        self.redis.round_trip()
+        with self.redis.lock:
+            for key in keys:
+                self.watched[encode(key)] = self.redis.versions[encode(key)]
+        self.buffering = False
+
+    def multi(self):
+        self.buffering = True
+
+    def execute(self):
+        queued, self.queued = self.queued, []
+        self.redis.round_trip(len(queued) or 1)
+
+        with self.redis.lock:
+            for key, version in six.iteritems(self.watched):
+                if self.redis.versions[key] != version:
+                    self.watched = {}
+                    raise WatchError('Watched variable changed')
+
+            self.watched = {}
+            return [self.redis.run(name, *args, **kwargs) for name, args, kwargs in queued]
+
+    def __getattr__(self, name):
+        if not hasattr(MemoryRedis, 'do_' + name):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            if not self.buffering:
+                # Commands between WATCH and MULTI run immediately
+                self.redis.round_trip()
+                return self.redis.run(name, *args, **kwargs)
+
+            self.queued.append((name, args, kwargs))
+            return self
+
+        return command
+
+def encode(value):
+    if isinstance(value, six.binary_type):
+        return value
+    if isinstance(value, float):
+        value = repr(value)
+    return six.text_type(value).encode('utf-8')
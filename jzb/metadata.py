@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import six
+
+from jzb import LOG
+from jzb.util import objectize
+
+KEY_FORMAT = 'jzb_metadata:{}'
+
+class MetadataRegistry(object):
+    """
+    Snapshot of the Zendesk and JIRA metadata used by the bridge, such as groups and ticket fields
+
+    The snapshot is kept in Redis or a local file for a limited time, so restarts do not need to
+    fetch it again, and is indexed by ID and name. A lookup that misses refreshes the snapshot, so
+    groups and forms created since it was taken resolve without a restart.
+    """
+    def __init__(self, jira_client, zd_client, redis=None, location='redis', ttl=3600, miss_interval=60,
+                 scope=''):
+        """
+        :param jira_client: `jira.JIRA` object
+        :param zd_client: `zendesk.Client` object
+        :param redis: optional `redis.StrictRedis` object, used when the location is `redis`
+        :param location: `redis`, the path of a JSON file, or None to keep the snapshot in memory
+        :param ttl: seconds a snapshot is used before it is fetched again
+        :param miss_interval: minimum seconds between refreshes caused by lookups that miss
+        :param scope: string identifying the upstreams and identities, so snapshots are not shared
+                      between bridges talking to different instances
+        """
+        self.jira_client = jira_client
+        self.zd_client = zd_client
+        self.redis = redis
+        self.location = location
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self.key = KEY_FORMAT.format(hashlib.sha1(scope.encode('utf-8')).hexdigest()[:12])
+
+        self.lock = threading.Lock()
+        self.fetched_at = 0
+
+        self.zd_identity = None
+        self.jira_identity = None
+        self.groups = []
+        self.ticket_fields = []
+        self.ticket_forms = []
+
+        self.groups_by_id = {}
+        self.groups_by_name = {}
+        self.forms_by_name = {}
+
+    def load(self):
+        """
+        Uses the stored snapshot if it is still fresh, otherwise fetches a new one
+        """
+        snapshot = self.read()
+        if snapshot and snapshot['fetched_at'] + self.ttl > time.time():
+            LOG.debug('Using metadata snapshot taken %.0fs ago', time.time() - snapshot['fetched_at'])
+            self.index(snapshot)
+        else:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Fetches and stores a new snapshot
+        """
+        LOG.info('Fetching Zendesk and JIRA metadata')
+
+        snapshot = self.fetch()
+        self.index(snapshot)
+        self.write(snapshot)
+
+    def refresh_if_stale(self):
+        """
+        Fetches a new snapshot once the current one has expired
+        """
+        if self.fetched_at + self.ttl <= time.time():
+            self.refresh()
+
+    def fetch(self):
+        """
+        :return: dict of metadata, holding only the attributes used by the bridge
+        """
+        zd_identity = self.zd_client.current_user
+
+        return dict(
+            fetched_at=time.time(),
+            zd_identity=dict(id=zd_identity.id, name=getattr(zd_identity, 'name', None)),
+            jira_identity=self.jira_client.current_user(),
+            groups=[dict(id=x.id, name=x.name) for x in self.zd_client.assignable_groups],
+            ticket_fields=[dict(id=x.id, name=x.name, active=x.active) for x in self.zd_client.ticket_fields],
+            ticket_forms=[dict(id=x.id, name=x.name) for x in self.zd_client.ticket_forms],
+        )
+
+    def index(self, snapshot):
+        """
+        :param snapshot: dict of metadata returned by `fetch`
+        """
+        groups = [objectize(x) for x in snapshot['groups']]
+        ticket_forms = [objectize(x) for x in snapshot['ticket_forms']]
+
+        with self.lock:
+            self.fetched_at = snapshot['fetched_at']
+
+            self.zd_identity = objectize(snapshot['zd_identity'])
+            self.jira_identity = snapshot['jira_identity']
+            self.groups = groups
+            self.ticket_fields = [objectize(x) for x in snapshot['ticket_fields']]
+            self.ticket_forms = ticket_forms
+
+            # First match wins, as with the linear scans these replace
+            self.groups_by_id = dict((x.id, x) for x in reversed(groups))
+            self.groups_by_name = dict((x.name, x) for x in reversed(groups))
+            self.forms_by_name = dict((x.name, x) for x in reversed(ticket_forms))
+
+    def read(self):
+        """
+        :return: stored snapshot dict, or None
+        """
+        try:
+            if self.location == 'redis':
+                value = self.redis.get(self.key)
+            elif self.location and os.path.exists(self.location):
+                with open(self.location, 'rb') as fp:
+                    value = fp.read()
+            else:
+                return None
+
+            if value:
+                return json.loads(value.decode('utf-8') if isinstance(value, six.binary_type) else value)
+        except Exception:
+            LOG.exception('Failed to read metadata snapshot, fetching it again')
+
+        return None
+
+    def write(self, snapshot):
+        """
+        :param snapshot: dict of metadata returned by `fetch`
+        """
+        value = json.dumps(snapshot)
+
+        try:
+            if self.location == 'redis':
+                self.redis.set(self.key, value, ex=self.ttl)
+            elif self.location:
+                # Renamed into place so other processes never read a partial file
+                temp_path = '{}.{}.tmp'.format(self.location, os.getpid())
+                with open(temp_path, 'w') as fp:
+                    fp.write(value)
+                os.rename(temp_path, self.location)
+        except Exception:
+            LOG.exception('Failed to store metadata snapshot')
+
+    def lookup(self, index_name, key):
+        """
+        Looks up an entry by ID or name, refreshing the snapshot once if it is missing
+
+        :param index_name: name of the index attribute
+        :param key: ID or name to look up
+        :return: object, or None if not found
+        """
+        result = getattr(self, index_name).get(key)
+        if result is not None:
+            return result
+
+        if self.fetched_at + self.miss_interval <= time.time():
+            LOG.debug('Metadata lookup missed, refreshing: %s', key)
+            self.refresh()
+            result = getattr(self, index_name).get(key)
+
+        return result
+
+    def find_group_by_id(self, id):
+        """
+        :param id: Integer id
+        :return: group object
+        """
+        group = self.lookup('groups_by_id', id)
+        if group is None:
+            raise ValueError('Could not find group by id: {}'.format(id))
+        return group
+
+    def find_group_by_name(self, name):
+        """
+        :param name: Name of the group to find
+        :return: group object
+        """
+        group = self.lookup('groups_by_name', name)
+        if group is None:
+            raise ValueError('Could not find group by name: {}'.format(name))
+        return group
+
+    def find_ticket_form_by_name(self, name):
+        """
+        :param name: Name of the ticket form to find
+        :return: ticket form object
+        """
+        form = self.lookup('forms_by_name', name)
+        if form is None:
+            raise ValueError('Could not find ticket form by name: {}'.format(name))
+        return form
@@ -0,0 +1,254 @@
+import contextlib
+import re
+import threading
+import time
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse
+
+from jzb import LOG
+
+# Upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Path segments holding IDs or issue keys, replaced so endpoints have a bounded number of labels
+ID_SEGMENT_PATTERN = re.compile(r'^([A-Z][A-Z0-9_]*-)?\d+(\.json)?$')
+
+HELP = {
+    'jzb_phase_seconds': 'Time spent in each phase of syncing an issue/ticket pair',
+    'jzb_action_seconds': 'Time spent performing each type of status action',
+    'jzb_api_request_seconds': 'Time spent on API requests, per upstream and endpoint',
+    'jzb_api_requests_total': 'API requests sent, per upstream, endpoint and status code',
+    'jzb_api_errors_total': 'API requests that failed or returned an error status',
+    'jzb_redis_round_trips_total': 'Round trips to Redis made through the state store',
+    'jzb_issues_total': 'Issue/ticket pairs synced, per result',
+    'jzb_issues_changed_total': 'Issue/ticket pairs the bridge wrote to either side of',
+    'jzb_passes_total': 'Sync passes run by the daemon',
+    'jzb_pass_seconds': 'Duration of the last sync pass',
+    'jzb_lag_seconds': 'Seconds since the start of the last completed pass',
+}
+
+class Metrics(object):
+    """
+    Thread safe counters, gauges and histograms, exposed in the Prometheus text format
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        """
+        :param name: name of the counter
+        :param amount: amount to add
+        :param labels: label values
+        """
+        key = (name, label_items(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """
+        :param name: name of the gauge
+        :param value: current value
+        :param labels: label values
+        """
+        with self.lock:
+            self.gauges[(name, label_items(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """
+        :param name: name of the histogram
+        :param value: observed value, in seconds
+        :param labels: label values
+        """
+        key = (name, label_items(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the time taken by the body of a `with` block, even if it raises
+
+        :param name: name of the histogram
+        :param labels: label values
+        """
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def render(self):
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted(set(key[0] for key in values)):
+                    add_header(lines, name, kind)
+                    for key in sorted(x for x in values if x[0] == name):
+                        lines.append('{}{} {}'.format(name, format_labels(key[1]), format_value(values[key])))
+
+            for name in sorted(set(key[0] for key in self.histograms)):
+                add_header(lines, name, 'histogram')
+                for key in sorted(x for x in self.histograms if x[0] == name):
+                    histogram = self.histograms[key]
+
+                    for bound, count in zip(BUCKETS + (float('inf'),), histogram.cumulative_counts()):
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append('{}_bucket{} {}'.format(name, format_labels(key[1] + (('le', le),)), count))
+
+                    lines.append('{}_sum{} {}'.format(name, format_labels(key[1]), format_value(histogram.total)))
+                    lines.append('{}_count{} {}'.format(name, format_labels(key[1]), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        :return: list of human readable lines, with the slowest histograms first
+        """
+        with self.lock:
+            histograms = sorted(self.histograms.items(), key=lambda x: x[1].total, reverse=True)
+            counters = sorted(self.counters.items())
+
+        lines = []
+        for (name, labels), histogram in histograms:
+            lines.append('{}{}: {} calls, {:.3f}s total, {:.1f}ms mean, {:.1f}ms max'.format(
+                name, format_labels(labels), histogram.count, histogram.total,
+                1000.0 * histogram.total / histogram.count, 1000.0 * histogram.maximum))
+
+        for (name, labels), value in counters:
+            lines.append('{}{}: {}'.format(name, format_labels(labels), format_value(value)))
+
+        return lines
+
+    def log_summary(self):
+        """
+        Logs the summary at the end of a one-shot run
+        """
+        for line in self.summary():
+            LOG.info('Metrics: %s', line)
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        index = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                index = i
+                break
+
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+        self.maximum = max(self.maximum, value)
+
+    def cumulative_counts(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+class MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Embedded HTTP listener serving metrics on `/metrics` for Prometheus to scrape
+    """
+    daemon_threads = True
+
+    def __init__(self, metrics, host='0.0.0.0', port=9090):
+        """
+        :param metrics: `Metrics` object
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), MetricsHandler)
+
+        self.metrics = metrics
+        self.thread = None
+
+    def start(self):
+        """
+        Serves requests from a background thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever, name='jzb-metrics')
+        self.thread.daemon = True
+        self.thread.start()
+
+        LOG.info('Serving metrics on port %d', self.server_address[1])
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if urlparse(self.path).path != '/metrics':
+            self.send_error(404)
+            return
+
+        data = self.server.metrics.render().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        LOG.debug('Metrics request: ' + format, *args)
+
+def endpoint_name(method, url):
+    """
+    :param method: HTTP method
+    :param url: request URL
+    :return: method and path with IDs and issue keys replaced, such as `GET /rest/api/2/issue/{id}`
+    """
+    segments = urlparse(url).path.split('/')
+
+    for i, segment in enumerate(segments):
+        # API versions such as `/rest/api/2` are kept
+        if ID_SEGMENT_PATTERN.match(segment) and not (i and segments[i - 1] == 'api'):
+            segments[i] = '{id}'
+
+    return '{} {}'.format(method, '/'.join(segments))
+
+def label_items(labels):
+    return tuple(sorted((k, six.text_type(v)) for k, v in six.iteritems(labels)))
+
+def format_labels(items):
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in items) + '}'
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def add_header(lines, name, kind):
+    if name in HELP:
+        lines.append('# HELP {} {}'.format(name, HELP[name]))
+    lines.append('# TYPE {} {}'.format(name, kind))
+
+# Shared by every component of the process, like `LOG`
+METRICS = Metrics()
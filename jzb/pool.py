@@ -0,0 +1,207 @@
+import collections
+from contextlib import contextmanager
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+from jzb import LOG
+
+# Interval used when blocking on queues and threads so the main thread can still receive CTRL+C
+POLL_INTERVAL = 0.5
+
+_SHUTDOWN = object()
+
+_ITEM = object()
+_ERROR = object()
+_DONE = object()
+
+class KeyLocks(object):
+    """
+    Tracks keys that are currently being processed, so the same key is never held by two threads
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.active = set()
+        self.releases = collections.Counter()
+
+    def generation(self, key):
+        """
+        :param key: hashable key, such as a JIRA issue key
+        :return: number of times the key has been released, which changes whenever another thread held it
+        """
+        with self.condition:
+            return self.releases[key]
+
+    @contextmanager
+    def hold(self, key):
+        """
+        Blocks until no other thread holds the given key, then holds it for the duration of the block
+
+        :param key: hashable key, such as a JIRA issue key
+        """
+        with self.condition:
+            while key in self.active:
+                self.condition.wait()
+            self.active.add(key)
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.active.discard(key)
+                self.releases[key] += 1
+                self.condition.notify_all()
+
+class WorkerPool(object):
+    """
+    Bounded pool of threads that processes keyed work items
+
+    Submitting blocks once the backlog is full, so the producer never runs far ahead of the workers.
+    """
+    def __init__(self, handler, size, backlog=None):
+        """
+        :param handler: callable invoked with each submitted item
+        :param size: number of worker threads
+        :param backlog: maximum number of items waiting for a worker, defaults to twice the size
+        """
+        self.handler = handler
+        self.size = size
+        self.queue = queue.Queue(maxsize=backlog or size * 2)
+        self.key_locks = KeyLocks()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self.run_worker, name='jzb-worker-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+
+            self.threads.append(thread)
+
+    def submit(self, key, item):
+        """
+        Queues an item for processing, blocking while the backlog is full
+
+        :param key: key that must not be processed concurrently
+        :param item: object passed to the handler
+        """
+        self._put((key, item))
+
+    def join(self):
+        """
+        Waits for all submitted items to be processed and for the workers to exit
+        """
+        for _ in self.threads:
+            self._put(_SHUTDOWN)
+
+        self._join_threads()
+
+    def stop(self):
+        """
+        Discards items that have not been started yet and waits for in-flight items to finish
+        """
+        self.stopping.set()
+
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+        self._join_threads()
+
+    def run_worker(self):
+        while True:
+            try:
+                work = self.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.stopping.is_set():
+                    return
+                continue
+
+            if work is _SHUTDOWN or self.stopping.is_set():
+                return
+
+            key, item = work
+            with self.key_locks.hold(key):
+                try:
+                    self.handler(item)
+                except Exception:
+                    LOG.exception('Unhandled error in worker for: %s', key)
+
+    def _put(self, work):
+        # Blocking without a timeout would make the main thread deaf to CTRL+C on Python 2
+        while True:
+            try:
+                self.queue.put(work, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                if self.stopping.is_set():
+                    return
+
+    def _join_threads(self):
+        for thread in self.threads:
+            while thread.is_alive():
+                thread.join(POLL_INTERVAL)
+
+class Prefetcher(object):
+    """
+    Consumes an iterable in a background thread, keeping a bounded number of items ready ahead of
+    the consumer
+
+    Errors raised while producing items are raised to the consumer once it reaches them.
+    """
+    def __init__(self, iterable, size=1):
+        """
+        :param iterable: iterable to consume, such as a generator of search result pages
+        :param size: maximum number of items buffered ahead of the consumer
+        """
+        self.iterable = iterable
+        self.queue = queue.Queue(maxsize=size)
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def __iter__(self):
+        self.thread = threading.Thread(target=self.run, name='jzb-prefetch')
+        self.thread.daemon = True
+        self.thread.start()
+
+        try:
+            while True:
+                try:
+                    kind, value = self.queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+
+                if kind is _DONE:
+                    return
+                if kind is _ERROR:
+                    six.reraise(*value)
+
+                yield value
+        finally:
+            # Lets the producer exit when the consumer stops early
+            self.stopping.set()
+
+    def run(self):
+        try:
+            for item in self.iterable:
+                if not self._put((_ITEM, item)):
+                    return
+        except Exception:
+            self._put((_ERROR, sys.exc_info()))
+        else:
+            self._put((_DONE, None))
+
+    def _put(self, entry):
+        while not self.stopping.is_set():
+            try:
+                self.queue.put(entry, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+
+        return False
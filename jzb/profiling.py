@@ -0,0 +1,167 @@
+import contextlib
+import cProfile
+import pstats
+import threading
+import time
+
+import six
+
+from jzb import LOG
+
+# Profile of the pair being synced by the current thread, if any
+_current = threading.local()
+
+def count_api_call(upstream):
+    """
+    Attributes an API call to the pair being synced by the current thread
+
+    :param upstream: name of the upstream, such as `jira`
+    """
+    profile = getattr(_current, 'profile', None)
+    if profile is not None:
+        profile.count_api_call(upstream)
+
+class IssueProfile(object):
+    """
+    Wall clock breakdown of syncing a single issue/ticket pair
+    """
+    def __init__(self, key):
+        self.key = key
+        self.ticket_id = None
+        self.phases = {}
+        self.api_calls = {}
+        self.comments = 0
+        self.action_iterations = 0
+        self.lock = threading.Lock()
+
+    def count_api_call(self, upstream):
+        with self.lock:
+            self.api_calls[upstream] = self.api_calls.get(upstream, 0) + 1
+
+    @property
+    def elapsed(self):
+        return sum(six.itervalues(self.phases))
+
+    @property
+    def slowest_phase(self):
+        if not self.phases:
+            return None
+        return max(self.phases, key=self.phases.get)
+
+class SyncProfiler(object):
+    """
+    Profiles a run of the bridge, both per function with cProfile and per issue/ticket pair
+
+    cProfile only follows the thread that enabled it, so each thread syncing a pair enables its own
+    profile around every phase and the profiles are merged for the report.
+    """
+    def __init__(self):
+        self.issues = {}
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    @contextlib.contextmanager
+    def track(self, ctx, phase):
+        """
+        Profiles a single phase of syncing a pair
+
+        :param ctx: `SyncContext` object
+        :param phase: name of the phase
+        """
+        with self.lock:
+            issue = self.issues.get(ctx.issue.key)
+            if issue is None:
+                issue = self.issues[ctx.issue.key] = IssueProfile(ctx.issue.key)
+
+            ident = threading.current_thread().ident
+            profile = self.profiles.get(ident)
+            if profile is None:
+                profile = self.profiles[ident] = cProfile.Profile()
+
+        try:
+            profile.enable()
+        except ValueError:
+            # Newer Pythons allow one active profiler per process, which then follows every thread
+            profile = None
+
+        _current.profile = issue
+        started = time.time()
+
+        try:
+            yield
+        finally:
+            elapsed = time.time() - started
+
+            _current.profile = None
+            if profile is not None:
+                profile.disable()
+
+            with issue.lock:
+                issue.phases[phase] = issue.phases.get(phase, 0) + elapsed
+                issue.ticket_id = ctx.ticket.id if ctx.ticket else issue.ticket_id
+                issue.comments = ctx.comments
+                issue.action_iterations = ctx.action_iterations
+
+    def stats(self):
+        """
+        :return: `pstats.Stats` object merging the profiles of every thread, or None
+        """
+        with self.lock:
+            profiles = [x for x in six.itervalues(self.profiles) if x.getstats()]
+
+        if not profiles:
+            return None
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        return stats
+
+    def report(self, top=20):
+        """
+        :param top: number of pairs and functions to list
+        :return: list of lines ranking the slowest pairs, followed by the functions with the most
+                 cumulative time
+        """
+        issues = sorted(six.itervalues(self.issues), key=lambda x: x.elapsed, reverse=True)
+
+        lines = ['Profiled {} pairs in {:.2f}s, slowest first:'.format(len(issues), time.time() - self.started),
+                 '{:<16} {:>10} {:>10} {:>6} {:>6} {:>9} {:>10}  {}'.format(
+                     'issue', 'ticket', 'ms', 'jira', 'zd', 'comments', 'iterations', 'slowest phase')]
+
+        for issue in issues[:top]:
+            lines.append('{:<16} {:>10} {:>10.1f} {:>6} {:>6} {:>9} {:>10}  {}'.format(
+                issue.key, issue.ticket_id or '-', issue.elapsed * 1000,
+                issue.api_calls.get('jira', 0), issue.api_calls.get('zendesk', 0),
+                issue.comments, issue.action_iterations, issue.slowest_phase or '-'))
+
+        stats = self.stats()
+        if stats:
+            stream = six.StringIO()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(top)
+            lines.append('')
+            lines.extend(stream.getvalue().strip('\n').splitlines())
+
+        return lines
+
+    def log_report(self, top=20):
+        for line in self.report(top):
+            LOG.info('%s', line)
+
+    def dump(self, path):
+        """
+        Writes the merged profile in the pstats format, readable by tools such as snakeviz or
+        flameprof
+
+        :param path: path of the file to write
+        """
+        stats = self.stats()
+        if stats is None:
+            LOG.warning('Nothing was profiled, not writing %s', path)
+            return
+
+        stats.dump_stats(path)
+        LOG.info('Wrote profile to %s', path)
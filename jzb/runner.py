@@ -1,15 +1,26 @@
 from argparse import ArgumentParser
+import functools
 import logging
 import sys
+import time
 
 import jira
-from redis import StrictRedis
+from redis import BlockingConnectionPool, StrictRedis
 import yaml
 import zendesk
 
 from jzb import LOG
 from jzb.bridge import Bridge
+from jzb.cassette import (Cassette, CassettePlayer, RecordingAdapter, RedisRecorder, ReplayAdapter, compare,
+                          report)
+from jzb.clients import build_rate_limiters, configure_client
+from jzb.daemon import Daemon
+from jzb.feed import CURSOR_KEY, ZendeskChangeFeed
+from jzb.metrics import METRICS, MetricsServer
+from jzb.profiling import SyncProfiler
 from jzb.util import objectize
+from jzb.webhook import QueueWorker, SyncQueue, WebhookServer
+from jzb.zdapi import ZendeskApi
 
 def configure_logger(level):
     handler = logging.StreamHandler(sys.stdout)
@@ -24,9 +35,46 @@ def main():
     parser.add_argument('-c', '--config-file', default='config.yml')
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-Q', '--query')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of issues to sync concurrently')
+    parser.add_argument('-F', '--full', action='store_true',
+                        help='Force a full pass when incremental sync is enabled')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='Sync every pair, even those whose fingerprint shows no change')
+    parser.add_argument('-Z', '--zd-feed', action='store_true',
+                        help='Sync issues whose tickets changed in the Zendesk change feed, '
+                             'instead of a pass or before each pass in daemon mode')
+    parser.add_argument('-d', '--daemon', action='store_true',
+                        help='Keep running passes with an adaptive interval until SIGTERM')
+    parser.add_argument('-W', '--webhooks', action='store_true',
+                        help='Listen for JIRA and Zendesk webhooks and sync the affected issues')
+    parser.add_argument('-M', '--migrate-comment-watermarks', action='store_true',
+                        help='Convert the legacy seen comment sets into per-pair comment watermarks and exit')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the run and report the slowest issue/ticket pairs and functions')
+    parser.add_argument('--profile-dump', metavar='PATH',
+                        help='Also write the profile in the pstats format to the given path')
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help='Number of pairs and functions listed in the profile report')
+    parser.add_argument('-P', '--partition', metavar='INDEX/COUNT',
+                        help='Only run passes and the change feed for one partition of the issue keys, '
+                             'such as 0/3 on the first of three nodes')
+    parser.add_argument('--record', metavar='PATH',
+                        help='Record every JIRA, Zendesk and Redis interaction of the pass into a cassette, '
+                             'compressed when the path ends with .gz')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='Run the pass against a recorded cassette without network access, reporting the '
+                             'calls made and failing if the writes differ from those recorded')
+    parser.add_argument('--replay-latency', action='store_true',
+                        help='Take as long to answer each replayed request as it took when recorded')
 
     args = parser.parse_args()
 
+    if args.record and args.replay:
+        parser.error('Cannot record and replay at the same time')
+    if (args.record or args.replay) and (args.daemon or args.webhooks):
+        parser.error('Cassettes can only be recorded or replayed for a single pass')
+
     if args.verbose:
         configure_logger(logging.DEBUG)
     else:
@@ -35,24 +83,180 @@ def main():
     with open(args.config_file) as fp:
         config = objectize(yaml.load(fp))
 
-    redis = StrictRedis(host=config.redis_host, port=config.redis_port)
+    cassette = recorded = None
+    if args.record or args.replay:
+        cassette = Cassette()
+
+        # Metadata is fetched on every run, so replays never depend on a snapshot that has since expired
+        config.metadata_cache = None
+
+    redis_max_connections = getattr(config, 'redis_max_connections', None)
+    if redis_max_connections:
+        redis = StrictRedis(connection_pool=BlockingConnectionPool(host=config.redis_host,
+                                                                   port=config.redis_port,
+                                                                   max_connections=redis_max_connections))
+    else:
+        redis = StrictRedis(host=config.redis_host, port=config.redis_port)
+
+    adapter_factory = None
+    if args.record:
+        adapter_factory = functools.partial(RecordingAdapter, cassette)
+    elif args.replay:
+        recorded = Cassette.load(args.replay)
+        adapter_factory = functools.partial(ReplayAdapter, CassettePlayer(recorded), cassette,
+                                            latency=args.replay_latency)
+
+        # Seeded with the values read by the recorded pass
+        redis = recorded.build_redis()
+
+    if cassette is not None:
+        redis = RedisRecorder(redis, cassette)
 
     jira_client = jira.JIRA(server=config.jira_url,
-                            basic_auth=(config.jira_username, config.jira_password))
+                            basic_auth=(config.jira_username, config.jira_password),
+                            get_server_info=not args.replay)
 
     zd_client = zendesk.Client(url=config.zd_url,
                                username=config.zd_username,
                                password=config.zd_password)
 
+    zd_api = ZendeskApi(url=config.zd_url,
+                        username=config.zd_username,
+                        password=config.zd_password)
+
+    # Limiters are shared by every client and worker talking to the same upstream
+    rate_limiters = build_rate_limiters(config)
+
+    mounted = configure_client(jira_client, config.jira_url,
+                               max_connections=getattr(config, 'jira_max_connections', None),
+                               limiter=rate_limiters.get('jira'),
+                               upstream='jira',
+                               adapter_factory=adapter_factory)
+
+    for client in (zd_client, zd_api):
+        mounted = configure_client(client, config.zd_url,
+                                   max_connections=getattr(config, 'zd_max_connections', None),
+                                   limiter=rate_limiters.get('zendesk'),
+                                   upstream='zendesk',
+                                   adapter_factory=adapter_factory) and mounted
+
+    if args.replay and not mounted:
+        parser.error('Cannot replay without intercepting the requests of every API client')
+
     bridge = Bridge(jira_client=jira_client,
                     zd_client=zd_client,
                     redis=redis,
-                    config=config)
+                    config=config,
+                    zd_api=zd_api)
 
     if args.query:
         bridge.jira_issue_jql = args.query
 
-    bridge.sync()
+    if args.force:
+        bridge.force_sync = True
+
+    if args.partition:
+        index, count = [int(x) for x in args.partition.split('/')]
+        if not 0 <= index < count:
+            parser.error('Partition index must be between 0 and {}'.format(count - 1))
+        bridge.partition_index, bridge.partition_count = index, count
+
+    if args.profile or args.profile_dump:
+        bridge.profiler = SyncProfiler()
+
+    if args.migrate_comment_watermarks:
+        bridge.migrate_comment_watermarks()
+        return
+
+    sync_pass = lambda full=False: bridge.sync(workers=args.workers, full=full)
+
+    feed = None
+    if args.zd_feed:
+        cursor_key = CURSOR_KEY
+        if bridge.partition_count > 1:
+            cursor_key = '{}:{}of{}'.format(CURSOR_KEY, bridge.partition_index, bridge.partition_count)
+
+        feed = ZendeskChangeFeed(zd_api, redis,
+                                 lookback=getattr(config, 'zd_feed_lookback', 3600),
+                                 max_pages=getattr(config, 'zd_feed_max_pages', 10),
+                                 cursor_key=cursor_key,
+                                 key_filter=bridge.in_partition)
+
+    worker = None
+    if args.webhooks:
+        sync_queue = SyncQueue(redis)
+
+        server = WebhookServer(sync_queue, redis,
+                               host=getattr(config, 'webhook_host', '0.0.0.0'),
+                               port=getattr(config, 'webhook_port', 8080),
+                               secret=getattr(config, 'webhook_secret', None))
+        server.start()
+
+        worker = QueueWorker(bridge, sync_queue,
+                             batch_size=getattr(config, 'webhook_batch_size', 50),
+                             retry_delay=getattr(config, 'webhook_retry_delay', 5.0),
+                             max_attempts=getattr(config, 'webhook_max_attempts', 5))
+
+    metrics_server = None
+    metrics_port = getattr(config, 'metrics_port', None)
+    if metrics_port is not None and (args.daemon or worker):
+        metrics_server = MetricsServer(METRICS,
+                                       host=getattr(config, 'metrics_host', '0.0.0.0'),
+                                       port=metrics_port)
+        metrics_server.start()
+
+    started = time.time()
+
+    if args.daemon:
+        if worker:
+            # Full passes become a safety net running alongside the queue worker
+            worker.start()
+
+        daemon = Daemon(bridge, sync_pass,
+                        min_interval=getattr(config, 'daemon_min_interval', 30),
+                        max_interval=getattr(config, 'daemon_max_interval', 600),
+                        feed=feed)
+        daemon.run()
+
+        if worker:
+            worker.stop()
+    elif worker:
+        worker.run_forever()
+    elif feed:
+        stats = bridge.sync_keys(feed.poll(), workers=args.workers)
+        if not stats.interrupted:
+            feed.commit()
+    else:
+        sync_pass(full=args.full)
+
+    if cassette is not None:
+        cassette.elapsed = time.time() - started
+        cassette.sanitize(getattr(config, 'cassette_redact', None) or ())
+
+    if args.record:
+        cassette.save(args.record)
+
+    if metrics_server:
+        metrics_server.stop()
+    else:
+        METRICS.log_summary()
+
+    if bridge.profiler:
+        bridge.profiler.log_report(args.profile_top)
+        if args.profile_dump:
+            bridge.profiler.dump(args.profile_dump)
+
+    if args.replay:
+        for line in report(recorded, cassette):
+            LOG.info('%s', line)
+
+        differences = compare(recorded, cassette)
+        for line in differences:
+            LOG.error('%s', line)
+
+        if differences:
+            sys.exit(1)
+        LOG.info('Replay made the same writes as the recorded pass')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,236 @@
+import threading
+
+import six
+
+from jzb import LOG
+from jzb.metrics import METRICS
+
+def _text(value):
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8')
+    if value is None:
+        return None
+    return six.text_type(value)
+
+class StateStore(object):
+    """
+    Batches reads and writes of the bridge's sync state in Redis and counts round trips
+    """
+    def __init__(self, redis, legacy_comment_sets=True):
+        """
+        :param redis: `redis.StrictRedis` object
+        :param legacy_comment_sets: whether the global seen comment sets are consulted for pairs
+                                    without a comment watermark
+        """
+        self.redis = redis
+        self.legacy_comment_sets = legacy_comment_sets
+        self.round_trips = 0
+        self.lock = threading.Lock()
+
+    def count_round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        METRICS.inc('jzb_redis_round_trips_total')
+
+    def prefetch(self, issues):
+        """
+        Reads the state for a page of issues in two round trips
+
+        :param issues: list of `jira.resources.Issue` objects
+        :return: `PageState` object
+        """
+        page = PageState()
+        if not issues:
+            return page
+
+        keys = []
+        for issue in issues:
+            keys.append('zd_ticket:{}'.format(issue.key))
+            keys.append('last_seen_jira_assignee:{}'.format(issue.key))
+            keys.append('last_seen_jira_status:{}'.format(issue.key))
+            keys.append('jira_comment_watermark:{}'.format(issue.key))
+            keys.append('comment_mark:{}'.format(issue.key))
+            keys.append('pair_fingerprint:{}'.format(issue.key))
+
+        page.values.update(zip(keys, self.redis.mget(keys)))
+        self.count_round_trip()
+
+        # Ticket scoped keys can only be resolved once the ticket mappings are known
+        keys = []
+        for issue in issues:
+            ticket_id = page.ticket_id(issue.key)
+            if ticket_id:
+                keys.append('last_seen_zd_group:{}'.format(ticket_id))
+                keys.append('last_seen_zd_status:{}'.format(ticket_id))
+                keys.append('zd_comment_watermark:{}'.format(ticket_id))
+
+        comment_ids = []
+        if self.legacy_comment_sets:
+            for issue in issues:
+                comment = getattr(issue.fields, 'comment', None)
+                if comment and page.values.get('jira_comment_watermark:{}'.format(issue.key)) is None:
+                    comment_ids.extend(x.id for x in comment.comments)
+
+        if not keys and not comment_ids:
+            return page
+
+        pipe = self.redis.pipeline(transaction=False)
+        if keys:
+            pipe.mget(keys)
+        for comment_id in comment_ids:
+            pipe.sismember('seen_jira_comments', comment_id)
+
+        results = pipe.execute()
+        self.count_round_trip()
+
+        if keys:
+            page.values.update(zip(keys, results.pop(0)))
+        for comment_id, member in zip(comment_ids, results):
+            page.members[('seen_jira_comments', _text(comment_id))] = bool(member)
+
+        return page
+
+    def view(self, page=None):
+        """
+        :param page: optional `PageState` object to serve reads from
+        :return: `StateView` object
+        """
+        return StateView(self, page)
+
+class PageState(object):
+    """
+    Prefetched state for a page of issues
+    """
+    def __init__(self):
+        self.values = {}
+        self.members = {}
+
+    def ticket_id(self, issue_key):
+        """
+        :param issue_key: key of a prefetched JIRA issue
+        :return: id of the mapped Zendesk ticket, or None if the issue is untracked
+        """
+        ticket_id = self.values.get('zd_ticket:{}'.format(issue_key))
+        if ticket_id:
+            return int(ticket_id)
+
+class StateView(object):
+    """
+    State for a single issue/ticket pair
+
+    Reads are served from prefetched page state where possible, falling back to Redis. Writes are
+    buffered locally and sent in a single pipeline by `flush`.
+    """
+    def __init__(self, store, page=None):
+        """
+        :param store: `StateStore` object
+        :param page: optional `PageState` object
+        """
+        self.store = store
+        self.page = page or PageState()
+        self.values = {}
+        self.members = {}
+        self.writes = []
+
+    def get(self, key):
+        if key in self.values:
+            return self.values[key]
+
+        if key in self.page.values:
+            return self.page.values[key]
+
+        self.values[key] = self.store.redis.get(key)
+        self.store.count_round_trip()
+
+        return self.values[key]
+
+    def set(self, key, value):
+        """
+        Buffers a write, unless the value is already known to be current
+
+        :return: True if a write was buffered
+        """
+        if _text(self.get_cached(key)) == _text(value):
+            return False
+
+        self.values[key] = value
+        self.writes.append(('set', key, value))
+        return True
+
+    def delete(self, key):
+        self.values[key] = None
+        self.writes.append(('delete', key))
+
+    def expire(self, key, seconds):
+        self.writes.append(('expire', key, seconds))
+
+    def matches(self, key, value):
+        """
+        :return: True if the stored value equals the given value
+        """
+        return value is not None and _text(self.get(key)) == _text(value)
+
+    def get_cached(self, key):
+        return self.values.get(key, self.page.values.get(key))
+
+    def prefetch_members(self, name, members):
+        """
+        Checks membership of several members of a set in a single round trip
+
+        :param name: name of the set
+        :param members: iterable of members
+        """
+        missing = [m for m in members if self.get_member_cached(name, m) is None]
+        if not missing:
+            return
+
+        pipe = self.store.redis.pipeline(transaction=False)
+        for member in missing:
+            pipe.sismember(name, member)
+
+        for member, result in zip(missing, pipe.execute()):
+            self.members[(name, _text(member))] = bool(result)
+
+        self.store.count_round_trip()
+
+    def sismember(self, name, member):
+        result = self.get_member_cached(name, member)
+        if result is None:
+            result = bool(self.store.redis.sismember(name, member))
+            self.members[(name, _text(member))] = result
+            self.store.count_round_trip()
+
+        return result
+
+    def get_member_cached(self, name, member):
+        key = (name, _text(member))
+        return self.members.get(key, self.page.members.get(key))
+
+    def flush(self, fence=None):
+        """
+        Sends all buffered writes to Redis in a single pipeline
+
+        :param fence: optional callable given the buffered writes, which applies them atomically
+                      only while the pair is still leased, such as `LeaseManager.execute_fenced`
+        """
+        if not self.writes:
+            return
+
+        LOG.debug('Flushing %d state writes', len(self.writes))
+
+        if fence is not None:
+            try:
+                fence(self.writes)
+            finally:
+                # Watching the fencing token, reading it and the transaction itself
+                for _ in range(3):
+                    self.store.count_round_trip()
+        else:
+            pipe = self.store.redis.pipeline(transaction=False)
+            for write in self.writes:
+                getattr(pipe, write[0])(*write[1:])
+
+            pipe.execute()
+            self.store.count_round_trip()
+
+        self.writes = []
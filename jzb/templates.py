@@ -0,0 +1,177 @@
+from argparse import ArgumentParser
+import os
+import time
+
+import jinja2
+import yaml
+
+from jzb import LOG
+from jzb.util import objectize, parse_jira_time
+
+# Config keys holding templates, which are also the names they are loaded by
+TEMPLATE_KEYS = (
+    'zd_ticket_query_format',
+    'zd_subject_format',
+    'zd_initial_comment_format',
+    'zd_followup_comment_format',
+    'zd_comment_format',
+    'jira_comment_format',
+)
+
+BYTECODE_CACHE_PREFIX = 'jinja2_bytecode:'
+
+def strip_signature(body, delimiter):
+    """
+    :param body: comment body
+    :param delimiter: delimiter preceding the signature
+    :return: body without the signature
+    """
+    return body.rsplit(delimiter, 1)[0]
+
+def jira_time(value, format='%Y-%m-%d %H:%M UTC'):
+    """
+    :param value: JIRA timestamp such as `2015-06-01T12:34:56.000+0000`
+    :param format: `time.strftime` format
+    :return: timestamp formatted in UTC
+    """
+    return time.strftime(format, time.gmtime(parse_jira_time(value)))
+
+# Filters available to every template
+FILTERS = dict(
+    strip_signature=strip_signature,
+    jira_time=jira_time,
+)
+
+def build_bytecode_cache(config, redis=None):
+    """
+    :param config: object
+    :param redis: optional `redis.StrictRedis` object
+    :return: `jinja2.BytecodeCache` object from the `template_bytecode_cache` config key, or None
+    """
+    location = getattr(config, 'template_bytecode_cache', None)
+    if not location:
+        return None
+
+    if location == 'redis':
+        if redis is None:
+            LOG.warning('No Redis client given, template bytecode will not be cached')
+            return None
+
+        # Redis accepts the same get/set calls as the memcached clients supported by Jinja
+        return jinja2.MemcachedBytecodeCache(redis, prefix=BYTECODE_CACHE_PREFIX,
+                                             timeout=getattr(config, 'template_bytecode_cache_ttl', 86400))
+
+    if not os.path.isdir(location):
+        os.makedirs(location)
+
+    return jinja2.FileSystemBytecodeCache(location)
+
+def build_environment(config, redis=None, bytecode_cache=True):
+    """
+    Builds a single Jinja environment holding every template used by the bridge
+
+    Templates are compiled once and cached by the environment, and their bytecode is optionally
+    cached across restarts, keyed by a checksum of the source so edited templates are recompiled.
+
+    :param config: object
+    :param redis: optional `redis.StrictRedis` object, used when bytecode is cached in Redis
+    :param bytecode_cache: False to compile templates from source regardless of the config
+    :return: `jinja2.Environment` object
+    """
+    sources = dict((key, getattr(config, key)) for key in TEMPLATE_KEYS)
+
+    env = jinja2.Environment(loader=jinja2.DictLoader(sources),
+                             bytecode_cache=build_bytecode_cache(config, redis) if bytecode_cache else None,
+                             auto_reload=False)
+
+    env.filters.update(FILTERS)
+    env.globals.update(jira_url=config.jira_url,
+                       signature_delimiter=config.zd_signature_delimeter)
+
+    return env
+
+def sample_context():
+    """
+    :return: dict of variables resembling those templates are rendered with
+    """
+    issue = dict(key='XXX-1', fields=dict(
+        summary='Example issue',
+        description='Example description\n' * 20,
+        created='2015-06-01T12:34:56.000+0000',
+        creator=dict(name='reporter', displayName='Example Reporter'),
+    ))
+
+    comment = dict(
+        id=1,
+        body='Example comment\n' * 10 + '---\nSignature',
+        created='2015-06-01T12:34:56.000+0000',
+        created_at='2015-06-01T12:34:56Z',
+        author=dict(name='commenter', displayName='Example Commenter'),
+        attachments=[dict(file_name='example.log', content_url='https://example.com/example.log')] * 3,
+    )
+
+    return dict(issue=issue, comment=comment, stripped_body=strip_signature(comment['body'], '---'))
+
+def benchmark(config, iterations=1000, redis=None):
+    """
+    Measures the cost of loading and rendering each template
+
+    :param config: object
+    :param iterations: number of renders timed per template
+    :param redis: optional `redis.StrictRedis` object, used when bytecode is cached in Redis
+    :return: list of tuples of template name, seconds to compile from source, seconds to load
+             through the bytecode cache (None if not configured) and seconds per render
+    """
+    context = sample_context()
+    results = []
+
+    for name in TEMPLATE_KEYS:
+        started = time.time()
+        build_environment(config, bytecode_cache=False).get_template(name)
+        compile_time = time.time() - started
+
+        cached_time = None
+        if getattr(config, 'template_bytecode_cache', None):
+            # Once to populate the cache, then timed as a restart would load it
+            build_environment(config, redis).get_template(name)
+
+            started = time.time()
+            build_environment(config, redis).get_template(name)
+            cached_time = time.time() - started
+
+        template = build_environment(config, bytecode_cache=False).get_template(name)
+
+        started = time.time()
+        for _ in range(iterations):
+            template.render(**context)
+        render_time = (time.time() - started) / iterations
+
+        results.append((name, compile_time, cached_time, render_time))
+
+    return results
+
+def main():
+    parser = ArgumentParser(description='Measures the time taken to load and render bridge templates')
+    parser.add_argument('-c', '--config-file', default='config.yml')
+    parser.add_argument('-n', '--iterations', type=int, default=1000)
+
+    args = parser.parse_args()
+
+    with open(args.config_file) as fp:
+        config = objectize(yaml.safe_load(fp))
+
+    redis = None
+    if getattr(config, 'template_bytecode_cache', None) == 'redis':
+        from redis import StrictRedis
+        redis = StrictRedis(host=config.redis_host, port=config.redis_port)
+
+    print('{:<28} {:>12} {:>12} {:>12}'.format('template', 'compile ms', 'cached ms', 'render us'))
+
+    for name, compile_time, cached_time, render_time in benchmark(config, args.iterations, redis):
+        print('{:<28} {:>12.3f} {:>12} {:>12.1f}'.format(
+            name, compile_time * 1000,
+            '-' if cached_time is None else '{:.3f}'.format(cached_time * 1000),
+            render_time * 1000000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import os
+
+import yaml
+
+from jzb.benchmark.harness import World
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'config.yml.sample')
+
+def load_config(**overrides):
+    """
+    :param overrides: config keys to set on top of the sample config
+    :return: sample config as a dict
+    """
+    with open(CONFIG_PATH) as fp:
+        config = yaml.safe_load(fp)
+
+    config.update(overrides)
+    return config
+
+def make_world(issues=1, comments=0, **overrides):
+    """
+    :param issues: number of issues in the simulated JIRA
+    :param comments: number of comments on each issue
+    :param overrides: config keys to set on top of the sample config
+    :return: `jzb.benchmark.harness.World` object
+    """
+    return World(load_config(**overrides), issues=issues, comments=comments)
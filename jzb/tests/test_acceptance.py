@@ -100,7 +100,9 @@ class IntegrationTest(unittest.TestCase):
             [cleanup_ticket(x) for x in six.itervalues(tickets)]
 
     def handle_update_ticket(self, ctx, **kwargs):
+        # Committed straight away, as an agent's update would be before the bridge next syncs
         self.bridge.handle_update_ticket(ctx, **kwargs)
+        self.bridge.commit_ticket_changes(ctx)
 
     def handle_assign_issue(self, ctx, assignee):
         self.jira_client.assign_issue(ctx.issue, assignee)
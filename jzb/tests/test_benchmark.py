@@ -0,0 +1,45 @@
+import unittest
+
+from jzb.benchmark.harness import format_results, run
+from jzb.tests import load_config, make_world
+
+class BenchmarkTest(unittest.TestCase):
+    def test_cold_pass_creates_tickets(self):
+        world = make_world(issues=5, comments=2)
+        stats = world.bridge.sync()
+
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(sorted(x['external_id'] for x in world.zendesk.tickets.values()),
+                         ['XXX-{}'.format(i) for i in range(1, 6)])
+
+        # The initial comment and both comments of the issue
+        for ticket in world.zendesk.tickets.values():
+            self.assertEqual(len(ticket['comments']), 3)
+
+    def test_churn_is_synced(self):
+        world = make_world(issues=4)
+        world.bridge.sync()
+
+        ticket_id = list(world.zendesk.tickets)[0]
+        world.zendesk.set_status(ticket_id, 'pending')
+        world.zendesk.add_agent_comment(ticket_id)
+
+        stats = world.bridge.sync()
+
+        self.assertEqual(stats.changed, 1)
+        self.assertEqual(world.jira.issues['XXX-1'].fields.status.name, 'Waiting Reporter')
+        self.assertEqual(world.jira.issues['XXX-1'].fields.comment.total, 1)
+
+    def test_run(self):
+        results = run(load_config(), churn=0.5, issues=6, comments=1)
+
+        self.assertEqual([x.scenario for x in results], ['cold', 'steady', 'churn'])
+        self.assertEqual([x.issues for x in results], [6, 6, 6])
+        self.assertEqual(results[2].changed, 3)
+
+        cold, steady, churn = results
+        self.assertLess(steady.api_calls_per_issue, cold.api_calls_per_issue)
+        self.assertLess(steady.api_calls_per_issue, churn.api_calls_per_issue)
+        self.assertLess(steady.redis_ops_per_issue, cold.redis_ops_per_issue)
+
+        self.assertEqual(len(format_results(results)), 4)
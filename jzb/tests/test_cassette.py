@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from six.moves import BaseHTTPServer
+
+from jzb.cassette import (Cassette, CassetteError, CassettePlayer, RecordingAdapter, RedisRecorder, ReplayAdapter,
+                          compare, report)
+from jzb.clients import configure_client
+from jzb.memredis import MemoryRedis
+from jzb.zdapi import ZendeskApi
+
+TICKETS = {
+    1: dict(id=1, status='open', external_id='XXX-1', requester_email='customer@example.com'),
+    2: dict(id=2, status='pending', external_id='XXX-2', requester_email='other@example.com'),
+}
+
+class ZendeskHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        ids = self.path.split('ids=')[1].split('%2C')
+        self.respond(dict(tickets=[TICKETS[int(x)] for x in ids]))
+
+    def do_PUT(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        ticket = dict(TICKETS[int(self.path.split('/')[-1].split('.')[0])], **body['ticket'])
+        self.respond(dict(ticket=ticket))
+
+    def respond(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def build_api(url, adapter_factory):
+    api = ZendeskApi(url, 'bridge@example.com', 'password')
+    configure_client(api, url, upstream='zendesk', adapter_factory=adapter_factory)
+    return api
+
+def sync(api, redis):
+    """
+    Reads tickets and writes to both Zendesk and Redis, as a pass would
+    """
+    tickets = api.show_many_tickets([1, 2])
+    for ticket_id, ticket in sorted(tickets.items()):
+        if redis.get('last_seen_zd_status:{}'.format(ticket_id)) != ticket.status.encode('utf-8'):
+            api.update_ticket(ticket_id, status='open')
+            redis.set('last_seen_zd_status:{}'.format(ticket_id), 'open')
+    redis.set('sync_watermark', tickets[1].status)
+
+def sync_by_key(api, redis):
+    """
+    Looks tickets up by their external id in Redis, as the bridge does with issue keys
+    """
+    for ticket_id, ticket in sorted(api.show_many_tickets([1, 2]).items()):
+        if redis.get('zd_ticket:{}'.format(ticket.external_id)) is None:
+            api.update_ticket(ticket_id, status='open')
+            redis.set('zd_ticket:{}'.format(ticket.external_id), ticket_id)
+
+class CassetteTest(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), ZendeskHandler)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'pass.json.gz')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir)
+
+    def record(self, run=sync, patterns=()):
+        cassette = Cassette()
+
+        redis = MemoryRedis()
+        redis.set('last_seen_zd_status:1', 'open')
+        redis.set('zd_ticket:XXX-1', 1)
+
+        run(build_api(self.url, lambda **kwargs: RecordingAdapter(cassette, **kwargs)),
+            RedisRecorder(redis, cassette))
+
+        cassette.elapsed = 0.5
+        cassette.sanitize(patterns)
+        cassette.save(self.path)
+
+        return Cassette.load(self.path)
+
+    def replay(self, recorded, run=sync, patterns=()):
+        # Replayed requests must not reach the server, which stops serving them
+        self.server.shutdown()
+
+        cassette = Cassette()
+        player = CassettePlayer(recorded)
+
+        run(build_api(self.url, lambda **kwargs: ReplayAdapter(player, cassette, **kwargs)),
+            RedisRecorder(recorded.build_redis(), cassette))
+
+        cassette.sanitize(patterns)
+        return cassette
+
+    def test_records_pass(self):
+        recorded = self.record()
+
+        self.assertEqual([(x['method'], x['status']) for x in recorded.http], [('GET', 200), ('PUT', 200)])
+        self.assertEqual(recorded.http[1]['body'], '{"ticket":{"status":"open"}}')
+        self.assertNotIn('example.com', recorded.http[0]['response'])
+
+        self.assertEqual(recorded.initial, {'last_seen_zd_status:1': 'open', 'last_seen_zd_status:2': None})
+        self.assertEqual(recorded.written, {'last_seen_zd_status:2': 'open', 'sync_watermark': 'open'})
+
+    def test_replay_matches(self):
+        recorded = self.record()
+        replayed = self.replay(recorded)
+
+        self.assertEqual(compare(recorded, replayed), [])
+        self.assertEqual(len(replayed.http), 2)
+
+        lines = report(recorded, replayed)
+        self.assertIn('PUT /api/v2/tickets/{id}', lines[1] + lines[2])
+        self.assertEqual(lines[-1], 'Pass took 0.50s when recorded, 0.00s replayed')
+
+    def test_replay_matches_redacted_keys(self):
+        patterns = [r'\bXXX-\d+\b']
+        recorded = self.record(sync_by_key, patterns)
+
+        self.assertEqual(len(recorded.initial), 2)
+        self.assertFalse(any('XXX-' in x for x in list(recorded.initial) + list(recorded.written)))
+
+        replayed = self.replay(recorded, sync_by_key, patterns)
+        self.assertEqual(compare(recorded, replayed), [])
+
+    def test_replay_reports_different_writes(self):
+        recorded = self.record()
+
+        def changed_sync(api, redis):
+            api.show_many_tickets([1, 2])
+            api.update_ticket(2, status='solved')
+            redis.set('last_seen_zd_status:2', 'solved')
+
+        differences = compare(recorded, self.replay(recorded, changed_sync))
+
+        self.assertEqual(len(differences), 3)
+        self.assertTrue(differences[0].startswith('Missing request (1x): PUT'))
+        self.assertTrue(differences[1].startswith('Unexpected request (1x): PUT'))
+        self.assertEqual(differences[2], "Redis key last_seen_zd_status:2 written as 'solved', recorded 'open'")
+
+    def test_unknown_request_fails(self):
+        recorded = self.record()
+
+        with self.assertRaises(CassetteError):
+            self.replay(recorded, lambda api, redis: api.update_ticket(1, status='open'))
@@ -0,0 +1,84 @@
+import io
+import time
+import unittest
+
+from requests import PreparedRequest, Response
+
+from jzb.clients import RateLimiter, ThrottledAdapter, TokenBucket
+
+def make_response(status, headers=None):
+    response = Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response.raw = io.BytesIO(b'')
+    return response
+
+class StubAdapter(ThrottledAdapter):
+    def __init__(self, responses, **kwargs):
+        super(StubAdapter, self).__init__(**kwargs)
+        self.responses = list(responses)
+        self.sent = 0
+
+    def send_once(self, request, **kwargs):
+        self.sent += 1
+        return self.responses.pop(0)
+
+def make_request(method, url):
+    request = PreparedRequest()
+    request.prepare(method=method, url=url)
+    return request
+
+class TokenBucketTest(unittest.TestCase):
+    def test_unlimited_never_waits(self):
+        bucket = TokenBucket()
+        for _ in range(100):
+            self.assertEqual(bucket.acquire(), 0)
+
+    def test_rate_is_enforced(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        started = time.time()
+        for _ in range(6):
+            bucket.acquire()
+
+        self.assertGreaterEqual(time.time() - started, 0.09)
+
+    def test_block_holds_back_requests(self):
+        bucket = TokenBucket()
+        bucket.block(0.05)
+
+        self.assertGreater(bucket.acquire(), 0)
+
+class RateLimiterTest(unittest.TestCase):
+    def test_classify(self):
+        limiter = RateLimiter('jira')
+
+        self.assertEqual(limiter.classify('GET', 'https://jira/rest/api/2/search?jql=x'), 'search')
+        self.assertEqual(limiter.classify('GET', 'https://jira/rest/api/2/issue/X-1'), 'read')
+        self.assertEqual(limiter.classify('POST', 'https://jira/rest/api/2/issue/X-1/comment'), 'write')
+
+    def test_retries_after_rate_limit(self):
+        limiter = RateLimiter('zendesk', max_retries=2)
+        adapter = StubAdapter([make_response(429, {'Retry-After': '0.01'}), make_response(200)],
+                              limiter=limiter)
+
+        response = adapter.send(make_request('GET', 'https://zd/api/v2/tickets/1.json'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(adapter.sent, 2)
+
+    def test_gives_up_after_max_retries(self):
+        limiter = RateLimiter('zendesk', max_retries=1)
+        adapter = StubAdapter([make_response(429, {'Retry-After': '0.01'})] * 2, limiter=limiter)
+
+        response = adapter.send(make_request('GET', 'https://zd/api/v2/tickets/1.json'))
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(adapter.sent, 2)
+
+    def test_low_remaining_budget_pauses(self):
+        limiter = RateLimiter('zendesk', low_water=5)
+        limiter.observe('read', make_response(200, {'X-Rate-Limit-Remaining': '2', 'ratelimit-reset': '30'}))
+
+        self.assertGreater(limiter.buckets['read'].blocked_until, time.time() + 20)
+        self.assertEqual(limiter.buckets['write'].blocked_until, 0)
@@ -0,0 +1,57 @@
+import unittest
+
+from jzb.tests import make_world
+
+class IncrementalCommentsTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=2, comments=5, incremental_comments=True, comment_page_size=3)
+
+        # The first pass writes to both sides, so the second one looks at the comments again
+        self.world.bridge.sync()
+        self.world.bridge.sync()
+        self.world.reset_counters()
+
+        self.jira_pages = []
+        comments = self.world.jira.comments
+
+        def record_page(key, start_at=0, max_results=50, order_by=None):
+            self.jira_pages.append((key, start_at))
+            return comments(key, start_at=start_at, max_results=max_results, order_by=order_by)
+
+        self.world.jira.comments = record_page
+
+    def test_unchanged_pairs_skip_fetch(self):
+        stats = self.world.bridge.sync()
+
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(self.jira_pages, [])
+        self.assertEqual(self.world.zendesk.upstream.calls['comments'], 0)
+
+    def test_fetches_comments_past_watermark(self):
+        ticket_id = [k for k, v in self.world.zendesk.tickets.items() if v['external_id'] == 'XXX-1'][0]
+        ticket = self.world.zendesk.tickets[ticket_id]
+        copied = len(ticket['comments'])
+
+        self.world.jira.add_reporter_comment('XXX-1')
+        self.world.zendesk.add_agent_comment(ticket_id)
+
+        zd_pages = []
+        ticket_comments = self.world.zendesk.ticket_comments
+
+        def record_zd_page(ticket_id, after_id=None):
+            zd_pages.append((ticket_id, after_id))
+            return ticket_comments(ticket_id, after_id=after_id)
+
+        self.world.zendesk.ticket_comments = record_zd_page
+
+        stats = self.world.bridge.sync()
+        self.assertEqual(stats.failed, 0)
+
+        # A single page of the newest comments reaches back to the watermark
+        self.assertEqual(self.jira_pages, [('XXX-1', 0)])
+        self.assertEqual(len(zd_pages), 1)
+        self.assertIsNotNone(zd_pages[0][1])
+
+        self.assertEqual(len(ticket['comments']), copied + 2)
+        comments = self.world.jira.issues['XXX-1'].fields.comment.comments
+        self.assertEqual(sum('Comment from an agent' in x.body for x in comments), 1)
@@ -0,0 +1,64 @@
+import unittest
+
+from jzb.benchmark.fakes import Resource
+from jzb.daemon import Daemon
+from jzb.tests import make_world
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=2)
+        self.results = []
+
+        self.daemon = Daemon(self.world.bridge, self.next_pass, min_interval=10, max_interval=80)
+
+    def next_pass(self):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return Resource(changed=result, interrupted=False)
+
+    def run_passes(self, *results):
+        self.results.extend(results)
+
+        intervals = []
+        for _ in results:
+            self.daemon.adapt_interval(self.daemon.run_pass())
+            intervals.append(self.daemon.interval)
+
+        return intervals
+
+    def test_grows_when_idle_within_bounds(self):
+        self.assertEqual(self.run_passes(0, 0, 0, 0, 0), [20, 40, 80, 80, 80])
+
+    def test_shrinks_when_busy_within_bounds(self):
+        self.daemon.interval = 80
+        self.assertEqual(self.run_passes(3, 1, 5, 2), [40, 20, 10, 10])
+
+    def test_survives_failing_pass(self):
+        self.assertEqual(self.run_passes(0, IOError('503 Service Unavailable'), 2), [20, 40, 20])
+        self.assertEqual(self.daemon.passes, 3)
+
+    def test_lag_tracks_completed_passes(self):
+        self.assertIsNone(self.daemon.lag)
+
+        self.run_passes(0)
+        started = self.daemon.last_completed_pass_started
+
+        self.run_passes(IOError('503 Service Unavailable'))
+        self.assertEqual(self.daemon.last_completed_pass_started, started)
+
+    def test_syncs_feed_before_pass(self):
+        class Feed(object):
+            committed = False
+
+            def poll(self):
+                return set(['XXX-1'])
+
+            def commit(self):
+                self.committed = True
+
+        self.daemon.feed = Feed()
+
+        self.assertEqual(self.run_passes(0), [10])
+        self.assertTrue(self.daemon.feed.committed)
+        self.assertEqual([x['external_id'] for x in self.world.zendesk.tickets.values()], ['XXX-1'])
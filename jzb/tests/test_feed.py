@@ -0,0 +1,84 @@
+import time
+import unittest
+
+from jzb.feed import ZendeskChangeFeed
+from jzb.memredis import MemoryRedis
+
+class ScriptedExport(object):
+    """
+    Incremental ticket export returning a page per call, each of one ticket, until `end` pages
+    """
+    def __init__(self, end=None):
+        self.end = end
+        self.calls = []
+
+    def incremental_tickets(self, start_time=None, cursor=None):
+        self.calls.append(dict(start_time=start_time, cursor=cursor))
+
+        page = len(self.calls)
+        return dict(tickets=[dict(id=page, external_id='XXX-{}'.format(page))],
+                    after_cursor='cursor-{}'.format(page),
+                    end_of_stream=page == self.end)
+
+class ZendeskChangeFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = MemoryRedis()
+
+    def test_looks_back_on_first_use(self):
+        export = ScriptedExport(end=1)
+        feed = ZendeskChangeFeed(export, self.redis, lookback=600)
+
+        started = time.time()
+        self.assertEqual(feed.poll(), set(['XXX-1']))
+
+        self.assertIsNone(export.calls[0]['cursor'])
+        self.assertAlmostEqual(export.calls[0]['start_time'], started - 600, delta=5)
+
+    def test_persists_cursor_on_commit(self):
+        export = ScriptedExport(end=1)
+        feed = ZendeskChangeFeed(export, self.redis)
+
+        feed.poll()
+        self.assertIsNone(self.redis.get('zd_export_cursor'))
+
+        feed.commit()
+        self.assertEqual(self.redis.get('zd_export_cursor'), b'cursor-1')
+
+        # A poll that is never committed is read again
+        export.end = None
+        feed = ZendeskChangeFeed(export, self.redis, max_pages=1)
+        feed.poll()
+        feed = ZendeskChangeFeed(export, self.redis, max_pages=1)
+        feed.poll()
+
+        self.assertEqual([x['cursor'] for x in export.calls[1:]], ['cursor-1', 'cursor-1'])
+
+    def test_keeps_cursor_when_nothing_changed(self):
+        self.redis.set('zd_export_cursor', 'cursor-0')
+
+        class Unchanged(object):
+            def incremental_tickets(self, start_time=None, cursor=None):
+                return dict(tickets=[], after_cursor=None, end_of_stream=True)
+
+        feed = ZendeskChangeFeed(Unchanged(), self.redis)
+        self.assertEqual(feed.poll(), set())
+        feed.commit()
+
+        self.assertEqual(self.redis.get('zd_export_cursor'), b'cursor-0')
+
+    def test_stops_after_max_pages(self):
+        export = ScriptedExport()
+        feed = ZendeskChangeFeed(export, self.redis, max_pages=3)
+
+        self.assertEqual(feed.poll(), set(['XXX-1', 'XXX-2', 'XXX-3']))
+        self.assertEqual([x['cursor'] for x in export.calls], [None, 'cursor-1', 'cursor-2'])
+
+        # The next poll carries on where this one stopped
+        feed.commit()
+        self.assertEqual(self.redis.get('zd_export_cursor'), b'cursor-3')
+
+    def test_filters_keys(self):
+        export = ScriptedExport(end=2)
+        feed = ZendeskChangeFeed(export, self.redis, key_filter=lambda key: key != 'XXX-1')
+
+        self.assertEqual(feed.poll(), set(['XXX-2']))
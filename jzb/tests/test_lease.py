@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from jzb.bridge import Bridge, SyncStats
+from jzb.lease import LeaseLost, LeaseManager, in_partition
+from jzb.memredis import MemoryRedis
+from jzb.tests import load_config, make_world
+from jzb.util import objectize
+
+class LeaseManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = MemoryRedis()
+        self.leases = LeaseManager(self.redis, ttl=60, node_id='node-a')
+
+    def test_held_by_one_node(self):
+        lease = self.leases.acquire('XXX-1')
+
+        self.assertIsNotNone(lease)
+        self.assertIsNone(LeaseManager(self.redis, node_id='node-b').acquire('XXX-1'))
+
+        self.leases.release(lease)
+        self.assertEqual(LeaseManager(self.redis, node_id='node-b').acquire('XXX-1').token, 2)
+
+    def test_fences_expired_lease(self):
+        stale = LeaseManager(self.redis, ttl=0.01, node_id='node-a').acquire('XXX-1')
+        time.sleep(0.02)
+
+        current = LeaseManager(self.redis, node_id='node-b').acquire('XXX-1')
+        self.assertGreater(current.token, stale.token)
+
+        with self.assertRaises(LeaseLost):
+            self.leases.execute_fenced(stale, [('set', 'state', 'stale')])
+        with self.assertRaises(LeaseLost):
+            self.leases.check(stale)
+
+        self.leases.execute_fenced(current, [('set', 'state', 'current')])
+        self.assertEqual(self.redis.get('state'), b'current')
+
+        # Releasing a lost lease leaves the new holder's lease in place
+        self.leases.release(stale)
+        self.assertTrue(self.redis.exists('lease:XXX-1'))
+
+    def test_renews_after_half_ttl(self):
+        lease = self.leases.acquire('XXX-1')
+        lease.deadline = time.time() + 10
+
+        self.leases.check(lease)
+        self.assertGreater(lease.deadline, time.time() + 50)
+
+    def test_partitions_cover_every_key(self):
+        keys = ['XXX-{}'.format(i) for i in range(100)]
+        partitions = [[key for key in keys if in_partition(key, index, 3)] for index in range(3)]
+
+        self.assertEqual(sorted(sum(partitions, [])), sorted(keys))
+        self.assertTrue(all(partitions))
+
+class LeasedSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=3, comments=1, leases=True)
+        self.other = Bridge(self.world.jira, self.world.zendesk, self.world.redis, objectize(load_config(leases=True)),
+                            zd_api=self.world.zendesk)
+
+    def test_rereads_pair_prefetched_before_lease(self):
+        self.world.bridge.sync()
+        self.world.jira.add_reporter_comment('XXX-1')
+
+        # The other node prefetches its page, then this node syncs the pair first
+        contexts = list(self.other.prepare_contexts(self.other.search_issues()))
+        self.world.bridge.sync()
+
+        stats = SyncStats()
+        for ctx in contexts:
+            self.other.sync_one(ctx, stats)
+
+        self.assertEqual(stats.failed, 0)
+        ticket = [x for x in self.world.zendesk.tickets.values() if x['external_id'] == 'XXX-1'][0]
+        self.assertEqual(len(ticket['comments']), 3)
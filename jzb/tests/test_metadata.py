@@ -0,0 +1,92 @@
+import unittest
+
+from jzb.metadata import MetadataRegistry
+from jzb.util import objectize
+
+class MemoryRedis(object):
+    """
+    Implements just enough of `redis.StrictRedis` for metadata snapshots
+    """
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode('utf-8')
+
+class FakeJira(object):
+    def __init__(self):
+        self.calls = 0
+
+    def current_user(self):
+        self.calls += 1
+        return 'bridge'
+
+class FakeZendesk(object):
+    def __init__(self):
+        self.calls = 0
+        self.groups = [objectize(dict(id=1, name='Support'))]
+
+    @property
+    def current_user(self):
+        self.calls += 1
+        return objectize(dict(id=7, name='Bridge'))
+
+    @property
+    def assignable_groups(self):
+        self.calls += 1
+        return self.groups
+
+    @property
+    def ticket_fields(self):
+        self.calls += 1
+        return [objectize(dict(id=5, name='Product', active=True))]
+
+    @property
+    def ticket_forms(self):
+        self.calls += 1
+        return [objectize(dict(id=9, name='Default'))]
+
+class MetadataRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = MemoryRedis()
+        self.jira = FakeJira()
+        self.zendesk = FakeZendesk()
+
+    def make_registry(self, **kwargs):
+        registry = MetadataRegistry(self.jira, self.zendesk, self.redis, **kwargs)
+        registry.load()
+        return registry
+
+    def test_warm_start_makes_no_calls(self):
+        self.make_registry()
+        self.assertEqual((self.jira.calls, self.zendesk.calls), (1, 4))
+
+        registry = self.make_registry()
+        self.assertEqual((self.jira.calls, self.zendesk.calls), (1, 4))
+
+        self.assertEqual(registry.zd_identity.id, 7)
+        self.assertEqual(registry.jira_identity, 'bridge')
+        self.assertEqual(registry.find_group_by_name('Support').id, 1)
+        self.assertEqual(registry.find_ticket_form_by_name('Default').id, 9)
+
+    def test_expired_snapshot_is_fetched(self):
+        self.make_registry(ttl=-1)
+        self.make_registry(ttl=-1)
+
+        self.assertEqual(self.jira.calls, 2)
+
+    def test_miss_refreshes_snapshot(self):
+        registry = self.make_registry(miss_interval=0)
+        self.zendesk.groups = self.zendesk.groups + [objectize(dict(id=2, name='Escalation'))]
+
+        self.assertEqual(registry.find_group_by_id(2).name, 'Escalation')
+        self.assertRaises(ValueError, registry.find_group_by_id, 3)
+
+    def test_miss_refreshes_are_limited(self):
+        registry = self.make_registry(miss_interval=60)
+
+        self.assertRaises(ValueError, registry.find_group_by_name, 'Escalation')
+        self.assertEqual(self.jira.calls, 1)
@@ -0,0 +1,51 @@
+import unittest
+
+from six.moves.urllib.request import urlopen
+
+from jzb.metrics import Metrics, MetricsServer, endpoint_name
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_renders_prometheus_text(self):
+        self.metrics.inc('jzb_api_requests_total', upstream='jira', endpoint='GET /search', status=200)
+        self.metrics.inc('jzb_api_requests_total', upstream='jira', endpoint='GET /search', status=200)
+        self.metrics.set('jzb_lag_seconds', 1.5)
+        self.metrics.observe('jzb_phase_seconds', 0.02, phase='sync_status')
+        self.metrics.observe('jzb_phase_seconds', 90, phase='sync_status')
+
+        lines = self.metrics.render().splitlines()
+
+        self.assertIn('# TYPE jzb_api_requests_total counter', lines)
+        self.assertIn('jzb_api_requests_total{endpoint="GET /search",status="200",upstream="jira"} 2', lines)
+        self.assertIn('jzb_lag_seconds 1.5', lines)
+        self.assertIn('jzb_phase_seconds_bucket{phase="sync_status",le="0.01"} 0', lines)
+        self.assertIn('jzb_phase_seconds_bucket{phase="sync_status",le="0.025"} 1', lines)
+        self.assertIn('jzb_phase_seconds_bucket{phase="sync_status",le="+Inf"} 2', lines)
+        self.assertIn('jzb_phase_seconds_count{phase="sync_status"} 2', lines)
+
+    def test_timer_records_failures(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.timer('jzb_action_seconds', action='transition_issue'):
+                raise ValueError()
+
+        self.assertTrue(self.metrics.summary()[0].startswith('jzb_action_seconds{action="transition_issue"}: 1 calls'))
+
+    def test_endpoint_names_are_bounded(self):
+        self.assertEqual(endpoint_name('GET', 'https://jira.example.com/rest/api/2/issue/XXX-42/comment?startAt=0'),
+                         'GET /rest/api/2/issue/{id}/comment')
+        self.assertEqual(endpoint_name('PUT', 'https://example.zendesk.com/api/v2/tickets/123.json'),
+                         'PUT /api/v2/tickets/{id}')
+
+    def test_server_serves_metrics(self):
+        self.metrics.inc('jzb_passes_total')
+
+        server = MetricsServer(self.metrics, host='127.0.0.1', port=0)
+        server.start()
+
+        try:
+            response = urlopen('http://127.0.0.1:{}/metrics'.format(server.server_address[1]))
+            self.assertIn(b'jzb_passes_total 1', response.read())
+        finally:
+            server.stop()
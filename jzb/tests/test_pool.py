@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+
+from jzb.bridge import SyncStats
+from jzb.pool import Prefetcher, WorkerPool
+from jzb.tests import make_world
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_processes_all_items(self):
+        results = []
+        lock = threading.Lock()
+
+        def handler(item):
+            with lock:
+                results.append(item)
+
+        pool = WorkerPool(handler, 4)
+        pool.start()
+
+        for i in range(50):
+            pool.submit(i, i)
+
+        pool.join()
+
+        self.assertEqual(sorted(results), list(range(50)))
+
+    def test_same_key_never_concurrent(self):
+        active = set()
+        overlaps = []
+        lock = threading.Lock()
+
+        def handler(item):
+            key = item[0]
+            with lock:
+                if key in active:
+                    overlaps.append(key)
+                active.add(key)
+
+            time.sleep(0.01)
+
+            with lock:
+                active.discard(key)
+
+        pool = WorkerPool(handler, 8)
+        pool.start()
+
+        for i in range(40):
+            key = 'ISSUE-{}'.format(i % 3)
+            pool.submit(key, (key, i))
+
+        pool.join()
+
+        self.assertEqual(overlaps, [])
+
+    def test_handler_errors_are_isolated(self):
+        results = []
+
+        def handler(item):
+            if item == 3:
+                raise ValueError('boom')
+            results.append(item)
+
+        pool = WorkerPool(handler, 2)
+        pool.start()
+
+        for i in range(6):
+            pool.submit(i, i)
+
+        pool.join()
+
+        self.assertEqual(sorted(results), [0, 1, 2, 4, 5])
+
+class PrefetcherTest(unittest.TestCase):
+    def test_yields_items_in_order(self):
+        self.assertEqual(list(Prefetcher(iter(range(20)), size=3)), list(range(20)))
+
+    def test_buffer_is_bounded(self):
+        produced = []
+
+        def produce():
+            for i in range(10):
+                produced.append(i)
+                yield i
+
+        items = iter(Prefetcher(produce(), size=2))
+        next(items)
+        time.sleep(0.2)
+
+        # One item consumed, two buffered and one waiting to be buffered
+        self.assertLessEqual(len(produced), 4)
+
+        self.assertEqual(list(items), list(range(1, 10)))
+
+    def test_errors_reach_consumer(self):
+        def produce():
+            yield 1
+            raise ValueError('boom')
+
+        items = iter(Prefetcher(produce()))
+        self.assertEqual(next(items), 1)
+        self.assertRaises(ValueError, next, items)
+
+class SyncConcurrentlyTest(unittest.TestCase):
+    def test_workers_stopped_when_search_fails(self):
+        world = make_world(issues=3)
+        bridge = world.bridge
+
+        def issues():
+            for issue in world.jira.issues.values():
+                yield issue
+            raise ValueError('boom')
+
+        stats = SyncStats(bridge.state)
+        self.assertRaises(ValueError, bridge.sync_issues, issues(), stats, workers=2)
+
+        workers = [thread for thread in threading.enumerate() if thread.name.startswith('jzb-worker-')]
+        self.assertEqual(workers, [])
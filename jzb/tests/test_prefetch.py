@@ -0,0 +1,45 @@
+import unittest
+
+from jzb.tests import make_world
+
+class TicketPrefetchTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=3)
+        self.world.bridge.sync()
+        self.world.reset_counters()
+
+    def test_fetches_page_of_tickets_at_once(self):
+        stats = self.world.bridge.sync()
+
+        calls = self.world.zendesk.upstream.calls
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(calls['show_many'], 1)
+        self.assertEqual(calls['ticket'], 0)
+
+    def test_falls_back_to_single_fetch(self):
+        show_many_tickets = self.world.zendesk.show_many_tickets
+        missing = list(self.world.zendesk.tickets)[0]
+
+        def without_first(ids):
+            # Zendesk leaves out tickets it cannot show, such as archived ones
+            return dict((k, v) for k, v in show_many_tickets(ids).items() if k != missing)
+
+        self.world.zendesk.show_many_tickets = without_first
+
+        stats = self.world.bridge.sync()
+
+        calls = self.world.zendesk.upstream.calls
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(calls['show_many'], 1)
+        self.assertEqual(calls['ticket'], 1)
+
+    def test_disabled(self):
+        world = make_world(issues=3, zd_prefetch_tickets=False)
+        world.bridge.sync()
+        world.reset_counters()
+
+        world.bridge.sync()
+
+        calls = world.zendesk.upstream.calls
+        self.assertEqual(calls['show_many'], 0)
+        self.assertEqual(calls['ticket'], 3)
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from jzb.profiling import SyncProfiler, count_api_call
+from jzb.util import objectize
+
+def make_ctx(key, ticket_id):
+    return objectize(dict(issue=objectize(dict(key=key)), ticket=objectize(dict(id=ticket_id)),
+                          comments=3, action_iterations=2))
+
+class SyncProfilerTest(unittest.TestCase):
+    def test_ranks_pairs_with_api_calls(self):
+        profiler = SyncProfiler()
+
+        def slow():
+            count_api_call('jira')
+            count_api_call('zendesk')
+            sum(range(200000))
+
+        with profiler.track(make_ctx('XXX-1', 1), 'sync_status'):
+            sum(range(10))
+        with profiler.track(make_ctx('XXX-2', 2), 'sync_status'):
+            slow()
+        with profiler.track(make_ctx('XXX-2', 2), 'sync_priority'):
+            count_api_call('jira')
+
+        # Calls outside a tracked phase are not attributed to any pair
+        count_api_call('jira')
+
+        slowest = profiler.issues['XXX-2']
+        self.assertEqual(slowest.api_calls, dict(jira=2, zendesk=1))
+        self.assertEqual(slowest.slowest_phase, 'sync_status')
+        self.assertEqual((slowest.comments, slowest.action_iterations), (3, 2))
+
+        report = profiler.report(top=5)
+        self.assertTrue(report[2].startswith('XXX-2'))
+        self.assertTrue(any('slow' in line for line in report))
+
+    def test_dumps_pstats(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        profiler = SyncProfiler()
+        with profiler.track(make_ctx('XXX-1', 1), 'sync_status'):
+            sum(range(10))
+
+        path = os.path.join(directory, 'run.pstats')
+        profiler.dump(path)
+
+        self.assertTrue(os.path.getsize(path))
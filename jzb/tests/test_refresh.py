@@ -0,0 +1,69 @@
+import unittest
+
+from jzb.benchmark.fakes import Resource
+from jzb.tests import make_world
+
+class IssueWrittenTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=1, comments=1, refresh_after_writes=False)
+        self.bridge = self.world.bridge
+
+        self.ctx = next(self.bridge.prepare_contexts(self.bridge.search_issues_by_key(['XXX-1'])))
+
+        self.reads = []
+        issue = self.world.jira.issue
+
+        def record_read(key, fields=None):
+            self.reads.append(fields)
+            return issue(key, fields)
+
+        self.world.jira.issue = record_read
+
+    def test_applies_known_writes_locally(self):
+        jira = self.world.jira
+
+        jira.assign_issue(self.ctx.issue, 'bridge')
+        self.bridge.issue_written(self.ctx, assignee='bridge')
+
+        comment = jira.add_comment(self.ctx.issue, 'Comment from an agent')
+        self.bridge.issue_written(self.ctx, comments=[comment])
+
+        fields = self.ctx.issue.fields
+        self.assertEqual(self.reads, ['updated,status,assignee'] * 2)
+        self.assertEqual(fields.assignee.name, 'bridge')
+        self.assertEqual(fields.updated, jira.issues['XXX-1'].fields.updated)
+        self.assertEqual(fields.comment.comments[-1], comment)
+        self.assertEqual(fields.comment.total, 2)
+
+    def test_refreshes_after_unexpected_status(self):
+        jira = self.world.jira
+
+        jira.assign_issue(self.ctx.issue, 'bridge')
+        # Someone else closes the issue at the same time
+        jira.issues['XXX-1'].fields.status = Resource(name='Closed')
+
+        self.bridge.issue_written(self.ctx, assignee='bridge')
+
+        self.assertEqual(self.reads, ['updated,status,assignee', self.bridge.issue_fields])
+        self.assertEqual(self.ctx.issue.fields.status.name, 'Closed')
+
+    def test_refreshes_after_unexpected_assignee(self):
+        jira = self.world.jira
+
+        jira.transition_issue(self.ctx.issue, '0')
+        status = jira.issues['XXX-1'].fields.status.name
+        jira.assign_issue(self.ctx.issue, 'someone')
+
+        self.bridge.issue_written(self.ctx, status=status)
+
+        self.assertEqual(self.reads, ['updated,status,assignee', self.bridge.issue_fields])
+        self.assertEqual(self.ctx.issue.fields.assignee.name, 'someone')
+        self.assertEqual(self.ctx.issue.fields.status.name, status)
+
+    def test_refreshes_every_write_when_enabled(self):
+        self.bridge.refresh_after_writes = True
+
+        self.world.jira.assign_issue(self.ctx.issue, 'bridge')
+        self.bridge.issue_written(self.ctx, assignee='bridge')
+
+        self.assertEqual(self.reads, [self.bridge.issue_fields])
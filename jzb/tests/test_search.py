@@ -0,0 +1,54 @@
+import unittest
+
+from jzb.tests import make_world
+
+class SearchPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=10)
+        self.world.bridge.jira_page_size = 3
+
+    def test_continues_after_deleted_key(self):
+        pages = self.world.bridge.search_pages('project = XXX')
+
+        keys = [x.key for x in next(pages)]
+        self.assertEqual(keys, ['XXX-1', 'XXX-2', 'XXX-3'])
+
+        # The issue the next page continues after is deleted while the page is synced
+        del self.world.jira.issues['XXX-3']
+
+        for page in pages:
+            keys.extend(x.key for x in page)
+
+        self.assertEqual(keys, ['XXX-{}'.format(i) for i in range(1, 11)])
+
+class IssueFieldsTest(unittest.TestCase):
+    def sync_fields(self, **overrides):
+        world = make_world(issues=2, **overrides)
+
+        requested = set()
+        search_issues = world.jira.search_issues
+
+        def record_fields(jql, fields=None, **kwargs):
+            requested.add(fields)
+            return search_issues(jql, fields=fields, **kwargs)
+
+        world.jira.search_issues = record_fields
+        world.bridge.sync()
+
+        self.assertEqual(len(requested), 1)
+        return set(requested.pop().split(','))
+
+    def test_requests_only_used_fields(self):
+        self.assertEqual(self.sync_fields(jira_fields=['labels']), set([
+            # Used by the bridge
+            'assignee', 'status', 'priority', 'updated', 'issuetype', 'project', 'comment',
+            # Reference field
+            'customfield_13000',
+            # Used by the issue templates
+            'summary', 'creator', 'created', 'description',
+            # Listed by the jira_fields config key
+            'labels',
+        ]))
+
+    def test_comments_fetched_separately(self):
+        self.assertNotIn('comment', self.sync_fields(incremental_comments=True))
@@ -0,0 +1,124 @@
+import functools
+import time
+import unittest
+
+from jzb.benchmark.fakes import Resource
+from jzb.lease import LeaseLost, LeaseManager
+from jzb.memredis import MemoryRedis
+from jzb.state import StateStore
+
+def make_issue(key, comment_ids=()):
+    return Resource(key=key, fields=Resource(comment=Resource(comments=[Resource(id=x) for x in comment_ids])))
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = MemoryRedis()
+        self.store = StateStore(self.redis)
+
+    def test_prefetches_page_in_two_round_trips(self):
+        self.redis.set('zd_ticket:XXX-1', 7)
+        self.redis.set('last_seen_jira_status:XXX-1', 'New')
+        self.redis.set('last_seen_zd_status:7', 'open')
+        self.redis.sadd('seen_jira_comments', '101')
+        self.redis.reset_counters()
+
+        page = self.store.prefetch([make_issue('XXX-1', ['101', '102']), make_issue('XXX-2')])
+        self.assertEqual(self.redis.round_trips, 2)
+        self.assertEqual(self.store.round_trips, 2)
+
+        view = self.store.view(page)
+        self.assertEqual(view.get('last_seen_jira_status:XXX-1'), b'New')
+        self.assertEqual(view.get('last_seen_zd_status:7'), b'open')
+        self.assertIsNone(view.get('zd_ticket:XXX-2'))
+        self.assertTrue(view.sismember('seen_jira_comments', '101'))
+        self.assertFalse(view.sismember('seen_jira_comments', '102'))
+
+        self.assertEqual(self.redis.round_trips, 2)
+
+    def test_skips_comment_sets_once_watermarked(self):
+        self.redis.set('jira_comment_watermark:XXX-1', '101')
+        self.redis.reset_counters()
+
+        page = self.store.prefetch([make_issue('XXX-1', ['101'])])
+
+        self.assertEqual(page.members, {})
+        self.assertEqual(self.redis.round_trips, 1)
+
+    def test_caches_reads_outside_page(self):
+        self.redis.set('other', 'value')
+        self.redis.reset_counters()
+
+        view = self.store.view()
+        self.assertEqual(view.get('other'), b'value')
+        self.assertEqual(view.get('other'), b'value')
+
+        self.assertEqual(self.redis.round_trips, 1)
+
+class StateViewTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = MemoryRedis()
+        self.store = StateStore(self.redis)
+        self.view = self.store.view(self.store.prefetch([make_issue('XXX-1')]))
+
+    def test_buffers_writes_until_flush(self):
+        self.redis.set('pair_fingerprint:XXX-1', 'abc')
+        self.redis.reset_counters()
+
+        self.assertTrue(self.view.set('last_seen_jira_status:XXX-1', 'New'))
+        self.assertFalse(self.view.set('last_seen_jira_status:XXX-1', 'New'))
+        self.view.delete('pair_fingerprint:XXX-1')
+        self.view.expire('last_seen_jira_status:XXX-1', 60)
+
+        self.assertEqual(self.redis.round_trips, 0)
+        self.assertEqual(self.view.get('last_seen_jira_status:XXX-1'), 'New')
+        self.assertIsNone(self.redis.get('last_seen_jira_status:XXX-1'))
+
+        self.redis.reset_counters()
+        self.view.flush()
+        self.view.flush()
+
+        self.assertEqual(self.redis.round_trips, 1)
+        self.assertEqual(self.redis.get('last_seen_jira_status:XXX-1'), b'New')
+        self.assertIsNone(self.redis.get('pair_fingerprint:XXX-1'))
+        self.assertGreater(self.redis.ttl('last_seen_jira_status:XXX-1'), 0)
+
+    def test_skips_writes_of_current_values(self):
+        self.redis.set('zd_ticket:XXX-1', 7)
+        view = self.store.view(self.store.prefetch([make_issue('XXX-1')]))
+
+        self.assertFalse(view.set('zd_ticket:XXX-1', 7))
+        self.assertEqual(view.writes, [])
+
+    def test_prefetches_members_in_one_round_trip(self):
+        self.redis.sadd('seen_zd_comments', '1')
+        self.redis.reset_counters()
+
+        self.view.prefetch_members('seen_zd_comments', ['1', '2'])
+        self.view.prefetch_members('seen_zd_comments', ['1', '2'])
+
+        self.assertTrue(self.view.sismember('seen_zd_comments', '1'))
+        self.assertFalse(self.view.sismember('seen_zd_comments', '2'))
+        self.assertEqual(self.redis.round_trips, 1)
+
+    def test_fenced_flush(self):
+        leases = LeaseManager(self.redis, node_id='node-a')
+        lease = leases.acquire('XXX-1')
+
+        self.view.set('last_seen_jira_status:XXX-1', 'New')
+        self.view.flush(fence=functools.partial(leases.execute_fenced, lease))
+
+        self.assertEqual(self.redis.get('last_seen_jira_status:XXX-1'), b'New')
+        self.assertEqual(self.view.writes, [])
+
+    def test_fenced_flush_rejected_once_lease_is_lost(self):
+        stale = LeaseManager(self.redis, ttl=0.01, node_id='node-a').acquire('XXX-1')
+        time.sleep(0.02)
+        LeaseManager(self.redis, node_id='node-b').acquire('XXX-1')
+
+        leases = LeaseManager(self.redis, node_id='node-a')
+
+        self.view.set('last_seen_jira_status:XXX-1', 'New')
+        with self.assertRaises(LeaseLost):
+            self.view.flush(fence=functools.partial(leases.execute_fenced, stale))
+
+        self.assertIsNone(self.redis.get('last_seen_jira_status:XXX-1'))
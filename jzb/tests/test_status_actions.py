@@ -0,0 +1,102 @@
+import unittest
+
+from jzb.bridge import Action, ActionDefinition, StatusActionTable
+from jzb.tests import load_config, make_world
+
+def make_def(description, jira_status, zd_status, actions=(), force=False):
+    return ActionDefinition(jira_status=frozenset(jira_status), zd_status=frozenset(zd_status),
+                            actions=[Action(None, dict(params), description, False, action_type)
+                                     for action_type, params in actions],
+                            description=description, force=force)
+
+class StatusActionTableTest(unittest.TestCase):
+    def test_first_match_wins(self):
+        table = StatusActionTable([
+            make_def('forced', ['Resolved'], ['open'], force=True),
+            make_def('owned', ['Resolved', 'New'], ['open']),
+        ])
+
+        self.assertEqual(table.match('Resolved', 'open', True).description, 'forced')
+        self.assertEqual(table.match('New', 'open', True).description, 'owned')
+        self.assertIsNone(table.match('New', 'open', False))
+        self.assertIsNone(table.match('New', 'solved', True))
+
+    def test_accepts_terminating_definitions(self):
+        StatusActionTable([
+            make_def('solve', ['Resolved'], ['open', 'pending'], [('update_ticket', dict(status='solved'))]),
+            make_def('transition', ['New'], ['solved'], [('transition_issue', dict(name='Resolve'))]),
+        ]).check()
+
+    def test_rejects_loops(self):
+        loop = StatusActionTable([
+            make_def('hold', ['New'], ['open'], [('update_ticket', dict(status='hold'))]),
+            make_def('open', ['New'], ['hold'], [('update_ticket', dict(status='open'))]),
+        ])
+
+        self.assertRaises(ValueError, loop.check)
+
+        self_loop = StatusActionTable([
+            make_def('tag', ['New'], ['open'], [('add_ticket_tags', dict(tags=['x']))]),
+        ])
+
+        self.assertRaises(ValueError, self_loop.check)
+
+class SyncStatusTest(unittest.TestCase):
+    def build_world(self, jira_status_actions=()):
+        world = make_world(pair_fingerprints=True,
+                           jira_status_actions=load_config()['jira_status_actions'] + list(jira_status_actions))
+        world.bridge.sync()
+        return world
+
+    def test_failed_action_is_retried(self):
+        world = self.build_world()
+
+        ticket_id = list(world.zendesk.tickets)[0]
+        world.zendesk.set_status(ticket_id, 'open')
+
+        transition_issue = world.jira.transition_issue
+
+        def unavailable(*args, **kwargs):
+            world.jira.transition_issue = transition_issue
+            raise IOError('503 Service Unavailable')
+
+        world.jira.transition_issue = unavailable
+
+        stats = world.bridge.sync()
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(world.jira.issues['XXX-1'].fields.status.name, 'New')
+
+        stats = world.bridge.sync()
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(world.jira.issues['XXX-1'].fields.status.name, 'Support Investigating')
+
+    def test_rejects_missing_iterations(self):
+        self.assertRaises(ValueError, make_world, max_action_iterations=0)
+
+    def test_rejected_status_is_not_acted_on(self):
+        world = self.build_world([dict(
+            description='Solve new tickets', jira_status=['New'], zd_status=['open'], force=True,
+            actions=[dict(description='Solve ticket', type='update_ticket', status='solved')])])
+
+        ticket_id = list(world.zendesk.tickets)[0]
+        world.zendesk.set_status(ticket_id, 'open')
+
+        update_ticket = world.zendesk.update_ticket
+
+        def reject_solved(ticket_id, **fields):
+            if fields.get('status') == 'solved':
+                raise ValueError('422 Unprocessable Entity')
+            return update_ticket(ticket_id, **fields)
+
+        world.zendesk.update_ticket = reject_solved
+        fingerprint = world.bridge.state.view().get('pair_fingerprint:XXX-1')
+
+        stats = world.bridge.sync()
+
+        # Zendesk status actions only see the ticket as open, as Zendesk holds it
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(world.zendesk.tickets[ticket_id]['status'], 'open')
+        self.assertEqual(world.jira.issues['XXX-1'].fields.status.name, 'Support Investigating')
+
+        # No fingerprint is recorded for the pass, so the pair is synced again on the next one
+        self.assertEqual(world.bridge.state.view().get('pair_fingerprint:XXX-1'), fingerprint)
@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from jzb.templates import TEMPLATE_KEYS, build_environment, sample_context
+from jzb.util import objectize
+
+def make_config(**kwargs):
+    config = dict((key, '{{ issue.key }} {{ comment.body | strip_signature(signature_delimiter) }}')
+                  for key in TEMPLATE_KEYS)
+    config.update(jira_url='https://jira.example.com', zd_signature_delimeter='---')
+    config.update(kwargs)
+    return objectize(config)
+
+class TemplatesTest(unittest.TestCase):
+    def test_renders_with_shared_filters(self):
+        env = build_environment(make_config(jira_comment_format='{{ jira_url }} {{ created | jira_time }}'))
+
+        self.assertEqual(env.get_template('jira_comment_format').render(created='2015-06-01T12:34:56.000-0130'),
+                         'https://jira.example.com 2015-06-01 14:04 UTC')
+        self.assertEqual(env.get_template('zd_comment_format').render(issue=dict(key='XXX-1'),
+                                                                      comment=dict(body='Hi\n---\nSig')),
+                         'XXX-1 Hi\n')
+
+    def test_caches_bytecode_in_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        config = make_config(template_bytecode_cache=os.path.join(directory, 'templates'))
+        rendered = build_environment(config).get_template('zd_subject_format').render(**sample_context())
+
+        self.assertEqual(len(os.listdir(config.template_bytecode_cache)), 1)
+        self.assertEqual(build_environment(config).get_template('zd_subject_format').render(**sample_context()),
+                         rendered)
@@ -0,0 +1,73 @@
+import unittest
+
+from jzb.transitions import TransitionCache
+from jzb.util import objectize
+
+class MemoryRedis(object):
+    """
+    Implements just enough of `redis.StrictRedis` for the transition cache
+    """
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode('utf-8')
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+def make_issue(status):
+    return objectize(dict(key='XXX-1', fields=objectize(dict(
+        project=objectize(dict(key='XXX')),
+        issuetype=objectize(dict(name='Bug')),
+        status=objectize(dict(name=status)),
+    ))))
+
+class TransitionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.fetches = []
+
+    def fetch(self, issue):
+        self.fetches.append(issue.fields.status.name)
+        return [dict(id='11', name='Resolve', to=dict(name='Resolved'))]
+
+    def test_caches_per_status(self):
+        cache = TransitionCache()
+
+        self.assertEqual(cache.find(make_issue('Open'), 'Resolve', self.fetch),
+                         (dict(id='11', to='Resolved'), False))
+        self.assertEqual(cache.find(make_issue('Open'), 'Resolve', self.fetch),
+                         (dict(id='11', to='Resolved'), True))
+        cache.find(make_issue('Reopened'), 'Resolve', self.fetch)
+
+        self.assertEqual(self.fetches, ['Open', 'Reopened'])
+
+    def test_unknown_name_refetches(self):
+        cache = TransitionCache()
+        cache.find(make_issue('Open'), 'Resolve', self.fetch)
+
+        self.assertEqual(cache.find(make_issue('Open'), 'Close', self.fetch), (None, False))
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_invalidate_and_expiry(self):
+        cache = TransitionCache()
+        cache.find(make_issue('Open'), 'Resolve', self.fetch)
+        cache.invalidate(make_issue('Open'))
+        cache.find(make_issue('Open'), 'Resolve', self.fetch)
+
+        expired = TransitionCache(ttl=-1)
+        expired.find(make_issue('Open'), 'Resolve', self.fetch)
+        expired.find(make_issue('Open'), 'Resolve', self.fetch)
+
+        self.assertEqual(len(self.fetches), 4)
+
+    def test_shared_through_redis(self):
+        redis = MemoryRedis()
+        TransitionCache(redis).find(make_issue('Open'), 'Resolve', self.fetch)
+
+        self.assertEqual(TransitionCache(redis).find(make_issue('Open'), 'Resolve', self.fetch),
+                         (dict(id='11', to='Resolved'), True))
+        self.assertEqual(len(self.fetches), 1)
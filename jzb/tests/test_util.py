@@ -0,0 +1,18 @@
+import unittest
+
+from jzb.util import chunked, parse_jira_time, split_order_by
+
+class UtilTest(unittest.TestCase):
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunked([], 2)), [])
+
+    def test_parse_jira_time(self):
+        self.assertEqual(parse_jira_time('2015-06-01T12:00:00.000+0000'), 1433160000)
+        self.assertEqual(parse_jira_time('2015-06-01T14:30:00.000+0230'), 1433160000)
+        self.assertEqual(parse_jira_time('2015-06-01T07:00:00.000-0500'), 1433160000)
+
+    def test_split_order_by(self):
+        self.assertEqual(split_order_by('project = XXX'), ('project = XXX', ''))
+        self.assertEqual(split_order_by('project = XXX order by created DESC'),
+                         ('project = XXX', ' order by created DESC'))
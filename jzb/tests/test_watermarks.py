@@ -0,0 +1,56 @@
+import unittest
+
+from jzb.tests import make_world
+
+class MigrateCommentWatermarksTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=2, comments=1)
+        self.world.bridge.sync()
+
+    def test_migrates_pairs_outside_query(self):
+        redis = self.world.redis
+
+        for key, issue in self.world.jira.issues.items():
+            redis.delete('jira_comment_watermark:{}'.format(key))
+            redis.sadd('seen_jira_comments', *[x.id for x in issue.fields.comment.comments])
+        for ticket_id, ticket in self.world.zendesk.tickets.items():
+            redis.delete('zd_comment_watermark:{}'.format(ticket_id))
+            redis.sadd('seen_zd_comments', *[x.id for x in ticket['comments']])
+
+        # Neither issue matches the configured query any longer, as once they are resolved
+        self.world.bridge.search_issues = lambda since=None: iter([])
+
+        self.assertEqual(self.world.bridge.migrate_comment_watermarks(), 2)
+
+        for key, issue in self.world.jira.issues.items():
+            self.assertEqual(redis.get('jira_comment_watermark:{}'.format(key)),
+                             issue.fields.comment.comments[-1].id.encode('utf-8'))
+        for ticket_id in self.world.zendesk.tickets:
+            self.assertIsNotNone(redis.get('zd_comment_watermark:{}'.format(ticket_id)))
+        self.assertEqual(redis.exists('seen_jira_comments'), 0)
+
+class CommentWatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world()
+        self.world.bridge.sync()
+
+    def test_kept_when_ticket_commit_fails(self):
+        ticket_id = list(self.world.zendesk.tickets)[0]
+        self.world.zendesk.add_agent_comment(ticket_id)
+        self.world.jira.add_reporter_comment('XXX-1')
+
+        zendesk = self.world.zendesk
+        update_ticket, ticket = zendesk.update_ticket, zendesk.ticket
+
+        def unavailable(*args, **kwargs):
+            raise IOError('503 Service Unavailable')
+
+        # Zendesk goes down once the agent comment has been copied to JIRA
+        zendesk.update_ticket = zendesk.ticket = unavailable
+        self.assertEqual(self.world.bridge.sync().failed, 1)
+
+        zendesk.update_ticket, zendesk.ticket = update_ticket, ticket
+        self.assertEqual(self.world.bridge.sync().failed, 0)
+
+        bodies = [x.body for x in self.world.jira.issues['XXX-1'].fields.comment.comments]
+        self.assertEqual(len([x for x in bodies if 'Comment from an agent' in x]), 1)
@@ -0,0 +1,180 @@
+import json
+import os
+import time
+import unittest
+
+from six.moves.urllib.request import Request, urlopen
+
+from jzb.memredis import MemoryRedis
+from jzb.tests import make_world
+from jzb.webhook import QueueWorker, SyncQueue, WebhookServer, parse_jira_event, parse_zendesk_event
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(__file__), 'payloads')
+
+def load_payload(name):
+    with open(os.path.join(PAYLOAD_DIR, name)) as fp:
+        return json.load(fp)
+
+class WebhookTest(unittest.TestCase):
+    def setUp(self):
+        self.redis = MemoryRedis()
+        self.redis.set('zd_ticket_issue:1235', 'XXX-43')
+
+        self.queue = SyncQueue(self.redis)
+
+    def test_parse_jira_events(self):
+        self.assertEqual(parse_jira_event(load_payload('jira_issue_updated.json')), ['XXX-42'])
+        self.assertEqual(parse_jira_event(load_payload('jira_comment_created.json')), ['XXX-42'])
+        self.assertEqual(parse_jira_event(dict(webhookEvent='jira:worklog_updated')), [])
+
+    def test_parse_zendesk_events(self):
+        self.assertEqual(parse_zendesk_event(self.redis, load_payload('zendesk_trigger.json')), ['XXX-42'])
+        self.assertEqual(parse_zendesk_event(self.redis, load_payload('zendesk_event.json')), ['XXX-43'])
+        self.assertEqual(parse_zendesk_event(self.redis, dict(ticket_id='999')), [])
+
+    def test_queue_deduplicates(self):
+        self.assertEqual(self.queue.push(['XXX-1', 'XXX-2']), 2)
+        self.assertEqual(self.queue.push(['XXX-1']), 0)
+        self.assertEqual(sorted(self.queue.pop(10)), ['XXX-1', 'XXX-2'])
+        self.assertEqual(self.queue.pop(10), [])
+
+    def test_server_queues_recorded_payloads(self):
+        server = WebhookServer(self.queue, self.redis, host='127.0.0.1', port=0, secret='s3cret')
+        server.start()
+
+        try:
+            base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+            for path, name in [('/jira', 'jira_issue_updated.json'),
+                               ('/jira', 'jira_comment_created.json'),
+                               ('/zendesk', 'zendesk_event.json')]:
+                with open(os.path.join(PAYLOAD_DIR, name), 'rb') as fp:
+                    request = Request(base_url + path + '?token=s3cret', data=fp.read(),
+                                      headers={'Content-Type': 'application/json'})
+
+                self.assertEqual(urlopen(request).getcode(), 202)
+        finally:
+            server.stop()
+
+        self.assertEqual(sorted(self.queue.pop(10)), ['XXX-42', 'XXX-43'])
+
+    def test_server_rejects_invalid_token(self):
+        server = WebhookServer(self.queue, self.redis, host='127.0.0.1', port=0, secret='s3cret')
+        server.start()
+
+        try:
+            for query in ('?token=wrong', ''):
+                request = Request('http://127.0.0.1:{}/jira{}'.format(server.server_address[1], query),
+                                  data=b'{}')
+
+                with self.assertRaises(Exception) as raised:
+                    urlopen(request)
+
+                self.assertEqual(raised.exception.code, 403)
+        finally:
+            server.stop()
+
+class QueueWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world(issues=2)
+
+        self.queue = SyncQueue(self.world.redis)
+        self.worker = QueueWorker(self.world.bridge, self.queue, poll_interval=0.01, retry_delay=0.01)
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def wait_for_tickets(self, count):
+        deadline = time.time() + 5
+        while len(self.world.zendesk.tickets) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_waits_for_issue_held_by_pass(self):
+        # A pass syncing the same issue holds its lock, the worker must not sync the issue alongside it
+        with self.world.bridge.issue_locks.hold('XXX-1'):
+            self.queue.push(['XXX-1'])
+            self.worker.start()
+
+            time.sleep(0.2)
+            self.assertEqual(len(self.world.zendesk.tickets), 0)
+
+        self.wait_for_tickets(1)
+        self.assertEqual([x['external_id'] for x in self.world.zendesk.tickets.values()], ['XXX-1'])
+
+    def test_rereads_pair_synced_while_waiting(self):
+        bridge = self.world.bridge
+        bridge.sync()
+        self.world.jira.add_reporter_comment('XXX-1')
+
+        generation = bridge.issue_locks.generation('XXX-1')
+
+        with bridge.issue_locks.hold('XXX-1'):
+            # The worker prefetches the pair, then waits while a pass copies the new comment
+            self.queue.push(['XXX-1'])
+            self.worker.start()
+            time.sleep(0.2)
+
+            ctx = next(bridge.prepare_contexts(bridge.search_issues_by_key(['XXX-1'])))
+            bridge.sync_issue(ctx)
+
+        deadline = time.time() + 5
+        while bridge.issue_locks.generation('XXX-1') < generation + 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        ticket = [x for x in self.world.zendesk.tickets.values() if x['external_id'] == 'XXX-1'][0]
+        self.assertEqual(len(ticket['comments']), 2)
+
+    def test_requeues_failed_issues(self):
+        sync_keys = self.world.bridge.sync_keys
+
+        def unavailable(keys):
+            self.world.bridge.sync_keys = sync_keys
+            raise IOError('503 Service Unavailable')
+
+        self.world.bridge.sync_keys = unavailable
+
+        self.queue.push(['XXX-1', 'XXX-2'])
+        self.worker.start()
+
+        self.wait_for_tickets(2)
+        self.assertEqual(sorted(x['external_id'] for x in self.world.zendesk.tickets.values()), ['XXX-1', 'XXX-2'])
+
+    def test_backs_off_between_retries(self):
+        worker = QueueWorker(self.world.bridge, self.queue, retry_delay=10, max_attempts=3)
+
+        started = time.time()
+        worker.schedule_retry('XXX-1')
+        self.assertAlmostEqual(worker.retries['XXX-1'] - started, 10, delta=1)
+
+        worker.schedule_retry('XXX-1')
+        self.assertAlmostEqual(worker.retries['XXX-1'] - started, 20, delta=1)
+
+        # Not queued again until the delay has passed
+        worker.requeue_due()
+        self.assertEqual(self.queue.pop(10), [])
+
+        worker.schedule_retry('XXX-1')
+        self.assertEqual(worker.retries, {})
+        self.assertEqual(worker.attempts, {})
+
+    def test_drops_issues_after_max_attempts(self):
+        calls = []
+
+        def unavailable(keys):
+            calls.append(keys)
+            raise IOError('503 Service Unavailable')
+
+        self.world.bridge.sync_keys = unavailable
+        self.worker.max_attempts = 3
+
+        self.queue.push(['XXX-1'])
+        self.worker.start()
+
+        deadline = time.time() + 5
+        while len(calls) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2)
+
+        self.assertEqual(calls, [['XXX-1']] * 3)
+        self.assertEqual(self.worker.retries, {})
+        self.assertEqual(self.queue.pop(10), [])
@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+
+import six
+
+from jzb import LOG
+
+KEY_FORMAT = 'jira_transitions:{}:{}:{}'
+
+class TransitionCache(object):
+    """
+    Caches the JIRA transitions available from a status, keyed by project, issue type and status
+
+    Entries are kept in memory and, when a Redis client is given, shared through Redis so they
+    survive restarts and are reused by other bridge processes.
+    """
+    def __init__(self, redis=None, ttl=3600):
+        """
+        :param redis: optional `redis.StrictRedis` object used as a shared backing store
+        :param ttl: seconds an entry is kept before the transitions are fetched again
+        """
+        self.redis = redis
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def find(self, issue, name, fetch):
+        """
+        :param issue: `jira.Issue` object
+        :param name: name of the transition
+        :param fetch: callable returning the transitions available on the issue from JIRA
+        :return: tuple of transition dict with `id` and `to` keys or None, and whether the
+                 transition came from the cache
+        """
+        key = cache_key(issue)
+
+        if key:
+            transitions = self.get(key)
+            if transitions is not None and name in transitions:
+                return transitions[name], True
+
+        transitions = dict((x['name'], dict(id=x['id'], to=transition_target(x))) for x in fetch(issue))
+
+        if key:
+            self.set(key, transitions)
+
+        return transitions.get(name), False
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry and entry[0] > time.time():
+            return entry[1]
+
+        if self.redis is None:
+            return None
+
+        value = self.redis.get(key)
+        if not value:
+            return None
+
+        transitions = json.loads(value.decode('utf-8') if isinstance(value, six.binary_type) else value)
+
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, transitions)
+
+        return transitions
+
+    def set(self, key, transitions):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, transitions)
+
+        if self.redis is not None:
+            self.redis.set(key, json.dumps(transitions), ex=self.ttl)
+
+    def invalidate(self, issue):
+        """
+        Forgets the transitions cached for the current status of an issue
+
+        :param issue: `jira.Issue` object
+        """
+        key = cache_key(issue)
+        if not key:
+            return
+
+        LOG.debug('Invalidating cached transitions: %s', key)
+
+        with self.lock:
+            self.entries.pop(key, None)
+
+        if self.redis is not None:
+            self.redis.delete(key)
+
+def cache_key(issue):
+    """
+    :param issue: `jira.Issue` object
+    :return: cache key for the transitions available on the issue, or None if it cannot be cached
+    """
+    fields = issue.fields
+
+    try:
+        return KEY_FORMAT.format(fields.project.key, fields.issuetype.name, fields.status.name)
+    except AttributeError:
+        return None
+
+def transition_target(transition):
+    """
+    :param transition: transition dict returned by the JIRA API
+    :return: name of the status the transition leads to, or None if not reported
+    """
+    to = transition.get('to')
+    if isinstance(to, dict):
+        return to.get('name')
+    return None
@@ -1,7 +1,12 @@
+import calendar
+import datetime
 import importlib
+import re
 
 import six
 
+ORDER_BY_PATTERN = re.compile(r'\s+order\s+by\s+.*$', re.IGNORECASE | re.DOTALL)
+
 class PropertyHolder(object):
     pass
 
@@ -13,6 +18,55 @@ def objectize(dct):
 
     return ph
 
+def chunked(iterable, size):
+    """
+    Splits an iterable into lists of at most the given size
+
+    :param iterable: any iterable
+    :param size: maximum length of each list
+    :return: generator of lists
+    """
+    chunk = []
+
+    for item in iterable:
+        chunk.append(item)
+
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def parse_jira_time(value):
+    """
+    Parses a JIRA timestamp such as `2015-06-01T12:34:56.000+0000`
+
+    :param value: timestamp string
+    :return: seconds since the epoch
+    """
+    parsed = datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+    offset = value[-5:]
+    offset_seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    if offset[0] == '-':
+        offset_seconds = -offset_seconds
+
+    return calendar.timegm(parsed.timetuple()) - offset_seconds
+
+def split_order_by(jql):
+    """
+    Splits the ORDER BY clause from a JQL query, so further conditions can be added to it
+
+    :param jql: JQL query
+    :return: tuple of the query without ordering, and the ORDER BY clause or an empty string
+    """
+    match = ORDER_BY_PATTERN.search(jql)
+    if not match:
+        return jql, ''
+
+    return jql[:match.start()], match.group(0)
+
 def import_class(name):
     (module_name, class_name) = name.rsplit('.', 1)
 
@@ -0,0 +1,314 @@
+import hmac
+import json
+import signal
+import threading
+import time
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from jzb import LOG
+from jzb.feed import map_ticket_issue_keys
+
+QUEUE_KEY = 'sync_queue'
+
+# JIRA webhook events that can require a sync
+JIRA_EVENTS = (
+    'jira:issue_created',
+    'jira:issue_updated',
+    'comment_created',
+    'comment_updated',
+)
+
+class SyncQueue(object):
+    """
+    Deduplicating queue of JIRA issue keys waiting to be synced, stored as a Redis set
+    """
+    def __init__(self, redis, name=QUEUE_KEY):
+        """
+        :param redis: `redis.StrictRedis` object
+        :param name: Redis key of the set
+        """
+        self.redis = redis
+        self.name = name
+
+    def push(self, keys):
+        """
+        :param keys: iterable of JIRA issue keys
+        :return: number of keys that were not already queued
+        """
+        keys = list(keys)
+        if not keys:
+            return 0
+        return self.redis.sadd(self.name, *keys)
+
+    def pop(self, count):
+        """
+        :param count: maximum number of keys to pop
+        :return: list of JIRA issue keys
+        """
+        keys = self.redis.spop(self.name, count) or []
+        return [x.decode('utf-8') if isinstance(x, six.binary_type) else x for x in keys]
+
+def parse_jira_event(payload):
+    """
+    :param payload: decoded JIRA webhook payload
+    :return: list of affected JIRA issue keys
+    """
+    if payload.get('webhookEvent') not in JIRA_EVENTS:
+        return []
+
+    issue = payload.get('issue') or {}
+    if issue.get('key'):
+        return [issue['key']]
+
+    return []
+
+def parse_zendesk_event(redis, payload):
+    """
+    Accepts both trigger payloads of the form `{"ticket_id": ..., "external_id": ...}` and
+    event webhook payloads carrying the ticket in `detail`
+
+    :param redis: `redis.StrictRedis` object used to resolve ticket mappings
+    :param payload: decoded Zendesk payload
+    :return: list of affected JIRA issue keys
+    """
+    ticket = payload.get('detail') or payload
+
+    ticket_id = ticket.get('ticket_id') or ticket.get('id')
+    if not ticket_id:
+        return []
+
+    keys = map_ticket_issue_keys(redis, [dict(id=ticket_id, external_id=ticket.get('external_id'))])
+    return list(keys)
+
+def encode_token(value):
+    """
+    :param value: token or secret, either text, bytes or a number read from the config
+    :return: value as UTF-8 bytes
+    """
+    if isinstance(value, six.binary_type):
+        return value
+    return six.text_type(value).encode('utf-8')
+
+class WebhookServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Embedded HTTP listener that queues issues affected by JIRA and Zendesk webhooks
+
+    JIRA webhooks are accepted on `/jira` and Zendesk payloads on `/zendesk`. When a secret is
+    configured, it must be given as the `token` query parameter or the `X-JZB-Token` header.
+    """
+    daemon_threads = True
+
+    def __init__(self, queue, redis, host='0.0.0.0', port=8080, secret=None):
+        """
+        :param queue: `SyncQueue` object
+        :param redis: `redis.StrictRedis` object
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port
+        :param secret: optional shared secret required on every request
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), WebhookHandler)
+
+        self.queue = queue
+        self.redis = redis
+        self.secret = secret
+        self.thread = None
+
+    def start(self):
+        """
+        Serves requests from a background thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever, name='jzb-webhooks')
+        self.thread.daemon = True
+        self.thread.start()
+
+        LOG.info('Listening for webhooks on port %d', self.server_address[1])
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_payload(self, source, payload):
+        """
+        :param source: either `jira` or `zendesk`
+        :param payload: decoded payload
+        :return: list of JIRA issue keys that were queued
+        """
+        if source == 'jira':
+            keys = parse_jira_event(payload)
+        else:
+            keys = parse_zendesk_event(self.redis, payload)
+
+        if keys:
+            LOG.debug('Queueing issues from %s webhook: %s', source, ', '.join(keys))
+            self.queue.push(keys)
+
+        return keys
+
+class WebhookHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_POST(self):
+        url = urlparse(self.path)
+
+        source = url.path.strip('/')
+        if source not in ('jira', 'zendesk'):
+            return self.respond(404, dict(error='unknown webhook'))
+
+        if self.server.secret:
+            token = self.headers.get('X-JZB-Token') or parse_qs(url.query).get('token', [''])[0]
+            # Compared in constant time so the secret cannot be guessed from response times
+            if not hmac.compare_digest(encode_token(token), encode_token(self.server.secret)):
+                return self.respond(403, dict(error='invalid token'))
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            return self.respond(400, dict(error='invalid JSON'))
+
+        try:
+            keys = self.server.handle_payload(source, payload)
+        except Exception:
+            LOG.exception('Failed to handle %s webhook', source)
+            return self.respond(500, dict(error='internal error'))
+
+        self.respond(202, dict(queued=keys))
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        LOG.debug('Webhook request: ' + format, *args)
+
+class QueueWorker(object):
+    """
+    Syncs issues popped from a `SyncQueue`, leaving full passes as a safety net
+
+    Issues that fail to sync are queued again after an exponential backoff, and dropped once they
+    have failed `max_attempts` times in a row.
+    """
+    def __init__(self, bridge, queue, batch_size=50, poll_interval=1.0, retry_delay=5.0, max_attempts=5):
+        """
+        :param bridge: `Bridge` object
+        :param queue: `SyncQueue` object
+        :param batch_size: maximum number of issues synced per batch
+        :param poll_interval: seconds to wait when the queue is empty
+        :param retry_delay: seconds to wait before the first retry of an issue, doubled on each retry
+        :param max_attempts: number of failed attempts after which an issue is dropped
+        """
+        self.bridge = bridge
+        self.queue = queue
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.stopping = threading.Event()
+        self.thread = None
+
+        # Failed attempts and the time each issue is due to be queued again, by issue key
+        self.attempts = {}
+        self.retries = {}
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.requeue_due()
+
+            try:
+                keys = self.queue.pop(self.batch_size)
+            except Exception:
+                LOG.exception('Failed to pop from sync queue')
+                keys = []
+
+            if not keys:
+                self.stopping.wait(self.poll_interval)
+                continue
+
+            LOG.debug('Syncing %d queued issues', len(keys))
+
+            try:
+                failed_keys = self.bridge.sync_keys(keys).failed_keys
+            except Exception:
+                LOG.exception('Failed to sync queued issues')
+                failed_keys = keys
+
+            failed_keys = set(failed_keys)
+            for key in keys:
+                if key in failed_keys:
+                    self.schedule_retry(key)
+                else:
+                    self.attempts.pop(key, None)
+
+    def schedule_retry(self, key):
+        """
+        Schedules an issue that failed to sync to be queued again, or drops it after too many attempts
+
+        :param key: JIRA issue key
+        """
+        attempts = self.attempts.get(key, 0) + 1
+
+        if attempts >= self.max_attempts:
+            LOG.error('Dropping %s from the sync queue after %d failed attempts, leaving it to the next '
+                      'full pass', key, attempts)
+            self.attempts.pop(key, None)
+            self.retries.pop(key, None)
+            return
+
+        delay = self.retry_delay * 2 ** (attempts - 1)
+        LOG.warning('Retrying %s in %.1f seconds after %d failed attempts', key, delay, attempts)
+
+        self.attempts[key] = attempts
+        self.retries[key] = time.time() + delay
+
+    def requeue_due(self):
+        """
+        Puts issues whose retry delay has passed back on the queue
+        """
+        now = time.time()
+        keys = [key for key, due in self.retries.items() if due <= now]
+        if not keys:
+            return
+
+        try:
+            self.queue.push(keys)
+        except Exception:
+            LOG.exception('Failed to requeue issues, retrying later')
+            return
+
+        for key in keys:
+            del self.retries[key]
+
+    def run_forever(self):
+        """
+        Runs in the calling thread until SIGTERM or SIGINT
+        """
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+
+        self.run()
+
+    def start(self):
+        """
+        Runs in a background thread
+        """
+        self.thread = threading.Thread(target=self.run, name='jzb-queue-worker')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.bridge.stop_requested.set()
+
+        if self.thread:
+            self.thread.join()
+
+    def handle_signal(self, signum, frame):
+        LOG.info('Received signal %d, shutting down gracefully', signum)
+        self.stopping.set()
+        self.bridge.stop_requested.set()
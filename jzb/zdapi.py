@@ -0,0 +1,195 @@
+import requests
+import six
+
+from jzb.util import chunked
+
+# Maximum number of tickets Zendesk returns from a single show_many request
+SHOW_MANY_LIMIT = 100
+
+class ZendeskApi(object):
+    """
+    Minimal Zendesk REST client for the bulk and incremental endpoints not covered by `zendesk.Client`
+    """
+    def __init__(self, url, username, password, session=None):
+        """
+        :param url: base URL of the Zendesk instance
+        :param username: Zendesk username
+        :param password: Zendesk password
+        :param session: optional `requests.Session` object
+        """
+        self.base_url = url.rstrip('/') + '/api/v2'
+        self.session = session or requests.Session()
+        self.session.auth = (username, password)
+        self.users = {}
+
+    def request(self, method, path, **kwargs):
+        """
+        :param method: HTTP method
+        :param path: path relative to the API root, or an absolute URL such as a `next_page` link
+        :return: decoded JSON response, or None if the response has no body
+        """
+        if path.startswith('http'):
+            url = path
+        else:
+            url = self.base_url + path
+
+        response = self.session.request(method, url, **kwargs)
+        response.raise_for_status()
+
+        if response.content:
+            return response.json()
+
+    def show_many_tickets(self, ids):
+        """
+        Fetches tickets in batches using the show_many endpoint
+
+        Tickets that no longer exist are omitted from the result.
+
+        :param ids: iterable of ticket ids
+        :return: dict of ticket id to `TicketView` objects
+        """
+        results = {}
+
+        for chunk in chunked(ids, SHOW_MANY_LIMIT):
+            data = self.request('GET', '/tickets/show_many.json',
+                                params=dict(ids=','.join(str(x) for x in chunk)))
+
+            for ticket in data['tickets']:
+                results[ticket['id']] = TicketView(self, ticket)
+
+        return results
+
+    def incremental_tickets(self, start_time=None, cursor=None):
+        """
+        Fetches a page of the cursor based incremental ticket export
+
+        :param start_time: seconds since the epoch to start the export from, used without a cursor
+        :param cursor: `after_cursor` returned by the previous page
+        :return: decoded JSON response, with `tickets`, `after_cursor` and `end_of_stream` keys
+        """
+        if cursor:
+            params = dict(cursor=cursor)
+        else:
+            params = dict(start_time=int(start_time))
+
+        return self.request('GET', '/incremental/tickets/cursor.json', params=params)
+
+    def ticket_comments(self, ticket_id, after_id=None):
+        """
+        :param ticket_id: id of the ticket
+        :param after_id: optional comment id, when given only newer comments are fetched by paging
+                         newest first
+        :return: list of `CommentView` objects, oldest first
+        """
+        if after_id is None:
+            results = []
+
+            path = '/tickets/{}/comments.json'.format(ticket_id)
+            while path:
+                data = self.request('GET', path)
+                results.extend(CommentView(self, comment) for comment in data['comments'])
+                path = data.get('next_page')
+
+            return results
+
+        results = []
+
+        path = '/tickets/{}/comments.json'.format(ticket_id)
+        params = dict(sort_order='desc')
+        while path:
+            data = self.request('GET', path, params=params)
+
+            # Links to further pages already carry the parameters
+            params = None
+
+            for comment in data['comments']:
+                if comment['id'] <= after_id:
+                    path = None
+                    break
+                results.append(CommentView(self, comment))
+            else:
+                path = data.get('next_page')
+
+        results.reverse()
+        return results
+
+    def update_ticket(self, ticket_id, **fields):
+        """
+        :param ticket_id: id of the ticket
+        :return: updated `TicketView` object
+        """
+        data = self.request('PUT', '/tickets/{}.json'.format(ticket_id),
+                            json=dict(ticket=fields))
+        return TicketView(self, data['ticket'])
+
+    def add_tags(self, ticket_id, tags):
+        self.request('PUT', '/tickets/{}/tags.json'.format(ticket_id), json=dict(tags=tags))
+
+    def remove_tags(self, ticket_id, tags):
+        self.request('DELETE', '/tickets/{}/tags.json'.format(ticket_id), json=dict(tags=tags))
+
+    def user(self, user_id):
+        """
+        :param user_id: id of the user
+        :return: `Resource` object, cached for the lifetime of the client
+        """
+        if user_id not in self.users:
+            data = self.request('GET', '/users/{}.json'.format(user_id))
+            self.users[user_id] = Resource(data['user'])
+
+        return self.users[user_id]
+
+class Resource(object):
+    """
+    Exposes the keys of a decoded JSON object as attributes
+    """
+    def __init__(self, data):
+        for key, value in six.iteritems(data):
+            setattr(self, key, value)
+
+class TicketView(Resource):
+    """
+    Ticket fetched in bulk, compatible with the parts of `zendesk.resources.Ticket` the bridge uses
+    """
+    def __init__(self, api, data):
+        """
+        :param api: `ZendeskApi` object
+        :param data: decoded ticket JSON
+        """
+        super(TicketView, self).__init__(data)
+        self.api = api
+        self._comments = None
+
+    @property
+    def comments(self):
+        if self._comments is None:
+            self._comments = self.api.ticket_comments(self.id)
+        return self._comments
+
+    def update(self, **fields):
+        return self.api.update_ticket(self.id, **fields)
+
+    def add_tags(self, *tags):
+        self.api.add_tags(self.id, list(tags))
+
+    def remove_tags(self, *tags):
+        self.api.remove_tags(self.id, list(tags))
+
+class CommentView(Resource):
+    """
+    Ticket comment, compatible with the parts of `zendesk.resources.Comment` the bridge uses
+    """
+    def __init__(self, api, data):
+        """
+        :param api: `ZendeskApi` object
+        :param data: decoded comment JSON
+        """
+        attachments = [Resource(x) for x in data.get('attachments', [])]
+
+        super(CommentView, self).__init__(data)
+        self.api = api
+        self.attachments = attachments
+
+    @property
+    def author(self):
+        return self.api.user(self.author_id)